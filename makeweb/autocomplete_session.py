@@ -0,0 +1,128 @@
+"""
+WebSocket 자동완성 세션
+
+입력창마다 WebSocket 하나를 열어 두고, 클라이언트는 입력할 때마다 전체 텍스트 대신 바뀐 부분(편집)만 보냅니다.
+서버는 연결별로 문서 상태를 유지하다가 입력이 debounce 동안 멈추면 추천을 만들어 보내 줍니다.
+
+클라이언트 -> 서버
+    {"type": "reset", "text": "...", "version": n}                       전체 텍스트로 문서를 맞춤
+    {"type": "edit", "offset": i, "delete": k, "insert": "...", "version": n}
+                                                                        i번째 글자부터 k글자를 지우고 insert를 넣음
+    (두 메시지 모두 "suggest": false면 추천을 만들지 않음, Tab으로 추천을 받아들였을 때 등)
+서버 -> 클라이언트
+    {"type": "suggestion", "version": n, "suggestion": "..."}          version까지 반영한 텍스트에 대한 추천
+    {"type": "resync", "version": n, "error": "..."}                   편집을 적용할 수 없음 (reset을 다시 보내야 함)
+    {"type": "error", "error": "..."}
+
+version은 편집마다 1씩 늘어나는 번호이고, offset/delete는 코드 포인트(파이썬 문자열 인덱스) 단위입니다.
+"""
+
+import asyncio
+import json
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from scheduler import RequestCancelled
+
+
+# 연결 하나가 보관할 수 있는 최대 글자 수
+MAX_DOCUMENT_CHARS = 20000
+
+
+class EditError(ValueError):
+    """편집을 지금 문서에 적용할 수 없음 (버전이 어긋났거나 범위를 벗어남)"""
+
+
+class TextDocument:
+    """편집을 차례로 적용해 클라이언트의 입력창과 같은 텍스트를 유지"""
+
+    def __init__(self, max_chars: int = MAX_DOCUMENT_CHARS):
+        self.max_chars = max_chars
+        self.text = ""
+        self.version = 0
+
+    def reset(self, text: str, version: int):
+        if not isinstance(text, str) or not isinstance(version, int):
+            raise ValueError("text는 문자열, version은 정수여야 합니다")
+        if len(text) > self.max_chars:
+            raise ValueError(f"텍스트가 너무 깁니다 (최대 {self.max_chars}자)")
+        self.text = text
+        self.version = version
+
+    def apply(self, offset: int, delete: int, insert: str, version: int):
+        if not all(isinstance(value, int) for value in (offset, delete, version)) or not isinstance(insert, str):
+            raise ValueError("offset, delete, version은 정수, insert는 문자열이어야 합니다")
+        if version != self.version + 1:
+            raise EditError(f"편집 순서가 맞지 않습니다 (서버 {self.version}, 편집 {version})")
+        if offset < 0 or delete < 0 or offset + delete > len(self.text):
+            raise EditError(f"편집 범위가 텍스트({len(self.text)}자)를 벗어납니다")
+        text = self.text[:offset] + insert + self.text[offset + delete:]
+        if len(text) > self.max_chars:
+            raise ValueError(f"텍스트가 너무 깁니다 (최대 {self.max_chars}자)")
+        self.text = text
+        self.version = version
+
+
+class AutocompleteSession:
+    """
+    WebSocket 연결 하나의 자동완성 상태
+
+    generator는 BlogGenerator처럼 autocomplete(prompt, session_id, seq)와 cancel_autocomplete(session_id)를
+    가진 객체입니다. 새 편집이 오면 기다리던 추천과 생성 중인 추천 요청을 바로 취소하고,
+    입력이 debounce초 동안 멈추면 그때의 텍스트로 추천을 요청합니다 (세션 KV 캐시도 연결별로 재사용).
+    """
+
+    def __init__(self, generator, send: Callable[[dict], Awaitable[None]], debounce: float = 0.3):
+        self.generator = generator
+        self.send = send
+        self.debounce = debounce
+        self.session_id = uuid.uuid4().hex
+        self.document = TextDocument()
+        self._task: Optional[asyncio.Task] = None
+
+    async def receive(self, raw: str):
+        """클라이언트 메시지 하나를 처리"""
+        try:
+            message = json.loads(raw)
+            kind = message.get("type")
+            if kind == "reset":
+                self.document.reset(message.get("text"), message.get("version"))
+            elif kind == "edit":
+                self.document.apply(message.get("offset"), message.get("delete", 0), message.get("insert", ""),
+                                    message.get("version"))
+            else:
+                raise ValueError(f"알 수 없는 메시지 종류입니다: {kind}")
+        except EditError as e:
+            self._cancel_pending()
+            await self.send({"type": "resync", "version": self.document.version, "error": str(e)})
+            return
+        except (ValueError, AttributeError) as e:
+            await self.send({"type": "error", "error": str(e)})
+            return
+
+        self._cancel_pending()
+        if message.get("suggest", True) and self.document.text.strip():
+            self._task = asyncio.create_task(self._suggest(self.document.version))
+
+    def close(self):
+        """연결이 끊기면 기다리던 추천과 생성 중인 요청을 취소"""
+        self._cancel_pending()
+
+    def _cancel_pending(self):
+        # 스케줄러 요청을 먼저 취소해야 배치에서 빠짐 (asyncio 태스크만 취소하면 생성은 계속됨)
+        self.generator.cancel_autocomplete(self.session_id)
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    async def _suggest(self, version: int):
+        await asyncio.sleep(self.debounce)
+        # 새 편집이 오면 이 태스크는 취소되므로 지금 텍스트가 version 기준 텍스트
+        try:
+            suggestion = await self.generator.autocomplete(self.document.text, self.session_id, version)
+        except RequestCancelled:
+            return
+        except Exception as e:
+            await self.send({"type": "error", "version": version, "error": str(e)})
+            return
+        await self.send({"type": "suggestion", "version": version, "suggestion": suggestion})
@@ -0,0 +1,88 @@
+"""
+이모지 / 특수기호 토큰 금지
+
+프롬프트에서 "이모지(👍💕..)나 특수기호($*#@)는 사용하지 마세요"라고 해도 모델이 가끔 쓰기 때문에,
+디코딩할 때 이런 글자가 들어간 토큰의 logit을 -inf로 만들어 아예 고를 수 없게 합니다.
+어휘 전체를 검사하는 건 시작할 때 한 번뿐이고, 스텝마다는 미리 만든 bool 마스크만 적용합니다.
+"""
+
+import re
+
+import torch
+from transformers.generation.logits_process import LogitsProcessor
+
+
+# 프롬프트에서 금지한 특수기호
+FORBIDDEN_SYMBOLS = "$*#@"
+
+# 이모지와 그림 기호 구간 (화살표, 괄호, 수학 기호처럼 글에 쓰일 수 있는 기호는 제외)
+_EMOJI_RANGES = (
+    (0x1F000, 0x1FAFF),  # 마작/카드, 이모티콘, 그림 문자, 교통, 보충 기호, 국기 문자
+    (0x2600, 0x27BF),  # 기타 기호(☀☕♥), 딩뱃(✨✔❤)
+    (0x2B00, 0x2BFF),  # 별/도형 (⭐⬆)
+    (0x2300, 0x23FF),  # 기타 기술 기호 (⌚⏰)
+    (0x25A0, 0x25FF),  # 도형 (■▶◆)
+    (0xFE00, 0xFE0F),  # 이모지 표시 변형 선택자
+    (0x200D, 0x200D),  # 이모지 결합용 ZWJ
+    (0xE0000, 0xE007F),  # 태그 문자
+)
+
+# byte fallback 토큰 (<0xF0> 등)
+_BYTE_TOKEN = re.compile(r"^<0x([0-9A-Fa-f]{2})>$")
+
+
+def is_forbidden_char(char: str, symbols: str = FORBIDDEN_SYMBOLS) -> bool:
+    if char in symbols:
+        return True
+    code = ord(char)
+    return any(start <= code <= end for start, end in _EMOJI_RANGES)
+
+
+def _is_forbidden_byte(value: int, symbols: str) -> bool:
+    # 4바이트 UTF-8의 첫 바이트(F0~F4)는 이모지가 있는 보충 평면 글자를 시작하므로 금지
+    # (한글은 3바이트라 영향 없음). ASCII 바이트는 그 글자가 금지 기호일 때만 금지
+    if 0xF0 <= value <= 0xF4:
+        return True
+    return value < 0x80 and chr(value) in symbols
+
+
+def build_banned_token_mask(tokenizer, symbols: str = FORBIDDEN_SYMBOLS) -> torch.Tensor:
+    """
+    디코딩했을 때 이모지나 금지 기호가 나오는 토큰 id는 True인 bool 마스크 (길이 = len(tokenizer))
+
+    특수 토큰(종료 토큰 등)은 금지하지 않습니다. 보충 평면 밖의 기호(❤ 등)가 byte fallback 토큰
+    여러 개로 나뉘어 나오는 경우는 막지 못하지만, 이런 기호는 보통 어휘에 토큰으로 들어 있습니다.
+    """
+    size = len(tokenizer)
+    ids = list(range(size))
+    texts = tokenizer.batch_decode([[token_id] for token_id in ids], skip_special_tokens=False,
+                                   clean_up_tokenization_spaces=False)
+    pieces = tokenizer.convert_ids_to_tokens(ids)
+    special_ids = set(tokenizer.all_special_ids)
+
+    banned = [False] * size
+    for token_id, text, piece in zip(ids, texts, pieces):
+        if token_id in special_ids:
+            continue
+        byte = _BYTE_TOKEN.match(piece) if piece else None
+        if byte is not None:
+            banned[token_id] = _is_forbidden_byte(int(byte.group(1), 16), symbols)
+        else:
+            banned[token_id] = any(is_forbidden_char(char, symbols) for char in text)
+    return torch.tensor(banned, dtype=torch.bool)
+
+
+class BannedTokensLogitsProcessor(LogitsProcessor):
+    """미리 만든 마스크의 토큰을 -inf로 (모델 출력 어휘가 토크나이저보다 크면 앞부분에만 적용)"""
+
+    def __init__(self, mask: torch.Tensor):
+        self.mask = mask
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        width = scores.shape[-1]
+        if width == self.mask.shape[0]:
+            return scores.masked_fill(self.mask, float("-inf"))
+        width = min(width, self.mask.shape[0])
+        scores = scores.clone()
+        scores[..., :width] = scores[..., :width].masked_fill(self.mask[:width], float("-inf"))
+        return scores
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+블로그 포스트 일괄 생성
+
+JSONL 파일의 {"category", "fields", "details"} 레코드(선택: "id", "seed")를 BlogGenerator로 한꺼번에 생성합니다.
+스케줄러 배치가 항상 차 있도록 여러 요청을 동시에 넣어 두고, 끝나는 순서대로 결과를 JSONL에 한 줄씩 씁니다.
+결과 파일이 곧 체크포인트라서 중간에 죽어도 같은 명령으로 다시 실행하면 이미 생성된 레코드는 건너뜁니다.
+
+    python batch_generate.py --input stores.jsonl --output posts.jsonl
+
+fields의 키는 BlogGenerator.build_prompt와 같습니다 (store_name, taste, view, price, atmosphere,
+food_type, rating, product_name, category, purpose).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Callable, Iterable, List, Optional, Set, Tuple
+
+from scheduler import QueueFullError
+
+
+def parse_records(lines: Iterable[str]) -> List[Tuple[int, object]]:
+    """JSONL 줄을 (줄 번호, 레코드)로 (빈 줄은 건너뛰고, 잘못된 줄은 오류 메시지 문자열로 남김)"""
+    records = []
+    for index, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            records.append((index, json.loads(line)))
+        except json.JSONDecodeError as e:
+            records.append((index, f"JSON 형식 오류: {e}"))
+    return records
+
+
+def completed_indices(path: str) -> Set[int]:
+    """이전 실행의 결과 파일에서 성공한 레코드 번호 (실패한 레코드는 다시 생성)"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # 쓰다가 죽은 마지막 줄
+                continue
+            if result.get("success"):
+                done.add(result["index"])
+    return done
+
+
+def default_concurrency(scheduler) -> int:
+    """배치가 비지 않도록 전체 배치 크기의 두 배만큼 동시에 제출 (나머지는 스케줄러 대기열에서 대기)"""
+    return 2 * scheduler.max_batch_size * getattr(scheduler, "num_replicas", 1)
+
+
+async def _generate_one(generator, index: int, record, is_disconnected=None) -> dict:
+    if isinstance(record, str):
+        return {"index": index, "success": False, "error": record}
+    if not isinstance(record, dict) or not record.get("category"):
+        return {"index": index, "success": False, "error": "category가 없는 레코드입니다"}
+
+    result = {"index": index}
+    if "id" in record:
+        result["id"] = record["id"]
+    while True:
+        try:
+            post = await generator.agenerate_blog_post(
+                record["category"], record.get("fields") or {}, record.get("details") or "",
+                is_disconnected=is_disconnected, seed=record.get("seed"),
+            )
+            return {**result, "success": True, "category": record["category"], "generated_post": post}
+        except QueueFullError:
+            # 다른 요청으로 대기열이 가득 찼으면 실패로 처리하지 않고 잠시 후 다시 제출
+            await asyncio.sleep(1.0)
+        except Exception as e:
+            return {**result, "success": False, "error": str(e)}
+
+
+async def generate_batch(generator, records: Iterable[Tuple[int, object]], concurrency: int,
+                         is_disconnected: Optional[Callable] = None) -> AsyncIterator[dict]:
+    """
+    레코드를 최대 concurrency개씩 동시에 생성하고 끝나는 순서대로 결과를 돌려줌
+
+    결과에는 입력의 줄 번호(index)가 들어 있어 순서가 바뀌어도 어느 레코드의 결과인지 알 수 있습니다.
+    iterator를 중간에 닫으면 생성 중인 요청도 취소합니다.
+    """
+    records = iter(records)
+    pending = set()
+    try:
+        while True:
+            while len(pending) < concurrency:
+                item = next(records, None)
+                if item is None:
+                    break
+                pending.add(asyncio.create_task(_generate_one(generator, *item, is_disconnected=is_disconnected)))
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def run(generator, input_path: str, output_path: str, concurrency: int):
+    with open(input_path, encoding="utf-8") as f:
+        records = parse_records(f)
+    done = completed_indices(output_path)
+    todo = [(index, record) for index, record in records if index not in done]
+    print(f"{len(records)}개 레코드 중 {len(done)}개는 이미 생성됨, {len(todo)}개 생성 시작 (동시 {concurrency}개)")
+
+    # 죽기 직전에 쓰다 만 줄이 있으면 다음 줄과 붙지 않도록 줄을 바꾼 뒤 이어서 씀
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    else:
+        needs_newline = False
+
+    started = time.time()
+    succeeded = failed = 0
+    with open(output_path, "a", encoding="utf-8") as out:
+        if needs_newline:
+            out.write("\n")
+        async for result in generate_batch(generator, todo, concurrency):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            if result["success"]:
+                succeeded += 1
+            else:
+                failed += 1
+                print(f"레코드 {result['index']} 생성 실패: {result['error']}")
+            finished = succeeded + failed
+            if finished % 10 == 0 or finished == len(todo):
+                elapsed = time.time() - started
+                print(f"[{finished}/{len(todo)}] {elapsed:.0f}초 경과 ({finished / elapsed * 60:.1f}개/분)")
+    print(f"완료: 성공 {succeeded}개, 실패 {failed}개 -> '{output_path}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSONL 레코드로 블로그 포스트 일괄 생성 (중단된 지점부터 이어서 실행)")
+    parser.add_argument("--input", required=True, help='입력 JSONL ({"category", "fields", "details"} 한 줄에 하나)')
+    parser.add_argument("--output", required=True, help="결과 JSONL (이미 있으면 성공한 레코드는 건너뛰고 이어서 씀)")
+    parser.add_argument("--concurrency", type=int, default=0, help="동시에 제출할 요청 수 (0이면 배치 크기의 두 배)")
+    args = parser.parse_args()
+
+    input_path = os.path.abspath(args.input)
+    output_path = os.path.abspath(args.output)
+    # main.py가 static/templates를 상대 경로로 찾으므로 makeweb 폴더에서 실행
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    from main import create_blog_generator
+
+    generator = create_blog_generator()
+    concurrency = args.concurrency or default_concurrency(generator.scheduler)
+    asyncio.run(run(generator, input_path, output_path, concurrency))
+
+
+if __name__ == "__main__":
+    main()
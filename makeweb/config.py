@@ -0,0 +1,105 @@
+"""
+서버 설정
+
+환경 변수로 덮어쓸 수 있으며, 지정하지 않으면 기본값을 사용합니다.
+"""
+
+import os
+from typing import Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def _env_flag(name: str) -> Optional[bool]:
+    """0/1 환경 변수 (지정하지 않으면 None, 기본값은 사용하는 쪽에서 정함)"""
+    value = os.environ.get(name)
+    return int(value) != 0 if value else None
+
+
+def _env_int_list(name: str, default: list) -> list:
+    """쉼표로 구분한 정수 목록 환경 변수"""
+    value = os.environ.get(name)
+    return [int(item) for item in value.split(",") if item.strip()] if value else default
+
+
+def _env_mapping(name: str) -> dict:
+    """키=값,키=값 형식의 환경 변수를 dict로"""
+    value = os.environ.get(name, "")
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {key.strip(): path.strip() for key, path in pairs}
+
+
+# 모델 경로 (makeweb/main.py 기준 상대 경로)
+BASE_MODEL_NAME = os.environ.get("BLOG_BASE_MODEL", "google/gemma-3-4b-it")
+ADAPTER_PATH = os.environ.get("BLOG_ADAPTER_PATH", "../gemma3-4b-blog-qlora")
+# export_merged.py로 어댑터를 병합해 둔 디렉토리 (지정하면 위 두 경로 대신 사용)
+MERGED_MODEL_PATH = os.environ.get("BLOG_MERGED_MODEL") or None
+# 카테고리별 어댑터 (예: "카페=../cafe-qlora,맛집=../food-qlora"), 지정하지 않은 카테고리는 ADAPTER_PATH 사용
+CATEGORY_ADAPTERS = _env_mapping("BLOG_CATEGORY_ADAPTERS")
+
+# 추론 backend: auto(GPU가 있으면 cuda, 없으면 cpu) / cuda(4-bit NF4) / cpu(어댑터 병합 + int8 동적 양자화) / fake
+BACKEND = os.environ.get("BLOG_BACKEND", "auto")
+CPU_THREADS = _env_int("BLOG_CPU_THREADS", 0)  # 0이면 사용 가능한 코어 수
+# int8 동적 양자화 (지정하지 않으면 켬, 단 병합 모델은 mmap한 가중치를 복사 없이 쓰도록 끔)
+CPU_QUANTIZE = _env_flag("BLOG_CPU_QUANTIZE")
+# fake(모델 없이 서버를 돌려 보는 부하 테스트용 backend) 디코딩 스텝 시간, 프롬프트 토큰당 prefill 시간 (초)
+FAKE_TOKEN_LATENCY = _env_float("BLOG_FAKE_TOKEN_LATENCY", 0.02)
+FAKE_PREFILL_LATENCY = _env_float("BLOG_FAKE_PREFILL_LATENCY", 0.0002)
+
+# 스케줄러
+MAX_BATCH_SIZE = _env_int("BLOG_MAX_BATCH_SIZE", 8)
+MAX_QUEUE_SIZE = _env_int("BLOG_MAX_QUEUE_SIZE", 64)
+# 블로그 포스트 생성이 차지하지 못하게 자동완성용으로 남겨 둘 배치 자리 수
+INTERACTIVE_RESERVED_SLOTS = _env_int("BLOG_INTERACTIVE_RESERVED_SLOTS", 1)
+SESSION_CACHE_BYTES = _env_int("BLOG_SESSION_CACHE_BYTES", 512 * 1024 * 1024)
+# 자동완성 세션 KV 캐시를 int8로 양자화해 보관 (메모리 절반 이하, 재사용 결과에 약간의 오차)
+SESSION_CACHE_INT8 = _env_int("BLOG_SESSION_CACHE_INT8", 0) != 0
+# 배치 KV 캐시 + 세션 캐시의 메모리 예산 (바이트, 0이면 제한 없음), 예산 계산 단위 (토큰)
+# 예산을 넘는 새 요청은 대기열에서 기다리고, 생성 중에 넘으면 나중에 들어온 요청부터 잠시 배치에서 뺌
+KV_CACHE_BYTES = _env_int("BLOG_KV_CACHE_BYTES", 0)
+KV_BLOCK_TOKENS = _env_int("BLOG_KV_BLOCK_TOKENS", 16)
+# 추론 워커 프로세스 수 (2 이상이면 가중치를 공유하는 워커를 fork, CPU backend 전용)
+NUM_REPLICAS = _env_int("BLOG_REPLICAS", 1)
+
+# 자동완성 전용 모델: 비우면 블로그 생성 모델을 같이 사용,
+# "ngram:경로"면 ngram_autocomplete.py로 학습한 글자 n-gram 모델, 그 외에는 작은 HF 모델 이름/경로
+AUTOCOMPLETE_MODEL = os.environ.get("BLOG_AUTOCOMPLETE_MODEL") or None
+# WebSocket 자동완성(/text_autocomplete/ws)에서 입력이 멈춘 뒤 추천을 만들기까지 기다리는 시간 (초)
+AUTOCOMPLETE_DEBOUNCE = _env_float("BLOG_AUTOCOMPLETE_DEBOUNCE", 0.3)
+
+# 생성 종료 조건: 블로그 포스트 토큰 예산, 요청별 제한 시간(초, 대기 시간 포함, 0이면 없음)
+# 제한 시간이 지나면 그때까지 생성한 부분까지만 돌려주고 결과 캐시에는 저장하지 않음
+MAX_NEW_TOKENS = _env_int("BLOG_MAX_NEW_TOKENS", 1000)
+GENERATION_DEADLINE = _env_float("BLOG_GENERATION_DEADLINE", 0.0)
+AUTOCOMPLETE_DEADLINE = _env_float("BLOG_AUTOCOMPLETE_DEADLINE", 0.0)
+# 이모지와 특수기호($*#@)가 들어간 토큰을 디코딩에서 아예 고를 수 없게 함 (0이면 끔)
+BAN_SYMBOL_TOKENS = _env_int("BLOG_BAN_SYMBOL_TOKENS", 1) != 0
+
+# 추측 디코딩: 스텝당 최대 추측 토큰 수 (0이면 사용하지 않음), 프롬프트 룩업에 쓸 최대 n-gram 길이
+SPECULATIVE_TOKENS = _env_int("BLOG_SPECULATIVE_TOKENS", 0)
+PROMPT_LOOKUP_NGRAM = _env_int("BLOG_PROMPT_LOOKUP_NGRAM", 3)
+
+# 요청이 하나뿐일 때 정적 KV 캐시 + torch.compile로 디코딩 (시작할 때 bucket별 컴파일, 기본은 끔)
+# bucket은 (프롬프트 + 생성 토큰) 길이 구간이며, 가장 큰 bucket보다 긴 요청은 기존 경로로 생성
+COMPILE_DECODE = _env_int("BLOG_COMPILE_DECODE", 0) != 0
+STATIC_CACHE_BUCKETS = _env_int_list("BLOG_STATIC_CACHE_BUCKETS", [512, 1024, 2048])
+
+# 비동기 작업(/jobs) 저장 위치, 동시에 생성할 작업 수, 끝난 작업을 보관할 시간(초)
+JOB_DB_PATH = os.environ.get("BLOG_JOB_DB", "jobs.sqlite3")
+JOB_CONCURRENCY = _env_int("BLOG_JOB_CONCURRENCY", 4)
+JOB_RETENTION = _env_float("BLOG_JOB_RETENTION", 24 * 60 * 60.0)
+
+# 요청 로그(프롬프트, 요청별 시간)를 남길 요청 비율 (0이면 끔, 1이면 모든 요청)
+LOG_SAMPLE_RATE = _env_float("BLOG_LOG_SAMPLE_RATE", 0.01)
+
+# /generate 결과 캐시 (0이면 사용하지 않음)
+RESPONSE_CACHE_SIZE = _env_int("BLOG_RESPONSE_CACHE_SIZE", 0)
+RESPONSE_CACHE_TTL = _env_float("BLOG_RESPONSE_CACHE_TTL", 600.0)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+QLoRA 어댑터를 기본 모델에 병합해 하나의 safetensors 체크포인트로 내보내는 스크립트
+
+내보낸 디렉토리를 BLOG_MERGED_MODEL로 지정하면 서버 시작 시 기본 모델 로드와
+어댑터 주입 대신 병합된 가중치를 메모리 매핑해서 바로 사용합니다.
+
+사용법:
+    python export_merged.py --output ../gemma3-4b-blog-merged
+"""
+
+import argparse
+
+import torch
+
+import config
+from model_loader import export_merged_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="어댑터를 병합한 모델을 safetensors로 내보내기")
+    parser.add_argument("--output", required=True, help="저장할 디렉토리")
+    parser.add_argument("--base-model", default=config.BASE_MODEL_NAME, help="기본 모델 이름 또는 경로")
+    parser.add_argument("--adapter", default=config.ADAPTER_PATH, help="QLoRA 어댑터 경로")
+    parser.add_argument("--dtype", default="bfloat16", choices=["bfloat16", "float16", "float32"],
+                        help="저장할 가중치 데이터 타입")
+    args = parser.parse_args()
+
+    export_merged_model(args.base_model, args.adapter, args.output, dtype=getattr(torch, args.dtype))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+가짜(fake) 추론 backend
+
+실제 Gemma 체크포인트나 GPU 없이 서버 전체(대기열, 우선순위, 캐시, 스트리밍, 작업 API)를 돌려 보고
+부하 테스트(loadtest.py)를 하기 위한 backend입니다. BLOG_BACKEND=fake로 켭니다.
+
+- FakeTokenizer: 글자 하나 = 토큰 하나인 토크나이저
+- FakeModel: BlogGenerator가 모델에서 읽는 설정만 가진 빈 모듈
+- FakeScheduler: BatchScheduler의 대기열/우선순위/선점/종료 조건 처리는 그대로 쓰고,
+  forward 대신 정해진 시간만큼 기다린 뒤 프롬프트로 정해지는 글(결정적)을 한 글자씩 생성
+"""
+
+import time
+import zlib
+from concurrent.futures import Future
+from types import SimpleNamespace
+from typing import List, Optional
+
+import torch
+from transformers import GenerationConfig
+
+from scheduler import BatchScheduler, GenerationRequest
+
+
+# 가짜 모델이 이어 쓰는 글 (줄바꿈이 있어 자동완성은 한 문장에서 멈춤)
+_FAKE_TEXT = (
+    "오늘은 오랜만에 친구와 함께 동네에 새로 생긴 곳에 다녀왔어요.\n"
+    "입구부터 분위기가 아늑해서 들어가자마자 기분이 좋아졌답니다.\n"
+    "주문한 메뉴는 생각보다 빨리 나왔고 양도 넉넉해서 만족스러웠어요.\n"
+    "가격도 부담스럽지 않아서 다음에 또 오고 싶다는 생각이 들었어요.\n"
+    "직원분들도 친절하게 설명해 주셔서 처음 방문했는데도 편하게 즐길 수 있었어요.\n"
+    "창가 자리에 앉으면 바깥 풍경이 한눈에 보여서 사진 찍기에도 좋아요.\n"
+    "주말에는 사람이 많으니 조금 일찍 가시는 걸 추천드려요.\n"
+)
+# 자동완성이 빈 추천으로 끝나지 않도록 문장 시작 위치에서만 이어 씀
+_SENTENCE_STARTS = [0] + [i + 1 for i, char in enumerate(_FAKE_TEXT) if char == "\n"][:-1]
+
+
+class FakeTokenizer:
+    """글자 하나를 토큰 하나로 쓰는 토크나이저 (id = 유니코드 코드 포인트 + 오프셋)"""
+
+    pad_token_id = 0
+    eos_token_id = 1
+    _OFFSET = 2
+
+    def __call__(self, text: str):
+        return SimpleNamespace(input_ids=self.encode(text))
+
+    def encode(self, text: str) -> List[int]:
+        return [ord(char) + self._OFFSET for char in text]
+
+    def decode(self, token_ids: List[int], skip_special_tokens: bool = False) -> str:
+        return "".join(chr(token_id - self._OFFSET) for token_id in token_ids if token_id >= self._OFFSET)
+
+
+class FakeModel(torch.nn.Module):
+    """BlogGenerator/BatchScheduler가 모델에서 읽는 설정만 가진 빈 모듈"""
+
+    def __init__(self):
+        super().__init__()
+        self.config = SimpleNamespace()
+        self.generation_config = GenerationConfig(top_k=64, eos_token_id=FakeTokenizer.eos_token_id)
+        self.peft_config = {"default": None}
+
+    def load_adapter(self, path: str, adapter_name: str = "default"):
+        self.peft_config[adapter_name] = path
+
+    def delete_adapter(self, adapter_name: str):
+        self.peft_config.pop(adapter_name, None)
+
+
+def load_fake_model():
+    """load_model(backend="fake")가 반환하는 (model, tokenizer)"""
+    return FakeModel(), FakeTokenizer()
+
+
+class FakeScheduler(BatchScheduler):
+    """
+    forward 대신 시간만 흘려보내는 스케줄러
+
+    prefill은 새로 계산할 프롬프트 토큰 수 x prefill_latency, 디코딩 스텝은 배치 크기와 상관없이
+    token_latency만큼 걸립니다 (실제 배치 디코딩처럼 요청이 많을수록 처리량이 늘어남).
+    미리 계산해 둔 카테고리 앞부분은 prefill 시간에서 뺍니다. 생성되는 글은 프롬프트와 시드로 정해집니다.
+    """
+
+    def __init__(self, model, tokenizer, device, token_latency: float = 0.02, prefill_latency: float = 0.0002,
+                 **scheduler_kwargs):
+        super().__init__(model, tokenizer, device, **scheduler_kwargs)
+        self.token_latency = token_latency
+        self.prefill_latency = prefill_latency
+        self._warm_prefixes = set()
+
+    def warm_prefix(self, prefix_ids: List[int], adapter: Optional[str] = None):
+        self._warm_prefixes.add((adapter, tuple(prefix_ids)))
+
+    def load_adapter(self, name: str, path: str) -> Future:
+        future = Future()
+        self._calls.put((lambda: self.model.load_adapter(path, adapter_name=name), future))
+        return future
+
+    def _next_token(self, request: GenerationRequest) -> int:
+        seed = zlib.crc32(str((request.input_ids, request.params.seed)).encode("utf-8"))
+        start = _SENTENCE_STARTS[seed % len(_SENTENCE_STARTS)]
+        char = _FAKE_TEXT[(start + len(request.output_ids)) % len(_FAKE_TEXT)]
+        return self.tokenizer.encode(char)[0]
+
+    def _prefill(self, request: GenerationRequest):
+        started = time.monotonic()
+        if request.admitted_at is None:
+            request.admitted_at = started
+        new_tokens = len(request.all_ids)
+        prefix = request.prefix_ids
+        if prefix and (request.adapter, tuple(prefix)) in self._warm_prefixes:
+            new_tokens -= len(prefix)
+        time.sleep(self.prefill_latency * new_tokens)
+        request.prefill_seconds += time.monotonic() - started
+        request.append_token(self._next_token(request))
+        if request.is_finished():
+            self._finish(request)
+            return
+        self._active.append(request)
+
+    def _decode_step(self):
+        self._drop_cancelled()
+        if not self._active:
+            return
+        time.sleep(self.token_latency)
+        keep = []
+        for row, request in enumerate(self._active):
+            request.append_token(self._next_token(request))
+            if request.is_finished():
+                self._finish(request)
+            else:
+                keep.append(row)
+        if len(keep) < len(self._active):
+            self._select_rows(keep)
+
+    def _select_rows(self, rows: List[int]):
+        self._active = [self._active[row] for row in rows]
@@ -0,0 +1,308 @@
+"""
+비동기 작업(job) API용 영구 대기열
+
+긴 블로그 포스트 생성을 HTTP 연결과 분리합니다. 요청은 SQLite에 작업으로 저장되고 바로 작업 id를
+돌려주며, 백그라운드 실행기가 저장된 순서대로 꺼내 생성합니다. 결과는 폴링(GET)이나 WebSocket으로 받습니다.
+서버가 재시작되어도 대기 중이던 작업과 실행 중이던 작업은 DB에 남아 있다가 다시 처리됩니다.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from scheduler import QueueFullError, RequestCancelled, RequestTooLarge
+
+
+# 작업 상태
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    category TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    details TEXT NOT NULL,
+    seed INTEGER,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """SQLite에 저장되는 작업 목록 (여러 스레드에서 호출해도 되도록 연결 하나를 lock으로 보호)"""
+
+    def __init__(self, path: str = "jobs.sqlite3"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def create(self, category: str, fields: dict, details: str, seed: Optional[int] = None) -> dict:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, category, fields, details, seed, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, category, json.dumps(fields, ensure_ascii=False), details, seed, time.time()),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = _row_to_job(row)
+            if job["status"] == JOB_QUEUED:
+                # 이 작업보다 먼저 들어와 아직 시작하지 않은 작업 수
+                job["queue_position"] = self._db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?",
+                    (JOB_QUEUED, job["created_at"]),
+                ).fetchone()[0]
+        return job
+
+    def claim_next(self) -> Optional[dict]:
+        """가장 먼저 들어온 대기 작업을 실행 중으로 바꾸고 반환 (없으면 None)"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (JOB_QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                             (JOB_RUNNING, time.time(), row["id"]))
+        job = _row_to_job(row)
+        job["status"] = JOB_RUNNING
+        return job
+
+    def requeue(self, job_id: str):
+        """실행하지 못한 작업을 대기 상태로 되돌림 (제출 순서는 유지)"""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, started_at = NULL WHERE id = ? AND status = ?",
+                             (JOB_QUEUED, job_id, JOB_RUNNING))
+
+    def requeue_running(self) -> int:
+        """서버가 중간에 종료되어 실행 중으로 남은 작업을 다시 대기 상태로 (시작할 때 호출)"""
+        with self._lock:
+            cursor = self._db.execute("UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?",
+                                      (JOB_QUEUED, JOB_RUNNING))
+        return cursor.rowcount
+
+    def finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None) -> bool:
+        """작업을 끝난 상태로 기록 (이미 끝난 작업이면 False)"""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND status IN (?, ?)",
+                (status, result, error, time.time(), job_id, JOB_QUEUED, JOB_RUNNING),
+            )
+        return cursor.rowcount > 0
+
+    def prune(self, max_age: float) -> int:
+        """끝난 지 max_age초가 지난 작업 삭제"""
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?, ?) AND finished_at < ?",
+                (*FINISHED_STATES, time.time() - max_age),
+            )
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+def finished_event(job: dict) -> dict:
+    """끝난 작업을 WebSocket 마지막 이벤트 형식으로"""
+    if job["status"] == JOB_DONE:
+        return {"type": "done", "result": job["result"]}
+    if job["status"] == JOB_FAILED:
+        return {"type": "error", "error": job["error"]}
+    return {"type": "cancelled"}
+
+
+def _row_to_job(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    job["job_id"] = job.pop("id")
+    job["fields"] = json.loads(job["fields"])
+    return job
+
+
+class JobRunner:
+    """
+    JobStore의 대기 작업을 꺼내 생성하는 백그라운드 실행기 (이벤트 루프 안에서 동작)
+
+    동시에 최대 concurrency개의 작업만 스케줄러에 넣고 나머지는 DB에 남겨 두므로,
+    한꺼번에 몰린 작업이 /generate나 자동완성의 대기열 자리를 모두 차지하지 않습니다.
+    생성 중인 텍스트는 WebSocket 구독자에게 조각(delta)으로 전달됩니다.
+    """
+
+    def __init__(self, store: JobStore, generator, concurrency: int = 4, retention_seconds: float = 86400.0):
+        self.store = store
+        self.generator = generator
+        self.concurrency = concurrency
+        self.retention_seconds = retention_seconds
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._partial: Dict[str, List[str]] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    def start(self):
+        requeued = self.store.requeue_running()
+        if requeued:
+            print(f"Requeued {requeued} interrupted jobs")
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """실행기 종료 (실행 중이던 작업은 DB에서 대기 상태로 되돌려 다음 실행 때 다시 처리)"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, category: str, fields: dict, details: str, seed: Optional[int] = None) -> dict:
+        job = self.store.create(category, fields, details, seed)
+        self._wakeup.set()
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """작업 상태 (실행 중이면 지금까지 생성된 텍스트를 partial로 포함)"""
+        job = self.store.get(job_id)
+        if job is not None and job_id in self._partial:
+            job["partial"] = "".join(self._partial[job_id])
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """대기 중이거나 실행 중인 작업 취소 (이미 끝난 작업이면 False)"""
+        if not self.store.finish(job_id, JOB_CANCELLED):
+            return False
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        self._publish(job_id, {"type": "cancelled"}, last=True)
+        return True
+
+    def subscribe(self, job_id: str) -> Tuple[asyncio.Queue, str]:
+        """작업 이벤트를 받을 큐와 지금까지 생성된 텍스트 (사이에 await가 없어 빠지는 조각이 없음)"""
+        events: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(events)
+        return events, "".join(self._partial.get(job_id, ()))
+
+    def unsubscribe(self, job_id: str, events: asyncio.Queue):
+        subscribers = self._subscribers.get(job_id, [])
+        if events in subscribers:
+            subscribers.remove(events)
+        if not subscribers:
+            self._subscribers.pop(job_id, None)
+
+    def stats(self) -> dict:
+        return {"concurrency": self.concurrency, "running": len(self._running), "jobs": self.store.counts()}
+
+    def _publish(self, job_id: str, event: dict, last: bool = False):
+        subscribers = self._subscribers.pop(job_id, []) if last else self._subscribers.get(job_id, [])
+        for events in subscribers:
+            events.put_nowait(event)
+
+    def _fail(self, job_id: str, error: Exception):
+        if self.store.finish(job_id, JOB_FAILED, error=str(error)):
+            self._publish(job_id, {"type": "error", "error": str(error)}, last=True)
+
+    async def _worker(self):
+        while True:
+            job = self.store.claim_next()
+            if job is None:
+                self._wakeup.clear()
+                self.store.prune(self.retention_seconds)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=5.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._run(job))
+            self._running[job["job_id"]] = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.done():
+                    # 실행기 종료: 생성을 멈추고 다음 실행 때 다시 처리
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    self.store.requeue(job["job_id"])
+                    raise
+            except Exception as e:
+                # 작업 하나의 예상치 못한 오류로 워커가 멈추지 않도록 실패 처리하고 다음 작업으로
+                traceback.print_exc()
+                self._fail(job["job_id"], e)
+            finally:
+                self._running.pop(job["job_id"], None)
+                self._partial.pop(job["job_id"], None)
+
+    async def _run(self, job: dict):
+        job_id = job["job_id"]
+        try:
+            text_stream = self.generator.stream_blog_post(job["category"], job["fields"], job["details"],
+                                                          seed=job["seed"])
+        except QueueFullError:
+            # 스케줄러 대기열이 가득 차면 작업은 DB에 그대로 두고 잠시 후 다시 시도
+            self.store.requeue(job_id)
+            await asyncio.sleep(1.0)
+            return
+        except RequestTooLarge as e:
+            # 다시 시도해도 같은 결과이므로 바로 실패 처리
+            self._fail(job_id, e)
+            return
+        except Exception as e:
+            traceback.print_exc()
+            self._fail(job_id, e)
+            return
+
+        pieces = self._partial.setdefault(job_id, [])
+        try:
+            async for text in text_stream:
+                pieces.append(text)
+                self._publish(job_id, {"type": "delta", "text": text})
+            result = "".join(pieces).strip()
+            if self.store.finish(job_id, JOB_DONE, result=result):
+                self._publish(job_id, {"type": "done", "result": result}, last=True)
+        except RequestCancelled:
+            if self.store.finish(job_id, JOB_CANCELLED):
+                self._publish(job_id, {"type": "cancelled"}, last=True)
+        except QueueFullError as e:
+            if pieces:
+                self._fail(job_id, e)
+                return
+            # 멀티 레플리카에서는 워커 대기열이 찬 것을 제출 후에 future로 알게 됨 (위와 같이 다시 시도)
+            self.store.requeue(job_id)
+            await asyncio.sleep(1.0)
+        except Exception as e:
+            traceback.print_exc()
+            self._fail(job_id, e)
+        finally:
+            # 중간에 멈춰도 남은 생성이 취소되도록 스트림을 닫음
+            await text_stream.aclose()
@@ -0,0 +1,237 @@
+"""
+KV 캐시 재사용 / 메모리 관리 유틸리티
+
+여러 요청이 공유하는 프롬프트 앞부분이나, 같은 세션이 직전에 보낸 텍스트의
+past_key_values를 저장해 두고 다음 요청에서는 달라진 뒷부분만 prefill하도록 합니다.
+KVBudget은 배치 KV 캐시가 쓸 메모리를 block 단위로 계산해 스케줄러의 admission/선점 기준으로 씁니다.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple, Union
+
+import torch
+from transformers import DynamicCache
+
+
+def copy_cache(cache: DynamicCache) -> DynamicCache:
+    """
+    캐시 구조만 복사 (텐서는 공유)
+
+    DynamicCache.update()는 torch.cat으로 새 텐서를 만들기 때문에
+    복사본에 토큰을 추가해도 원본 텐서는 바뀌지 않습니다.
+    """
+    copied = DynamicCache()
+    copied.key_cache = list(cache.key_cache)
+    copied.value_cache = list(cache.value_cache)
+    copied._seen_tokens = cache._seen_tokens
+    return copied
+
+
+def cache_nbytes(cache: DynamicCache) -> int:
+    """캐시가 차지하는 메모리 (바이트)"""
+    return sum(
+        tensor.numel() * tensor.element_size()
+        for tensors in (cache.key_cache, cache.value_cache)
+        for tensor in tensors
+    )
+
+
+def _quantize_int8(tensor: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    # (헤드, 토큰)마다 head_dim 방향 최댓값 기준 대칭 양자화
+    scale = tensor.abs().amax(dim=-1, keepdim=True).float().clamp_min(1e-8) / 127.0
+    quantized = torch.round(tensor.float() / scale).clamp_(-127, 127).to(torch.int8)
+    return quantized, scale
+
+
+class Int8KV:
+    """
+    int8로 양자화해 보관하는 KV 캐시 (꺼낼 때 원래 dtype의 DynamicCache로 복원)
+
+    bf16 기준 메모리가 약 절반, float32(CPU) 기준 약 1/4로 줄어듭니다. 복원한 값에는 양자화 오차가
+    있으므로 재사용한 요청의 결과가 전체 prefill했을 때와 조금 다를 수 있습니다.
+    """
+
+    def __init__(self, cache: DynamicCache):
+        self.dtype = cache.key_cache[0].dtype if cache.key_cache else torch.float32
+        self.keys = [_quantize_int8(tensor) for tensor in cache.key_cache]
+        self.values = [_quantize_int8(tensor) for tensor in cache.value_cache]
+        self.seen_tokens = cache._seen_tokens
+
+    def to_cache(self) -> DynamicCache:
+        cache = DynamicCache()
+        cache.key_cache = [(quantized.float() * scale).to(self.dtype) for quantized, scale in self.keys]
+        cache.value_cache = [(quantized.float() * scale).to(self.dtype) for quantized, scale in self.values]
+        cache._seen_tokens = self.seen_tokens
+        return cache
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            quantized.numel() * quantized.element_size() + scale.numel() * scale.element_size()
+            for pairs in (self.keys, self.values)
+            for quantized, scale in pairs
+        )
+
+
+def common_prefix_length(a: List[int], b: List[int]) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+class PrefixCache:
+    """
+    공통 프롬프트 앞부분(preamble)의 KV 캐시 (어댑터 + 토큰 id 기준, LRU)
+
+    같은 앞부분이라도 LoRA 어댑터가 다르면 KV도 다르므로 어댑터별로 따로 저장합니다.
+    """
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, DynamicCache]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token_ids: List[int], adapter: Optional[str] = None) -> Optional[DynamicCache]:
+        """저장된 캐시의 복사본을 반환 (없으면 None)"""
+        key = (adapter, tuple(token_ids))
+        with self._lock:
+            cache = self._entries.get(key)
+            if cache is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy_cache(cache)
+
+    def put(self, token_ids: List[int], cache: DynamicCache, adapter: Optional[str] = None):
+        key = (adapter, tuple(token_ids))
+        with self._lock:
+            self._entries[key] = copy_cache(cache)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, adapter: Optional[str] = None):
+        """어댑터가 바뀌었을 때 그 어댑터로 계산한 캐시를 지움"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == adapter]:
+                del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SessionCache:
+    """
+    세션별 마지막 입력의 KV 캐시 (자동완성용)
+
+    같은 세션의 다음 요청은 이전 입력과 겹치는 앞부분의 KV를 재사용하고
+    새로 입력된 뒷부분만 prefill합니다. 전체 메모리 사용량이 max_bytes를 넘으면
+    가장 오래 쓰이지 않은 세션부터 지웁니다. int8=True면 Int8KV로 양자화해 보관합니다.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, int8: bool = False):
+        self.max_bytes = max_bytes
+        self.int8 = int8
+        self._entries: "OrderedDict[str, Tuple[List[int], Union[DynamicCache, Int8KV], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+
+    def match(self, session_id: str, token_ids: List[int]) -> Tuple[Optional[DynamicCache], int]:
+        """
+        token_ids와 겹치는 앞부분의 KV(복사본)와 그 길이를 반환
+
+        다음 토큰 logits를 얻으려면 최소 한 토큰은 prefill해야 하므로
+        겹치는 길이는 len(token_ids) - 1을 넘지 않습니다.
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None, 0
+            self._entries.move_to_end(session_id)
+            cached_ids, cache, _ = entry
+
+        length = min(common_prefix_length(cached_ids, token_ids), len(token_ids) - 1)
+        if length <= 0:
+            self.misses += 1
+            return None, 0
+        self.hits += 1
+        self.reused_tokens += length
+        cache = cache.to_cache() if isinstance(cache, Int8KV) else copy_cache(cache)
+        cache.crop(length)
+        return cache, length
+
+    def put(self, session_id: str, token_ids: List[int], cache: DynamicCache):
+        if self.int8:
+            stored = Int8KV(cache)
+            nbytes = stored.nbytes
+        else:
+            stored = copy_cache(cache)
+            nbytes = cache_nbytes(stored)
+        with self._lock:
+            old = self._entries.pop(session_id, None)
+            if old is not None:
+                self.total_bytes -= old[2]
+            if nbytes > self.max_bytes:
+                return
+            self._entries[session_id] = (list(token_ids), stored, nbytes)
+            self.total_bytes += nbytes
+            self._evict(self.max_bytes)
+
+    def shrink(self, max_bytes: int) -> int:
+        """전체 크기가 max_bytes 이하가 되도록 오래된 세션부터 지우고 지운 바이트 수를 반환"""
+        with self._lock:
+            before = self.total_bytes
+            self._evict(max(0, max_bytes))
+            return before - self.total_bytes
+
+    def _evict(self, max_bytes: int):
+        while self._entries and self.total_bytes > max_bytes:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class KVBudget:
+    """
+    배치 KV 캐시 메모리 예산
+
+    배치 캐시는 왼쪽 패딩으로 맞춘 (요청 수 x 가장 긴 길이) 텐서라서 사용량은 행 수와 너비로 정해집니다.
+    너비는 block_tokens 단위로 올려 계산하고, sliding window 레이어는 window 만큼만 계산합니다.
+    """
+
+    def __init__(self, max_bytes: int, token_bytes_per_layer: int, num_layers: int,
+                 sliding: Optional[tuple] = None, block_tokens: int = 16):
+        self.max_bytes = max_bytes
+        self.token_bytes_per_layer = token_bytes_per_layer
+        self.block_tokens = block_tokens
+        self.window = sliding[0] if sliding else None
+        self.sliding_layers = len(sliding[1]) if sliding else 0
+        self.full_layers = num_layers - self.sliding_layers
+
+    def blocks(self, tokens: int) -> int:
+        return math.ceil(tokens / self.block_tokens)
+
+    def batch_bytes(self, rows: int, width: int) -> int:
+        """rows개 요청, 너비 width 토큰인 배치 캐시의 크기 (block 단위로 올림)"""
+        tokens = self.blocks(width) * self.block_tokens
+        sliding_tokens = min(tokens, self.window) if self.window else 0
+        per_row = (self.full_layers * tokens + self.sliding_layers * sliding_tokens) * self.token_bytes_per_layer
+        return rows * per_row
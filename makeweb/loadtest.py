@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+부하 테스트 / 지연 측정
+
+실행 중인 서버에 실제와 비슷한 트래픽을 보내고 처리량과 p50/p95/p99 지연을 보고합니다.
+
+- /generate: 카테고리별 입력 폼을 무작위로 채워 generate_users명이 쉬지 않고 요청
+- /text_autocomplete: autocomplete_users명이 글자를 하나씩 치다가 멈출 때(브라우저의 300ms 디바운스)마다 요청
+  (응답을 기다리지 않고 타자 일정대로 보내므로 서버가 느려져도 보내는 양이 줄지 않음)
+
+모델 없이 서버만 측정하려면 가짜 backend로 서버를 띄운 뒤 실행합니다:
+    BLOG_BACKEND=fake python run_server.py
+    python loadtest.py --url http://localhost:8000 --duration 30 --generate-users 8 --autocomplete-users 16
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+# 폼에 채울 값 (카테고리별 필드는 index.html의 입력칸과 같음)
+_FORM_VALUES = {
+    "카페": {
+        "cafe_store_name": ["카페 온도", "모노커피", "하루카페", "블루보틀 성수"],
+        "cafe_taste": ["라떼가 고소해요", "디저트가 달지 않아요", "원두 향이 좋아요"],
+        "cafe_view": ["한강이 보여요", "창밖으로 숲이 보여요", ""],
+        "cafe_price": ["아메리카노 4500원", "조금 비싸요", ""],
+        "cafe_atmosphere": ["조용하고 아늑해요", "사람이 많고 활기차요"],
+    },
+    "맛집": {
+        "restaurant_store_name": ["을지로 국밥", "한옥 파스타", "동네 분식"],
+        "restaurant_taste": ["국물이 진해요", "면이 쫄깃해요", "양념이 맛있어요"],
+        "restaurant_food_type": ["한식", "양식", "분식"],
+        "restaurant_rating": ["5점", "4점", "3점"],
+        "restaurant_price": ["1인 1만원", "2인 4만원", ""],
+    },
+    "리뷰": {
+        "review_product_name": ["무선 이어폰", "전기 포트", "캠핑 의자"],
+        "review_category": ["전자기기", "주방용품", "캠핑용품"],
+        "review_rating": ["5점", "4점"],
+        "review_price": ["5만원", "12만원", ""],
+        "review_purpose": ["출퇴근용", "선물용", "캠핑용"],
+    },
+}
+_DETAILS = [
+    "주말 오후에 친구와 방문했어요",
+    "회사 근처라 점심시간에 자주 가요",
+    "생일 선물로 받아서 한 달 동안 써 봤어요",
+    "비 오는 날 혼자 들렀어요",
+]
+# 자동완성 사용자가 입력하는 문장
+_TYPED_TEXTS = [
+    "오늘은 친구와 함께 성수동에 새로 생긴 카페에 다녀왔어요. 분위기가 정말 좋았고 라떼도 맛있었어요.",
+    "점심시간에 회사 근처 국밥집에 갔는데 국물이 진하고 양도 많아서 만족스러웠습니다.",
+    "이번에 무선 이어폰을 새로 샀는데 음질도 좋고 배터리도 오래가서 출퇴근할 때 잘 쓰고 있어요.",
+]
+
+
+def random_form(rng: random.Random) -> Dict[str, str]:
+    category = rng.choice(list(_FORM_VALUES))
+    form = {"category": category, "details": rng.choice(_DETAILS)}
+    for field, values in _FORM_VALUES[category].items():
+        form[field] = rng.choice(values)
+    return form
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """nearest-rank 백분위수"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    """엔드포인트별 지연과 결과 집계 (여러 스레드에서 기록)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.outcomes: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, outcome: str, latency: float):
+        with self._lock:
+            self.outcomes[endpoint][outcome] += 1
+            if outcome == "ok":
+                self.latencies[endpoint].append(latency)
+
+    def report(self, elapsed: float) -> dict:
+        report = {"duration_seconds": elapsed, "endpoints": {}}
+        with self._lock:
+            for endpoint, outcomes in self.outcomes.items():
+                latencies = sorted(self.latencies[endpoint])
+                report["endpoints"][endpoint] = {
+                    "requests": sum(outcomes.values()),
+                    "outcomes": dict(outcomes),
+                    "throughput_per_second": len(latencies) / elapsed if elapsed else 0.0,
+                    "latency_seconds": {
+                        "p50": percentile(latencies, 50),
+                        "p95": percentile(latencies, 95),
+                        "p99": percentile(latencies, 99),
+                        "max": latencies[-1] if latencies else None,
+                    },
+                }
+        return report
+
+
+def _post(url: str, data: bytes, content_type: str, timeout: float) -> dict:
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": content_type}, method="POST")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def _call(recorder: Recorder, endpoint: str, send) -> Optional[dict]:
+    """요청 하나를 보내고 결과를 ok / cancelled / rejected(503) / error로 분류해 기록"""
+    started = time.perf_counter()
+    try:
+        body = send()
+    except urllib.error.HTTPError as e:
+        recorder.record(endpoint, "rejected" if e.code == 503 else f"http_{e.code}", time.perf_counter() - started)
+        return None
+    except (urllib.error.URLError, OSError):
+        recorder.record(endpoint, "error", time.perf_counter() - started)
+        return None
+    if body.get("success"):
+        outcome = "ok"
+    elif body.get("cancelled"):
+        outcome = "cancelled"
+    else:
+        outcome = "error"
+    recorder.record(endpoint, outcome, time.perf_counter() - started)
+    return body
+
+
+def generate_user(base_url: str, recorder: Recorder, stop_at: float, seed: int, timeout: float):
+    """/generate 폼을 쉬지 않고 제출하는 사용자 (503이나 연결 오류면 서버의 Retry-After처럼 1초 쉬었다가 다시)"""
+    rng = random.Random(seed)
+    url = base_url + "/generate"
+    while time.monotonic() < stop_at:
+        data = urllib.parse.urlencode(random_form(rng)).encode("utf-8")
+        body = _call(recorder, "/generate",
+                     lambda: _post(url, data, "application/x-www-form-urlencoded", timeout))
+        if body is None:
+            time.sleep(1.0)
+
+
+def autocomplete_user(base_url: str, recorder: Recorder, stop_at: float, seed: int, timeout: float,
+                      keystroke_interval: float, debounce: float) -> List[threading.Thread]:
+    """
+    글자를 keystroke_interval 간격으로 치다가 가끔 멈추는 사용자
+
+    브라우저처럼 입력이 debounce 이상 멈췄을 때만 /text_autocomplete를 보내되, 응답은 기다리지 않고
+    계속 입력합니다. 이전 요청이 아직 처리 중이면 서버가 더 새로운 seq를 보고 취소하므로(cancelled로 집계)
+    늦은 추천은 버려집니다. 보낸 요청의 스레드 목록을 반환합니다.
+    """
+    rng = random.Random(seed)
+    url = base_url + "/text_autocomplete"
+    session_id = uuid.uuid4().hex
+    seq = 0
+    requests = []
+    while time.monotonic() < stop_at:
+        text = rng.choice(_TYPED_TEXTS)
+        position = 0
+        while position < len(text) and time.monotonic() < stop_at:
+            # 몇 글자를 이어서 친 뒤 멈춤
+            burst = rng.randint(2, 8)
+            for _ in range(burst):
+                time.sleep(keystroke_interval * rng.uniform(0.5, 1.5))
+            position = min(len(text), position + burst)
+            time.sleep(debounce)
+            seq += 1
+            payload = json.dumps({"prompt": text[:position], "session_id": session_id, "seq": seq}).encode("utf-8")
+            request = threading.Thread(
+                target=_call, daemon=True,
+                args=(recorder, "/text_autocomplete",
+                      lambda payload=payload: _post(url, payload, "application/json", timeout)),
+            )
+            request.start()
+            requests.append(request)
+    return requests
+
+
+def run(base_url: str, duration: float, generate_users: int, autocomplete_users: int,
+        keystroke_interval: float = 0.12, debounce: float = 0.3, timeout: float = 600.0, seed: int = 0) -> dict:
+    recorder = Recorder()
+    base_url = base_url.rstrip("/")
+    stop_at = time.monotonic() + duration
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, generate_users + autocomplete_users)) as executor:
+        futures = [executor.submit(generate_user, base_url, recorder, stop_at, seed + i, timeout)
+                   for i in range(generate_users)]
+        futures += [executor.submit(autocomplete_user, base_url, recorder, stop_at, seed + 1000 + i, timeout,
+                                    keystroke_interval, debounce)
+                    for i in range(autocomplete_users)]
+        for future in futures:
+            requests = future.result()
+            # 자동완성 사용자가 보낸 요청이 끝날 때까지 기다림
+            for request in requests or ():
+                request.join()
+    return recorder.report(time.perf_counter() - started)
+
+
+def print_report(report: dict):
+    print(f"측정 시간: {report['duration_seconds']:.1f}초")
+    for endpoint, stats in report["endpoints"].items():
+        latency = stats["latency_seconds"]
+        outcomes = ", ".join(f"{name} {count}" for name, count in sorted(stats["outcomes"].items()))
+        print(f"{endpoint}: {stats['requests']}건 ({outcomes}), 처리량 {stats['throughput_per_second']:.2f}건/초")
+        if latency["p50"] is not None:
+            print(f"  지연 p50 {latency['p50'] * 1000:.0f}ms, p95 {latency['p95'] * 1000:.0f}ms, "
+                  f"p99 {latency['p99'] * 1000:.0f}ms, max {latency['max'] * 1000:.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="블로그 생성 서버 부하 테스트 (처리량, p50/p95/p99 지연)")
+    parser.add_argument("--url", default="http://localhost:8000", help="서버 주소")
+    parser.add_argument("--duration", type=float, default=30.0, help="측정 시간 (초)")
+    parser.add_argument("--generate-users", type=int, default=4, help="/generate를 계속 보내는 사용자 수")
+    parser.add_argument("--autocomplete-users", type=int, default=8, help="자동완성을 쓰며 입력하는 사용자 수")
+    parser.add_argument("--keystroke-interval", type=float, default=0.12, help="평균 타자 간격 (초)")
+    parser.add_argument("--debounce", type=float, default=0.3, help="입력이 멈춘 뒤 자동완성을 요청하기까지 (초)")
+    parser.add_argument("--timeout", type=float, default=600.0, help="요청 하나의 제한 시간 (초)")
+    parser.add_argument("--seed", type=int, default=0, help="트래픽 난수 시드 (같으면 같은 요청 순서)")
+    parser.add_argument("--json", help="결과를 JSON으로 저장할 파일 (회귀 비교용)")
+    args = parser.parse_args()
+
+    report = run(args.url, args.duration, args.generate_users, args.autocomplete_users,
+                 keystroke_interval=args.keystroke_interval, debounce=args.debounce,
+                 timeout=args.timeout, seed=args.seed)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,30 @@
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, Form, Depends, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
-from peft import PeftModel
 from typing import Optional
+import asyncio
 import json
+import time
+from collections import OrderedDict
 import traceback
 from pydantic import BaseModel
+from scheduler import (PRIORITY_INTERACTIVE, BatchScheduler, InferenceBackend, QueueFullError, RequestCancelled,
+                       RequestTooLarge, SamplingParams)
+from response_cache import ResponseCache
+from suggestion_cache import SuggestionCache
+import config
+from banned_tokens import build_banned_token_mask
+from metrics import InferenceMetrics, RequestLogger, process_resident_memory_bytes
+from model_loader import default_eos_token_ids, load_autocomplete_model, load_model, model_memory_bytes
+from ngram_autocomplete import CharNgramModel
+from fake_backend import FakeScheduler
+from batch_generate import default_concurrency, generate_batch, parse_records
+from jobs import FINISHED_STATES, JobRunner, JobStore, finished_event
+from replicas import ReplicaPool
+from autocomplete_session import AutocompleteSession
+from streaming import IncrementalDetokenizer, TokenStream, cancel_on_disconnect
 
 app = FastAPI(title="블로그 포스팅 자동생성기")
 
@@ -17,39 +33,159 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
 class BlogGenerator:
-    def __init__(self, base_model_name: str, adapter_path: str):
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"Loading base model '{base_model_name}' on {self.device}...")
-
-        # 계산 데이터 타입을 bfloat16으로 통일하여 안정성 확보
-        bnb_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_quant_type="nf4",
-            bnb_4bit_compute_dtype=torch.bfloat16,
-            bnb_4bit_use_double_quant=True,
-        )
+    # 카테고리별 주제 문장
+    subject_map = {
+        "카페": "카페에 대한 글을 쓸 예정입니다.",
+        "맛집": "맛집에 대한 글을 쓸 예정입니다.",
+        "리뷰": "제품 리뷰에 대한 글을 쓸 예정입니다."
+    }
+
+    def __init__(self, base_model_name: str, adapter_path: str, max_batch_size: int = 8, max_queue_size: int = 64,
+                 session_cache_bytes: int = 512 * 1024 * 1024,
+                 response_cache_size: int = 0, response_cache_ttl: float = 600.0,
+                 speculative_tokens: int = 0, prompt_lookup_ngram: int = 3,
+                 backend: str = "auto", cpu_threads: int = 0, cpu_quantize: Optional[bool] = None,
+                 merged_model_path: Optional[str] = None, num_replicas: int = 1,
+                 category_adapters: Optional[dict] = None, interactive_reserved_slots: int = 1,
+                 autocomplete_model: Optional[str] = None, max_new_tokens: int = 1000,
+                 generation_deadline: float = 0.0, autocomplete_deadline: float = 0.0,
+                 log_sample_rate: float = 0.01, fake_token_latency: float = 0.02,
+                 fake_prefill_latency: float = 0.0002, ban_symbol_tokens: bool = True,
+                 kv_cache_bytes: int = 0, kv_block_tokens: int = 16, session_cache_int8: bool = False,
+                 compile_decode: bool = False, static_cache_buckets: Optional[list] = None):
+        if category_adapters and merged_model_path:
+            raise ValueError("병합된 모델에는 카테고리별 어댑터를 추가할 수 없습니다")
 
-        # 기본 모델 로드
-        base_model = AutoModelForCausalLM.from_pretrained(
-            base_model_name,
-            quantization_config=bnb_config,
-            device_map="auto",
-            torch_dtype=torch.bfloat16 # 모델 기본 타입도 명시적으로 bfloat16 사용
+        # CUDA가 없으면 bitsandbytes 없이 CPU용(어댑터 병합 + int8 동적 양자화)으로 로드
+        # merged_model_path(export_merged.py로 미리 병합한 모델)가 있으면 어댑터 주입 없이 바로 로드
+        self.model, self.tokenizer, self.device = load_model(
+            base_model_name, adapter_path, backend=backend,
+            cpu_threads=cpu_threads, cpu_quantize=cpu_quantize,
+            merged_path=merged_model_path, merge_adapter=not category_adapters,
         )
-        
-        # 토크나이저를 어댑터 경로에서 로드해야 합니다.
-        self.tokenizer = AutoTokenizer.from_pretrained(adapter_path)
-        if self.tokenizer.pad_token is None:
-            self.tokenizer.pad_token = self.tokenizer.eos_token
-            base_model.config.pad_token_id = base_model.config.eos_token_id
-
-        print(f"Loading QLoRA adapter from '{adapter_path}'...")
-        self.model = PeftModel.from_pretrained(base_model, adapter_path)
+
+        # 카테고리별 어댑터를 같은 기본 모델에 추가 (어댑터 이름 = 카테고리)
+        self.category_adapters = {}
+        for category, path in (category_adapters or {}).items():
+            print(f"Loading '{category}' adapter from '{path}'...")
+            self.model.load_adapter(path, adapter_name=category)
+            self.category_adapters[category] = path
         self.model.eval()
         print("Model and adapter loaded successfully!")
 
-    def generate_blog_post(self, category: str, fields: dict, details: str) -> str:
-        """블로그 포스트 생성 (ipynb와 프롬프트 형식 통일)"""
+        # eos_token_id를 따로 주지 않았을 때 generate()가 쓰는 기본 종료 토큰
+        self.default_eos_token_ids = default_eos_token_ids(self.model)
+
+        # 요청별 시간 지표 (/metrics)
+        self.metrics = InferenceMetrics()
+        self.model_bytes = model_memory_bytes(self.model)
+
+        # 모든 추론은 이벤트 루프 밖의 스케줄러 스레드에서 실행 (동시 요청은 한 배치로 처리)
+        scheduler_kwargs = dict(
+            max_batch_size=max_batch_size, max_queue_size=max_queue_size,
+            session_cache_bytes=session_cache_bytes, session_cache_int8=session_cache_int8,
+            speculative_tokens=speculative_tokens, prompt_lookup_ngram=prompt_lookup_ngram,
+            interactive_reserved_slots=interactive_reserved_slots,
+            kv_cache_bytes=kv_cache_bytes, kv_block_tokens=kv_block_tokens,
+            compile_decode=compile_decode, static_cache_buckets=static_cache_buckets,
+        )
+        # 프롬프트에서 금지한 이모지/특수기호 토큰은 디코딩에서 제외 (어휘 검사는 여기서 한 번만)
+        # 가짜 backend는 logits를 만들지 않으므로 제외
+        ban_symbol_tokens = ban_symbol_tokens and backend != "fake"
+        if ban_symbol_tokens:
+            scheduler_kwargs["banned_token_mask"] = build_banned_token_mask(self.tokenizer)
+            print(f"Banned {int(scheduler_kwargs['banned_token_mask'].sum())} emoji/symbol tokens")
+        self.scheduler: InferenceBackend
+        if backend == "fake":
+            # 모델 없이 대기열/배치 동작만 흉내 내는 부하 테스트용 스케줄러
+            self.scheduler = FakeScheduler(self.model, self.tokenizer, self.device,
+                                           token_latency=fake_token_latency, prefill_latency=fake_prefill_latency,
+                                           **scheduler_kwargs)
+        elif num_replicas > 1:
+            # 가중치를 공유하는 워커 프로세스 N개에 나눠서 처리 (CPU 전용)
+            self.scheduler = ReplicaPool(self.model, self.tokenizer, self.device,
+                                         num_replicas=num_replicas, **scheduler_kwargs)
+        else:
+            self.scheduler = BatchScheduler(self.model, self.tokenizer, self.device, **scheduler_kwargs)
+        # 카테고리별 공통 앞부분의 KV를 미리 계산해 두면 요청마다 필드 부분만 prefill
+        for category in self.subject_map:
+            self.scheduler.warm_prefix(self.tokenizer(self.build_preamble(category)).input_ids,
+                                       adapter=self.adapter_for(category))
+        self.scheduler.start()
+
+        # 샘플링된 요청 로그 (프롬프트, 요청별 시간)
+        # 로그 스레드는 멀티 레플리카 워커를 fork한 뒤에 시작 (fork 때 다른 스레드가 잡은 lock은 워커에서 풀리지 않음)
+        self.request_log = RequestLogger(sample_rate=log_sample_rate)
+
+        # 자동완성 라우팅: 지정하지 않으면 블로그 생성과 같은 모델/스케줄러를 쓰고,
+        # "ngram:경로"면 글자 n-gram 모델, 그 외에는 별도로 불러온 작은 모델로 처리
+        self.autocomplete_ngram = None
+        self.autocomplete_tokenizer = self.tokenizer
+        self.autocomplete_scheduler = self.scheduler
+        self.autocomplete_eos_token_ids = self.default_eos_token_ids
+        if autocomplete_model and autocomplete_model.startswith("ngram:"):
+            self.autocomplete_ngram = CharNgramModel.load(autocomplete_model[len("ngram:"):])
+            print(f"Autocomplete: n-gram model with {len(self.autocomplete_ngram)} contexts")
+        elif autocomplete_model:
+            small_model, self.autocomplete_tokenizer = load_autocomplete_model(autocomplete_model, self.device)
+            self.autocomplete_eos_token_ids = default_eos_token_ids(small_model)
+            self.autocomplete_scheduler = BatchScheduler(
+                small_model, self.autocomplete_tokenizer, self.device,
+                max_batch_size=max_batch_size, max_queue_size=max_queue_size,
+                session_cache_bytes=session_cache_bytes, session_cache_int8=session_cache_int8,
+                interactive_reserved_slots=0,
+                banned_token_mask=build_banned_token_mask(self.autocomplete_tokenizer) if ban_symbol_tokens else None,
+            )
+            self.autocomplete_scheduler.start()
+
+        # 블로그 포스트 토큰 예산과 제한 시간(초, 0이면 없음), 자동완성 제한 시간
+        self.max_new_tokens = max_new_tokens
+        self.generation_deadline = generation_deadline or None
+        self.autocomplete_deadline = autocomplete_deadline or None
+
+        # 동일한 요청의 생성 결과 캐시 (opt-in, response_cache_size > 0일 때만)
+        self.response_cache = None
+        if response_cache_size > 0:
+            self.response_cache = ResponseCache(max_entries=response_cache_size, ttl_seconds=response_cache_ttl)
+
+        # 자동완성 추천 캐시 (greedy라 같은 입력이면 추천도 같음)
+        self.suggestion_cache = SuggestionCache()
+
+        # 세션별 (마지막 순번, 진행 중인 자동완성 요청) - 새 요청이 오면 이전 요청은 취소
+        self._autocomplete_latest = OrderedDict()
+        self._autocomplete_max_sessions = 4096
+
+    def adapter_for(self, category: str) -> Optional[str]:
+        """카테고리 전용 어댑터 이름 (없으면 None = 기본 어댑터)"""
+        return category if category in self.category_adapters else None
+
+    def register_adapter(self, category: str, adapter_path: str):
+        """
+        카테고리 전용 어댑터를 추가하거나 교체 (기본 모델은 다시 불러오지 않음)
+
+        로드는 디코딩 스텝 사이에 이뤄지고, 반환된 future가 끝난 뒤 들어온 요청부터 새 어댑터를 씁니다.
+        """
+        if category == "default":
+            raise ValueError("'default'는 기본 어댑터 이름이라 카테고리로 쓸 수 없습니다")
+
+        def on_loaded(future):
+            if future.exception() is None:
+                self.category_adapters[category] = adapter_path
+                # 이전 어댑터로 만든 글이 캐시에서 나가지 않도록 비움
+                if self.response_cache is not None:
+                    self.response_cache.clear()
+
+        future = self.scheduler.load_adapter(category, adapter_path)
+        future.add_done_callback(on_loaded)
+        return future
+
+    def build_preamble(self, category: str) -> str:
+        """모든 요청이 공유하는 카테고리별 프롬프트 앞부분"""
+        subject = self.subject_map.get(category, f"{category}에 대한 글을 쓸 예정입니다.")
+        return f"당신은 블로그를 포스팅하는 블로거입니다. {subject}"
+
+    def build_prompt(self, category: str, fields: dict, details: str) -> str:
+        """블로그 포스트 프롬프트 생성 (ipynb와 프롬프트 형식 통일)"""
         
         # 1. ipynb와 동일한 프롬프트 형식을 위한 필드 문자열 생성
         key_map = {
@@ -73,76 +209,311 @@ class BlogGenerator:
         
         field_str = "".join(field_parts)
 
-        # 2. 카테고리별 주제 문장 설정
-        subject_map = {
-            "카페": "카페에 대한 글을 쓸 예정입니다.",
-            "맛집": "맛집에 대한 글을 쓸 예정입니다.",
-            "리뷰": "제품 리뷰에 대한 글을 쓸 예정입니다."
-        }
-        subject = subject_map.get(category, f"{category}에 대한 글을 쓸 예정입니다.")
-        
-        # 3. 최종 프롬프트 조합 (ipynb와 완전 동일)
-        prompt = (
-            f"당신은 블로그를 포스팅하는 블로거입니다. {subject}"
+        # 2. 카테고리별 주제 문장(공통 앞부분) + 3. 최종 프롬프트 조합 (ipynb와 완전 동일)
+        # 프롬프트는 요청 로그(샘플링)에 남김
+        return (
+            self.build_preamble(category) +
             f"{field_str} 의 내용으로 블로그를 포스팅해주세요. "
             "이모지(👍💕..)나 특수기호($*#@)는 사용하지 마세요. "
             "최대한 길게 쓰세요. 최대한 사람처럼 쓰세요."
         )
 
-        # 디버깅을 위해 생성된 프롬프트 출력
-        print("\n" + "="*50)
-        print("Generated Prompt for Model:")
-        print(prompt)
-        print("="*50 + "\n")
+    def blog_sampling_params(self, seed: Optional[int] = None) -> SamplingParams:
+        """블로그 포스트 생성용 샘플링 설정"""
+        return SamplingParams(
+            max_new_tokens=self.max_new_tokens,
+            do_sample=True,
+            temperature=0.7,
+            top_p=0.9,
+            top_k=self.model.generation_config.top_k,
+            repetition_penalty=1.1,
+            eos_token_ids=(self.tokenizer.eos_token_id,),
+            seed=seed,
+            deadline_seconds=self.generation_deadline,
+        )
 
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
-        
-        with torch.no_grad():
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=1000,
-                do_sample=True,
-                temperature=0.7,
-                top_p=0.9,
-                repetition_penalty=1.1,
-                eos_token_id=self.tokenizer.eos_token_id,
-                pad_token_id=self.tokenizer.eos_token_id # pad_token을 eos_token으로 설정
-            )
-        
-        # 입력 프롬프트를 제외한 생성된 텍스트만 디코딩
-        generated_text = self.tokenizer.decode(
-            outputs[0],  # 전체 출력을 디코딩
-            skip_special_tokens=True
+    def _submit_prompt(self, prompt: str, category: str, params: SamplingParams, on_token=None):
+        started = time.perf_counter()
+        input_ids = self.tokenizer(prompt).input_ids
+        prefix_ids = self.tokenizer(self.build_preamble(category)).input_ids
+        tokenize_seconds = time.perf_counter() - started
+        request = self.scheduler.submit(input_ids, params, on_token=on_token, prefix_ids=prefix_ids,
+                                        adapter=self.adapter_for(category))
+        self._track(request, "blog", tokenize_seconds, prompt)
+        return request
+
+    def _track(self, request, kind: str, tokenize_seconds: float, prompt: str):
+        """요청이 끝나면 시간 지표를 기록하고, 샘플링된 요청은 프롬프트와 시간을 로그로 남김"""
+        sampled = self.request_log.sampled()
+        if sampled:
+            self.request_log.log("prompt", kind=kind, prompt=prompt)
+
+        def on_done(future):
+            if future.cancelled():
+                stop_reason = "cancelled"
+            elif future.exception() is not None:
+                stop_reason = "cancelled" if isinstance(future.exception(), RequestCancelled) else "error"
+            else:
+                stop_reason = request.stop_reason or "unknown"
+            timings = request.timings()
+            self.metrics.observe(kind, stop_reason, timings, tokenize_seconds)
+            if sampled:
+                self.request_log.log("request", kind=kind, stop_reason=stop_reason,
+                                     tokenize_seconds=tokenize_seconds, **(timings or {}))
+
+        request.future.add_done_callback(on_done)
+
+    def submit_blog_post(self, category: str, fields: dict, details: str, on_token=None, seed: Optional[int] = None):
+        """블로그 포스트 생성 요청을 스케줄러에 제출 (결과는 request.future)"""
+        prompt = self.build_prompt(category, fields, details)
+        return self._submit_prompt(prompt, category, self.blog_sampling_params(seed), on_token=on_token)
+
+    def decode_output(self, output_ids: list) -> str:
+        """생성된 토큰만 디코딩 (입력 프롬프트 제외)"""
+        return self.tokenizer.decode(output_ids, skip_special_tokens=True).strip()
+
+    def generate_blog_post(self, category: str, fields: dict, details: str, seed: Optional[int] = None) -> str:
+        """블로그 포스트 생성 (완료될 때까지 대기)"""
+        request = self.submit_blog_post(category, fields, details, seed=seed)
+        return self.decode_output(request.future.result())
+
+    async def agenerate_blog_post(self, category: str, fields: dict, details: str, is_disconnected=None,
+                                  seed: Optional[int] = None) -> str:
+        """
+        블로그 포스트 생성 (이벤트 루프를 막지 않고 대기)
+
+        is_disconnected(async 함수, 예: request.is_disconnected)를 주면
+        클라이언트가 떠났을 때 생성을 중단하고 RequestCancelled가 발생합니다.
+        결과 캐시가 켜져 있으면 같은 요청은 캐시된 결과나 진행 중인 생성을 공유합니다.
+        """
+        prompt = self.build_prompt(category, fields, details)
+        params = self.blog_sampling_params(seed)
+
+        truncated = False
+
+        async def generate():
+            nonlocal truncated
+            request = self._submit_prompt(prompt, category, params)
+            async with cancel_on_disconnect(request, is_disconnected):
+                output_ids = await asyncio.wrap_future(request.future)
+            truncated = request.stop_reason == "deadline"
+            return self.decode_output(output_ids)
+
+        if self.response_cache is None:
+            return await generate()
+        key = ResponseCache.make_key(prompt, params)
+        text = await self.response_cache.get_or_generate(key, generate)
+        if truncated:
+            # 제한 시간에 걸려 중간에 끊긴 글은 캐시에 남기지 않음
+            self.response_cache.discard(key)
+        return text
+
+    def stream_blog_post(self, category: str, fields: dict, details: str, is_disconnected=None,
+                         seed: Optional[int] = None):
+        """
+        블로그 포스트 스트리밍 생성
+
+        요청은 바로 제출되고(대기열이 가득 차면 여기서 QueueFullError, KV 메모리 예산보다 크면 RequestTooLarge),
+        텍스트 조각은 반환된 async iterator로 받습니다. 멀티 레플리카에서는 워커의 우선순위별 대기열이
+        가득 찬 경우의 QueueFullError가 첫 조각 대신 iterator에서 발생할 수 있습니다.
+        스트림을 끝까지 읽지 않고 닫거나 클라이언트가 떠나면 생성도 중단됩니다.
+        결과 캐시에 있으면 저장된 글을 한 번에 돌려주고, 없으면 끝까지 생성된 글을 저장합니다.
+        """
+        prompt = self.build_prompt(category, fields, details)
+        params = self.blog_sampling_params(seed)
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = ResponseCache.make_key(prompt, params)
+            cached = self.response_cache.lookup(cache_key)
+            if cached is not None:
+                return self._iter_cached(cached)
+
+        stream = TokenStream()
+        request = self._submit_prompt(prompt, category, params, on_token=stream.put)
+        stream.attach(request.future)
+        return self._iter_text(stream, request, is_disconnected, cache_key)
+
+    async def _iter_cached(self, text: str):
+        yield text
+
+    async def _iter_text(self, stream: TokenStream, request, is_disconnected=None, cache_key: Optional[str] = None):
+        detokenizer = IncrementalDetokenizer(self.tokenizer)
+        started = False
+        pieces = []
+        try:
+            async with cancel_on_disconnect(request, is_disconnected):
+                async for token_id in stream:
+                    text = detokenizer.push(token_id)
+                    if not started:
+                        # 비스트리밍 결과(strip)와 맞추기 위해 앞쪽 공백은 버림
+                        text = text.lstrip()
+                        started = bool(text)
+                    if text:
+                        pieces.append(text)
+                        yield text
+            if cache_key is not None and request.stop_reason != "deadline":
+                self.response_cache.put(cache_key, "".join(pieces).rstrip())
+        finally:
+            # 읽는 쪽이 중간에 그만두면(연결 끊김 등) 남은 생성도 취소
+            if not request.future.done():
+                request.cancel()
+
+    def submit_autocomplete(self, prompt: str, session_id: Optional[str] = None):
+        """
+        자동완성 요청을 스케줄러에 제출 (짧고 빠른 추천을 위해 greedy 최대 20토큰, 줄바꿈이 나오면 종료)
+
+        session_id가 있으면 같은 세션의 직전 입력과 겹치는 부분의 KV를 재사용하므로
+        새로 입력한 부분만 prefill합니다. 블로그 포스트 생성보다 먼저 처리됩니다.
+        자동완성 전용 모델이 설정되어 있으면 그 모델의 스케줄러로 보냅니다.
+        """
+        started = time.perf_counter()
+        input_ids = self.autocomplete_tokenizer(prompt).input_ids
+        tokenize_seconds = time.perf_counter() - started
+        params = SamplingParams(
+            max_new_tokens=20,
+            do_sample=False,
+            repetition_penalty=1.05,
+            eos_token_ids=self.autocomplete_eos_token_ids,
+            stop_strings=("\n",),
+            deadline_seconds=self.autocomplete_deadline,
         )
-        
-        # 프롬프트 부분을 결과에서 제거
-        return generated_text[len(prompt):].strip()
+        request = self.autocomplete_scheduler.submit(input_ids, params, session_id=session_id,
+                                                     priority=PRIORITY_INTERACTIVE)
+        self._track(request, "autocomplete", tokenize_seconds, prompt)
+        return request
+
+    async def autocomplete(self, prompt: str, session_id: Optional[str] = None, seq: Optional[int] = None) -> str:
+        """
+        입력 중인 텍스트 뒤에 이어질 한 줄 추천
+
+        같은 세션에서 더 새로운 요청(seq가 더 큰 요청)이 오면 이전 요청은 대기 중이든
+        생성 중이든 취소되고 RequestCancelled가 발생합니다. 늦게 도착한 오래된 요청은
+        제출하지 않고 바로 취소합니다.
+        """
+        if self.autocomplete_ngram is not None:
+            # n-gram 모델은 dict 조회뿐이라 대기열 없이 바로 응답
+            return self.autocomplete_ngram.complete(prompt)
+
+        if session_id is not None:
+            latest = self._autocomplete_latest.get(session_id)
+            if latest is not None:
+                latest_seq, previous = latest
+                if seq is not None and latest_seq is not None and seq <= latest_seq:
+                    raise RequestCancelled("더 새로운 자동완성 요청이 있습니다")
+                if previous is not None:
+                    previous.cancel()
+                    self._autocomplete_latest[session_id] = (seq, None)
+
+        # 같은 입력이나 이전 추천을 따라 친 입력이면 모델 없이 바로 응답
+        cached = self.suggestion_cache.lookup(prompt)
+        if cached is not None:
+            if session_id is not None:
+                self._autocomplete_latest[session_id] = (seq, None)
+                self._autocomplete_latest.move_to_end(session_id)
+            return cached
+
+        request = self.submit_autocomplete(prompt, session_id)
+        if session_id is not None:
+            self._autocomplete_latest[session_id] = (seq, request)
+            self._autocomplete_latest.move_to_end(session_id)
+            while len(self._autocomplete_latest) > self._autocomplete_max_sessions:
+                self._autocomplete_latest.popitem(last=False)
+
+        try:
+            output_ids = await asyncio.wrap_future(request.future)
+        except asyncio.CancelledError:
+            # 대기열에서 취소된 경우 (future.cancel)
+            if request.cancelled:
+                raise RequestCancelled("더 새로운 자동완성 요청이 있습니다")
+            raise
+        finally:
+            latest = self._autocomplete_latest.get(session_id)
+            if latest is not None and latest[1] is request:
+                self._autocomplete_latest[session_id] = (seq, None)
+
+        completion = self.autocomplete_tokenizer.decode(output_ids, skip_special_tokens=True)
+        # 줄바꿈 이전의 첫번째 라인만 반환 (줄바꿈이 나온 토큰에 뒷부분이 붙어 있을 수 있음)
+        suggestion = completion.split("\n")[0].strip()
+        if request.stop_reason != "deadline":
+            self.suggestion_cache.put(prompt, suggestion)
+        return suggestion
+
+    def cancel_autocomplete(self, session_id: str):
+        """세션에서 대기 중이거나 생성 중인 자동완성 요청을 취소 (입력이 바뀌어 결과가 필요 없어졌을 때)"""
+        latest = self._autocomplete_latest.get(session_id)
+        if latest is not None and latest[1] is not None:
+            latest[1].cancel()
+            self._autocomplete_latest[session_id] = (latest[0], None)
 
 # 전역 모델 인스턴스
 blog_generator = None
+# 비동기 작업(/jobs) 실행기
+job_runner = None
+
+def create_blog_generator() -> BlogGenerator:
+    """config.py 설정으로 BlogGenerator 생성 (서버와 batch_generate.py가 같이 사용)"""
+    # 모델 경로와 서버 설정은 config.py (환경 변수로 덮어쓰기 가능)
+    return BlogGenerator(
+        base_model_name=config.BASE_MODEL_NAME,
+        adapter_path=config.ADAPTER_PATH,
+        max_batch_size=config.MAX_BATCH_SIZE,
+        max_queue_size=config.MAX_QUEUE_SIZE,
+        session_cache_bytes=config.SESSION_CACHE_BYTES,
+        response_cache_size=config.RESPONSE_CACHE_SIZE,
+        response_cache_ttl=config.RESPONSE_CACHE_TTL,
+        speculative_tokens=config.SPECULATIVE_TOKENS,
+        prompt_lookup_ngram=config.PROMPT_LOOKUP_NGRAM,
+        backend=config.BACKEND,
+        cpu_threads=config.CPU_THREADS,
+        cpu_quantize=config.CPU_QUANTIZE,
+        merged_model_path=config.MERGED_MODEL_PATH,
+        num_replicas=config.NUM_REPLICAS,
+        category_adapters=config.CATEGORY_ADAPTERS,
+        interactive_reserved_slots=config.INTERACTIVE_RESERVED_SLOTS,
+        autocomplete_model=config.AUTOCOMPLETE_MODEL,
+        max_new_tokens=config.MAX_NEW_TOKENS,
+        generation_deadline=config.GENERATION_DEADLINE,
+        autocomplete_deadline=config.AUTOCOMPLETE_DEADLINE,
+        log_sample_rate=config.LOG_SAMPLE_RATE,
+        fake_token_latency=config.FAKE_TOKEN_LATENCY,
+        fake_prefill_latency=config.FAKE_PREFILL_LATENCY,
+        ban_symbol_tokens=config.BAN_SYMBOL_TOKENS,
+        kv_cache_bytes=config.KV_CACHE_BYTES,
+        kv_block_tokens=config.KV_BLOCK_TOKENS,
+        session_cache_int8=config.SESSION_CACHE_INT8,
+        compile_decode=config.COMPILE_DECODE,
+        static_cache_buckets=config.STATIC_CACHE_BUCKETS,
+    )
 
 @app.on_event("startup")
 async def startup_event():
-    global blog_generator
-    base_model_name = "google/gemma-3-4b-it"
-    # makeweb/main.py 기준 상대 경로 수정
-    adapter_path = "../gemma3-4b-blog-qlora" 
-    blog_generator = BlogGenerator(base_model_name=base_model_name, adapter_path=adapter_path)
+    global blog_generator, job_runner
+    blog_generator = create_blog_generator()
+    # 서버가 꺼져 있는 동안 남은 작업도 이어서 처리
+    job_runner = JobRunner(JobStore(config.JOB_DB_PATH), blog_generator,
+                           concurrency=config.JOB_CONCURRENCY, retention_seconds=config.JOB_RETENTION)
+    job_runner.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if job_runner is not None:
+        await job_runner.stop()
+        job_runner.store.close()
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """메인 페이지"""
     return templates.TemplateResponse("index.html", {"request": request})
 
-@app.post("/generate")
-async def generate_blog(
-    request: Request,
+def blog_form(
     category: str = Form(...),
     details: str = Form(...),
     cafe_taste: Optional[str] = Form(None), cafe_view: Optional[str] = Form(None), cafe_price: Optional[str] = Form(None), cafe_atmosphere: Optional[str] = Form(None), cafe_store_name: Optional[str] = Form(None),
     restaurant_taste: Optional[str] = Form(None), restaurant_food_type: Optional[str] = Form(None), restaurant_rating: Optional[str] = Form(None), restaurant_price: Optional[str] = Form(None), restaurant_store_name: Optional[str] = Form(None),
-    review_category: Optional[str] = Form(None), review_rating: Optional[str] = Form(None), review_price: Optional[str] = Form(None), review_purpose: Optional[str] = Form(None), review_product_name: Optional[str] = Form(None)
+    review_category: Optional[str] = Form(None), review_rating: Optional[str] = Form(None), review_price: Optional[str] = Form(None), review_purpose: Optional[str] = Form(None), review_product_name: Optional[str] = Form(None),
+    seed: Optional[int] = Form(None)
 ):
+    """/generate 계열 폼 입력을 (category, fields, details, seed)로 정리"""
     fields = {}
     if category == "카페":
         fields = {"taste": cafe_taste, "view": cafe_view, "price": cafe_price, "atmosphere": cafe_atmosphere, "store_name": cafe_store_name}
@@ -150,44 +521,257 @@ async def generate_blog(
         fields = {"taste": restaurant_taste, "food_type": restaurant_food_type, "rating": restaurant_rating, "price": restaurant_price, "store_name": restaurant_store_name}
     else:
         fields = {"category": review_category, "rating": review_rating, "price": review_price, "purpose": review_purpose, "product_name": review_product_name}
-    
+    return category, fields, details, seed
+
+def overloaded_response(error: QueueFullError) -> JSONResponse:
+    """대기열이 가득 찼을 때의 503 응답 (잠시 후 재시도 안내)"""
+    return JSONResponse(status_code=503, content={"success": False, "error": str(error)}, headers={"Retry-After": "1"})
+
+def too_large_response(error: RequestTooLarge) -> JSONResponse:
+    """KV 캐시 메모리 예산보다 큰 요청의 413 응답 (다시 보내도 처리할 수 없음)"""
+    return JSONResponse(status_code=413, content={"success": False, "error": str(error)})
+
+@app.get("/queue_status")
+async def queue_status():
+    """추론 대기열 상태 (대기 중 / 처리 중 요청 수)"""
+    stats = blog_generator.scheduler.stats()
+    if blog_generator.autocomplete_scheduler is not blog_generator.scheduler:
+        stats["autocomplete"] = blog_generator.autocomplete_scheduler.stats()
+    stats["jobs"] = job_runner.stats()
+    return stats
+
+def hit_ratio(hits: int, misses: int) -> Optional[float]:
+    return hits / (hits + misses) if hits + misses else None
+
+def scheduler_cache_counts(scheduler_stats: list, cache: str) -> tuple:
+    """스케줄러들(레플리카면 모든 워커)의 prefix_cache / session_cache 히트, 미스 수 합계"""
+    workers = [worker for stats in scheduler_stats for worker in stats.get("workers", [stats])]
+    hits = sum(worker.get(cache, {}).get("hits", 0) for worker in workers)
+    misses = sum(worker.get(cache, {}).get("misses", 0) for worker in workers)
+    return hits, misses
+
+def scheduler_kv_bytes(scheduler_stats: list) -> float:
+    """스케줄러들(레플리카면 모든 워커)의 배치 + 세션 KV 캐시 바이트 합계 (배치는 예산을 켰을 때만)"""
+    workers = [worker for stats in scheduler_stats for worker in stats.get("workers", [stats])]
+    kv_stats = [worker.get("kv_cache", {}) for worker in workers]
+    return sum((kv.get("batch_bytes") or 0) + kv.get("session_bytes", 0) for kv in kv_stats)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 텍스트 형식 지표 (요청별 시간 히스토그램 + 대기열/캐시/메모리 게이지)"""
+    schedulers = [blog_generator.scheduler]
+    if blog_generator.autocomplete_scheduler is not blog_generator.scheduler:
+        schedulers.append(blog_generator.autocomplete_scheduler)
+    scheduler_stats = [scheduler.stats() for scheduler in schedulers]
+    response_cache = blog_generator.response_cache
+    suggestion_cache = blog_generator.suggestion_cache
+    gauges = {
+        "blog_queue_depth": ("배치에 들어가지 못하고 기다리는 요청 수",
+                             sum(scheduler.queue_depth for scheduler in schedulers)),
+        "blog_active_requests": ("디코딩 중인 요청 수", sum(scheduler.active_count for scheduler in schedulers)),
+        "blog_prefix_cache_hit_ratio": ("카테고리 프롬프트 앞부분 KV 캐시 히트율",
+                                        hit_ratio(*scheduler_cache_counts(scheduler_stats, "prefix_cache"))),
+        "blog_session_cache_hit_ratio": ("자동완성 세션 KV 캐시 히트율",
+                                         hit_ratio(*scheduler_cache_counts(scheduler_stats, "session_cache"))),
+        "blog_response_cache_hit_ratio": ("/generate 결과 캐시 히트율",
+                                          hit_ratio(response_cache.hits, response_cache.misses)
+                                          if response_cache is not None else None),
+        "blog_suggestion_cache_hit_ratio": ("자동완성 추천 캐시 히트율",
+                                            hit_ratio(suggestion_cache.hits + suggestion_cache.partial_hits,
+                                                      suggestion_cache.misses)),
+        "blog_model_weight_bytes": ("모델 가중치 메모리", blog_generator.model_bytes),
+        "blog_kv_cache_bytes": ("배치 KV 캐시(예산 기준 추정) + 세션 KV 캐시 메모리",
+                                scheduler_kv_bytes(scheduler_stats)),
+        "blog_cuda_memory_allocated_bytes": ("CUDA 할당 메모리", torch.cuda.memory_allocated()
+                                             if blog_generator.device.type == "cuda" else None),
+        "process_resident_memory_bytes": ("서버 프로세스 RSS", process_resident_memory_bytes()),
+        "blog_jobs_queued": ("대기 중인 비동기 작업 수", job_runner.store.counts().get("queued", 0)
+                             if job_runner is not None else None),
+    }
+    return PlainTextResponse(blog_generator.metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache_status")
+async def cache_status():
+    """결과 캐시 상태 (/generate 결과 캐시, 자동완성 추천 캐시의 히트/미스 횟수 등)"""
+    response_cache = {"enabled": False}
+    if blog_generator.response_cache is not None:
+        response_cache = {"enabled": True, **blog_generator.response_cache.stats()}
+    return {"response_cache": response_cache, "suggestion_cache": blog_generator.suggestion_cache.stats()}
+
+@app.post("/generate")
+async def generate_blog(request: Request, form: tuple = Depends(blog_form)):
+    category, fields, details, seed = form
     try:
-        generated_post = blog_generator.generate_blog_post(category, fields, details)
+        generated_post = await blog_generator.agenerate_blog_post(
+            category, fields, details, is_disconnected=request.is_disconnected, seed=seed
+        )
         return {"success": True, "generated_post": generated_post, "category": category, "fields": fields, "details": details}
+    except RequestCancelled as e:
+        return {"success": False, "cancelled": True, "error": str(e)}
+    except QueueFullError as e:
+        return overloaded_response(e)
+    except RequestTooLarge as e:
+        return too_large_response(e)
     except Exception as e:
         traceback.print_exc()
         return {"success": False, "error": str(e)}
 
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Server-Sent Events 형식의 메시지 한 개"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/generate_stream")
+async def generate_blog_stream(request: Request, form: tuple = Depends(blog_form)):
+    """블로그 포스트를 생성되는 대로 SSE로 전송"""
+    category, fields, details, seed = form
+    try:
+        text_stream = blog_generator.stream_blog_post(
+            category, fields, details, is_disconnected=request.is_disconnected, seed=seed
+        )
+    except QueueFullError as e:
+        return overloaded_response(e)
+    except RequestTooLarge as e:
+        return too_large_response(e)
+
+    async def event_stream():
+        try:
+            async for text in text_stream:
+                yield sse_event({"text": text})
+            yield sse_event({"success": True}, event="done")
+        except RequestCancelled:
+            # 클라이언트가 이미 떠난 경우라 보낼 곳이 없음
+            return
+        except QueueFullError as e:
+            # 멀티 레플리카에서 워커 대기열이 찬 경우는 응답을 시작한 뒤에 알게 되므로 상태 코드를 이벤트로 전달
+            yield sse_event({"success": False, "error": str(e), "status": 503}, event="error")
+        except Exception as e:
+            traceback.print_exc()
+            yield sse_event({"success": False, "error": str(e)}, event="error")
+        finally:
+            # 응답이 중간에 끊겨도 남은 생성이 취소되도록 스트림을 닫음
+            await text_stream.aclose()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/generate_batch")
+async def generate_blog_batch(request: Request):
+    """
+    JSONL 본문({"category", "fields", "details"} 한 줄에 하나, 선택: "id", "seed")을 한꺼번에 생성
+
+    요청들을 동시에 스케줄러에 넣어 배치를 채우고, 끝나는 순서대로 결과를 JSONL로 스트리밍합니다.
+    결과 줄의 index는 입력 줄 번호입니다. 연결이 끊기면 남은 생성도 취소됩니다.
+    """
+    body = (await request.body()).decode("utf-8")
+    records = parse_records(body.splitlines())
+    concurrency = default_concurrency(blog_generator.scheduler)
+
+    async def result_lines():
+        results = generate_batch(blog_generator, records, concurrency, is_disconnected=request.is_disconnected)
+        try:
+            async for result in results:
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            await results.aclose()
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+@app.post("/jobs")
+async def create_job(form: tuple = Depends(blog_form)):
+    """블로그 포스트 생성 작업을 등록하고 작업 id를 바로 반환 (결과는 GET /jobs/{job_id} 또는 WebSocket으로)"""
+    category, fields, details, seed = form
+    job = job_runner.submit(category, fields, details, seed=seed)
+    return {"success": True, "job_id": job["job_id"], "status": job["status"], "queue_position": job["queue_position"]}
+
+def job_not_found(job_id: str) -> JSONResponse:
+    return JSONResponse(status_code=404, content={"success": False, "error": f"작업 '{job_id}'을 찾을 수 없습니다"})
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """작업 상태 조회 (끝나면 result, 실패하면 error, 생성 중이면 지금까지의 partial 포함)"""
+    job = job_runner.get(job_id)
+    if job is None:
+        return job_not_found(job_id)
+    return {"success": True, **job}
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """대기 중이거나 생성 중인 작업 취소"""
+    job = job_runner.get(job_id)
+    if job is None:
+        return job_not_found(job_id)
+    cancelled = job_runner.cancel(job_id)
+    return {"success": cancelled, "job_id": job_id, "status": job_runner.get(job_id)["status"]}
+
+@app.websocket("/jobs/{job_id}/ws")
+async def job_events(websocket: WebSocket, job_id: str):
+    """
+    작업 진행 상황을 WebSocket으로 전송
+
+    처음에 {"type": "status"}(지금까지 생성된 텍스트 포함)를 보내고, 생성 중에는
+    {"type": "delta", "text"}, 끝나면 {"type": "done", "result"} / "error" / "cancelled"를 보낸 뒤 닫습니다.
+    이미 끝난 작업이면 마지막 이벤트만 보냅니다. 연결이 끊겨도 작업은 계속 진행됩니다.
+    """
+    await websocket.accept()
+    events, partial = job_runner.subscribe(job_id)
+    try:
+        job = job_runner.store.get(job_id)
+        if job is None:
+            await websocket.send_json({"type": "error", "error": f"작업 '{job_id}'을 찾을 수 없습니다"})
+        elif job["status"] in FINISHED_STATES:
+            await websocket.send_json(finished_event(job))
+        else:
+            await websocket.send_json({"type": "status", "status": job["status"], "partial": partial})
+            while True:
+                event = await events.get()
+                await websocket.send_json(event)
+                if event["type"] != "delta":
+                    break
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        job_runner.unsubscribe(job_id, events)
+
 class AutocompleteRequest(BaseModel):
     prompt: str
+    session_id: Optional[str] = None  # 같은 입력창의 연속 요청 간 KV 재사용용
+    seq: Optional[int] = None  # 세션 내 요청 순번 (더 새로운 요청이 오면 이전 요청은 취소)
 
 @app.post("/text_autocomplete")
 async def text_autocomplete(req: AutocompleteRequest):
     """실시간 텍스트 자동완성을 처리합니다."""
     try:
-        prompt = req.prompt
-        inputs = blog_generator.tokenizer(prompt, return_tensors="pt").to(blog_generator.device)
-
-        with torch.no_grad():
-            outputs = blog_generator.model.generate(
-                **inputs,
-                max_new_tokens=20,  # 짧고 빠른 추천을 위해
-                do_sample=False,
-                temperature=0.0,
-                repetition_penalty=1.05,
-                pad_token_id=blog_generator.tokenizer.eos_token_id
-            )
-        
-        full_text = blog_generator.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        completion = full_text[len(prompt):]
-        # 줄바꿈 이전의 첫번째 라인만 반환
-        suggestion = completion.split("\n")[0].strip()
-
+        suggestion = await blog_generator.autocomplete(req.prompt, req.session_id, req.seq)
         return {"success": True, "suggestion": suggestion}
+    except RequestCancelled as e:
+        return {"success": False, "cancelled": True, "error": str(e)}
+    except QueueFullError as e:
+        return overloaded_response(e)
+    except RequestTooLarge as e:
+        return too_large_response(e)
     except Exception as e:
         # traceback.print_exc() # 상세 오류 로깅이 필요할 때 주석 해제
         return {"success": False, "error": str(e)}
 
+@app.websocket("/text_autocomplete/ws")
+async def text_autocomplete_ws(websocket: WebSocket):
+    """
+    WebSocket 자동완성 (메시지 형식은 autocomplete_session.py 참고)
+
+    클라이언트는 입력창의 편집(삽입/삭제 위치와 내용)만 보내고, 서버가 연결별로 텍스트를 유지하다가
+    입력이 멈추면 추천을 보냅니다. 요청마다 전체 텍스트와 HTTP 요청을 새로 보내지 않아도 됩니다.
+    """
+    await websocket.accept()
+    session = AutocompleteSession(blog_generator, websocket.send_json, debounce=config.AUTOCOMPLETE_DEBOUNCE)
+    try:
+        while True:
+            await session.receive(await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.close()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
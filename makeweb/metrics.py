@@ -0,0 +1,191 @@
+"""
+추론 지표와 요청 로그
+
+요청마다 대기 시간, 토크나이즈, prefill, 첫 토큰까지의 시간(TTFT), 디코딩 속도, 전체 지연을 모아
+Prometheus 텍스트 형식(GET /metrics)으로 내보냅니다. prometheus_client 없이 필요한 만큼만 직접 구현했습니다.
+
+요청 로그(프롬프트, 요청별 시간)는 샘플링해서 일부만 남기고, 실제 출력은 별도 스레드(QueueListener)가
+하므로 요청을 처리하는 스레드는 로그 출력 때문에 멈추지 않습니다.
+"""
+
+import json
+import logging
+import logging.handlers
+import math
+import os
+import queue
+import random
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# 초 단위 지연 구간 (자동완성 수십 ms ~ CPU 블로그 포스트 수 분)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# 디코딩 속도 구간 (토큰/초)
+RATE_BUCKETS = (1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Histogram:
+    """라벨별 누적 히스토그램 (여러 스레드에서 observe해도 됨)"""
+
+    def __init__(self, name: str, documentation: str, buckets: Iterable[float], labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.labels = labels
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labels, label_values, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class CounterMetric:
+    """라벨별 누적 카운터"""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *label_values: str):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+def render_gauges(gauges: Dict[str, Tuple[str, Optional[float]]]) -> List[str]:
+    """{이름: (설명, 값)} 게이지 (값이 None이면 생략)"""
+    lines = []
+    for name, (documentation, value) in gauges.items():
+        if value is None:
+            continue
+        lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {_format_value(value)}"]
+    return lines
+
+
+def process_resident_memory_bytes() -> Optional[float]:
+    """현재 프로세스의 RSS (/proc이 없는 환경이면 None)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class InferenceMetrics:
+    """요청 종류(kind: blog / autocomplete)별 추론 지표"""
+
+    def __init__(self):
+        labels = ("kind",)
+        self.tokenize_seconds = Histogram(
+            "blog_tokenize_seconds", "프롬프트 토크나이즈 시간", LATENCY_BUCKETS, labels)
+        self.queue_wait_seconds = Histogram(
+            "blog_queue_wait_seconds", "제출부터 배치에 들어가기까지 대기 시간", LATENCY_BUCKETS, labels)
+        self.prefill_seconds = Histogram(
+            "blog_prefill_seconds", "프롬프트 prefill 시간", LATENCY_BUCKETS, labels)
+        self.time_to_first_token_seconds = Histogram(
+            "blog_time_to_first_token_seconds", "제출부터 첫 토큰까지 시간 (TTFT)", LATENCY_BUCKETS, labels)
+        self.decode_tokens_per_second = Histogram(
+            "blog_decode_tokens_per_second", "첫 토큰 이후 요청별 디코딩 속도", RATE_BUCKETS, labels)
+        self.request_latency_seconds = Histogram(
+            "blog_request_latency_seconds", "제출부터 생성 완료까지 전체 시간", LATENCY_BUCKETS, labels)
+        self.requests_total = CounterMetric(
+            "blog_requests_total", "끝난 요청 수 (stop_reason: eos/stop/length/deadline/cancelled/error)",
+            ("kind", "stop_reason"))
+        self.generated_tokens_total = CounterMetric("blog_generated_tokens_total", "생성한 토큰 수", labels)
+
+    def observe(self, kind: str, stop_reason: str, timings: Optional[dict], tokenize_seconds: float):
+        """끝난 요청 하나의 시간 기록 (timings는 GenerationRequest.timings())"""
+        self.requests_total.inc(1, kind, stop_reason)
+        self.tokenize_seconds.observe(tokenize_seconds, kind)
+        if not timings:
+            return
+        for name in ("queue_wait_seconds", "prefill_seconds", "time_to_first_token_seconds",
+                     "decode_tokens_per_second"):
+            if timings.get(name) is not None:
+                getattr(self, name).observe(timings[name], kind)
+        self.request_latency_seconds.observe(timings["total_seconds"], kind)
+        self.generated_tokens_total.inc(timings["output_tokens"], kind)
+
+    def render(self, gauges: Dict[str, Tuple[str, Optional[float]]]) -> str:
+        lines = []
+        for metric in (self.requests_total, self.generated_tokens_total, self.tokenize_seconds,
+                       self.queue_wait_seconds, self.prefill_seconds, self.time_to_first_token_seconds,
+                       self.decode_tokens_per_second, self.request_latency_seconds):
+            lines += metric.render()
+        lines += render_gauges(gauges)
+        return "\n".join(lines) + "\n"
+
+
+class RequestLogger:
+    """
+    샘플링 + 비동기 요청 로그
+
+    sample_rate 비율의 요청만 기록하고, 기록은 큐에 넣기만 한 뒤 별도 스레드가 stderr로 출력합니다.
+    """
+
+    def __init__(self, sample_rate: float = 0.01, name: str = "blog.requests"):
+        self.sample_rate = sample_rate
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        records: "queue.SimpleQueue" = queue.SimpleQueue()
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        self.logger.handlers = [logging.handlers.QueueHandler(records)]
+        self._listener = logging.handlers.QueueListener(records, handler)
+        self._listener.start()
+
+    def sampled(self) -> bool:
+        """이번 요청을 기록할지 (요청마다 한 번 정해서 프롬프트와 시간 로그를 같이 남김)"""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def log(self, event: str, **fields):
+        self.logger.info("%s %s", event, json.dumps(fields, ensure_ascii=False, default=str))
+
+    def stop(self):
+        self._listener.stop()
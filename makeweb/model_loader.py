@@ -0,0 +1,286 @@
+"""
+모델 로더
+
+실행 환경에 따라 두 가지 방식으로 기본 모델 + QLoRA 어댑터를 불러옵니다.
+
+- cuda: bitsandbytes 4-bit NF4로 기본 모델을 올리고 어댑터를 얹음 (기존 방식)
+- cpu: bitsandbytes 없이 float32로 불러와 어댑터를 병합한 뒤 Linear 레이어를 int8 동적 양자화
+- fake: 모델 없이 서버를 돌려 보는 부하 테스트용 가짜 모델 (fake_backend.py)
+
+어댑터를 미리 병합해 하나의 safetensors 파일로 내보내 두면(export_merged.py),
+서버 시작 시에는 그 파일을 메모리 매핑(mmap)해서 바로 가중치로 씁니다.
+"""
+
+import json
+import mmap
+import os
+from typing import Dict, Optional, Tuple
+
+import torch
+from peft import PeftModel
+from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer, GenerationConfig
+from transformers.modeling_utils import no_init_weights
+
+from fake_backend import load_fake_model
+
+BACKENDS = ("auto", "cuda", "cpu", "fake")
+MERGED_WEIGHTS_NAME = "model.safetensors"
+
+# safetensors 헤더의 dtype 문자열 -> torch dtype
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+    "U8": torch.uint8, "BOOL": torch.bool,
+}
+
+
+def resolve_backend(backend: str = "auto") -> str:
+    """auto면 CUDA가 있을 때 cuda, 없으면 cpu를 선택"""
+    if backend not in BACKENDS:
+        raise ValueError(f"지원하지 않는 backend입니다: {backend} (가능한 값: {', '.join(BACKENDS)})")
+    if backend == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    if backend == "cuda" and not torch.cuda.is_available():
+        raise RuntimeError("backend=cuda 이지만 사용할 수 있는 GPU가 없습니다")
+    return backend
+
+
+def configure_cpu_threads(num_threads: int = 0) -> int:
+    """
+    CPU 추론 스레드 수 설정 (0이면 이 프로세스가 쓸 수 있는 코어 수)
+
+    연산 내부 병렬화(intra-op)만 쓰고 연산 간 병렬화(inter-op)는 1로 줄여
+    디코딩처럼 작은 연산이 이어지는 작업에서 스레드 경합을 줄입니다.
+    """
+    if num_threads <= 0:
+        try:
+            num_threads = len(os.sched_getaffinity(0))
+        except AttributeError:
+            num_threads = os.cpu_count() or 1
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # 이미 병렬 작업이 시작된 뒤에는 바꿀 수 없음
+        pass
+    return num_threads
+
+
+def load_tokenizer(adapter_path: str, model=None):
+    # 토크나이저를 어댑터 경로에서 로드해야 합니다.
+    tokenizer = AutoTokenizer.from_pretrained(adapter_path)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+        if model is not None:
+            model.config.pad_token_id = model.config.eos_token_id
+    return tokenizer
+
+
+def load_cuda_model(base_model_name: str, adapter_path: str):
+    """GPU용: 4-bit NF4 기본 모델 + QLoRA 어댑터"""
+    from transformers import BitsAndBytesConfig
+
+    # 계산 데이터 타입을 bfloat16으로 통일하여 안정성 확보
+    bnb_config = BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_quant_type="nf4",
+        bnb_4bit_compute_dtype=torch.bfloat16,
+        bnb_4bit_use_double_quant=True,
+    )
+
+    # 기본 모델 로드
+    base_model = AutoModelForCausalLM.from_pretrained(
+        base_model_name,
+        quantization_config=bnb_config,
+        device_map="auto",
+        torch_dtype=torch.bfloat16 # 모델 기본 타입도 명시적으로 bfloat16 사용
+    )
+    tokenizer = load_tokenizer(adapter_path, base_model)
+
+    print(f"Loading QLoRA adapter from '{adapter_path}'...")
+    model = PeftModel.from_pretrained(base_model, adapter_path)
+    return model, tokenizer
+
+
+def load_cpu_model(base_model_name: str, adapter_path: str, quantize: bool = True, merge: bool = True):
+    """
+    CPU용: 어댑터를 기본 모델에 병합하고 int8 동적 양자화
+
+    어댑터를 병합해 두면 디코딩 스텝마다 LoRA 행렬을 따로 곱하지 않아도 되고,
+    동적 양자화는 가중치를 int8로 저장해 메모리 대역폭(디코딩 속도의 병목)을 약 1/4로 줄입니다.
+    merge=False(카테고리별 어댑터를 함께 쓰는 경우)면 PeftModel을 그대로 두고, PEFT의 LoRA 레이어는
+    양자화된 Linear를 감쌀 수 없으므로 양자화도 하지 않습니다.
+    """
+    base_model = AutoModelForCausalLM.from_pretrained(
+        base_model_name,
+        torch_dtype=torch.float32,  # 동적 양자화는 float32 Linear를 대상으로 함
+        low_cpu_mem_usage=True,
+    )
+    tokenizer = load_tokenizer(adapter_path, base_model)
+
+    if not merge:
+        print(f"Loading QLoRA adapter from '{adapter_path}' (not merged, no quantization)...")
+        return PeftModel.from_pretrained(base_model, adapter_path), tokenizer
+
+    print(f"Loading QLoRA adapter from '{adapter_path}' and merging...")
+    model = PeftModel.from_pretrained(base_model, adapter_path).merge_and_unload()
+    if quantize:
+        print("Applying int8 dynamic quantization to Linear layers...")
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model, tokenizer
+
+
+def export_merged_model(base_model_name: str, adapter_path: str, output_dir: str,
+                        dtype: torch.dtype = torch.bfloat16):
+    """
+    어댑터를 기본 모델에 병합해 output_dir에 하나의 safetensors 파일(+ config, 토크나이저)로 저장
+
+    4-bit로 양자화된 가중치에는 정확히 병합할 수 없으므로 원본 정밀도(dtype)로 불러와 병합합니다.
+    """
+    base_model = AutoModelForCausalLM.from_pretrained(base_model_name, torch_dtype=dtype, low_cpu_mem_usage=True)
+    tokenizer = load_tokenizer(adapter_path, base_model)
+    print(f"Merging QLoRA adapter from '{adapter_path}'...")
+    model = PeftModel.from_pretrained(base_model, adapter_path).merge_and_unload()
+
+    # 샤드로 나누지 않고 한 파일로 저장 (mmap 한 번으로 전체 가중치를 매핑)
+    model.save_pretrained(output_dir, safe_serialization=True, max_shard_size="1000GB")
+    tokenizer.save_pretrained(output_dir)
+    print(f"Merged model saved to '{output_dir}'")
+
+
+def mmap_safetensors(path: str) -> Dict[str, torch.Tensor]:
+    """
+    safetensors 파일을 복사 없이 메모리 매핑한 텐서 dict로 반환
+
+    파일 내용을 읽어 새 텐서를 만드는 대신 매핑된 메모리를 그대로 텐서로 쓰므로
+    실제로 페이지를 읽는 시점은 해당 가중치가 처음 쓰일 때입니다. 매핑은 copy-on-write라
+    (fork된 프로세스끼리도) 가중치를 수정하지 않는 한 같은 물리 메모리를 공유합니다.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    header_size = int.from_bytes(buffer[:8], "little")
+    header = json.loads(buffer[8:8 + header_size])
+    data_start = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        begin, end = info["data_offsets"]
+        count = (end - begin) // torch.tensor([], dtype=dtype).element_size()
+        tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + begin)
+        tensors[name] = tensor.view(info["shape"])
+    return tensors
+
+
+def load_merged_model(merged_path: str, backend: str, cpu_quantize: bool = False):
+    """
+    export_merged_model()로 저장한 병합 모델을 불러옴 (어댑터 주입 없음)
+
+    cpu_quantize=True면 int8 동적 양자화를 하는데, 이때는 매핑한 가중치를 모두 읽어 새로 만들기 때문에
+    복사 없이 바로 시작하는 장점이 없어집니다.
+    """
+    tokenizer = load_tokenizer(merged_path)
+    if backend == "cuda":
+        from transformers import BitsAndBytesConfig
+
+        bnb_config = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.bfloat16,
+            bnb_4bit_use_double_quant=True,
+        )
+        model = AutoModelForCausalLM.from_pretrained(
+            merged_path, quantization_config=bnb_config, device_map="auto", torch_dtype=torch.bfloat16
+        )
+        return model, tokenizer
+
+    # 가중치 초기화 없이 모델 구조만 만든 뒤 mmap한 텐서를 그대로 파라미터로 씀
+    state_dict = mmap_safetensors(os.path.join(merged_path, MERGED_WEIGHTS_NAME))
+    config = AutoConfig.from_pretrained(merged_path)
+    dtype = next(iter(state_dict.values())).dtype
+    with no_init_weights():
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=dtype)
+    missing, unexpected = model.load_state_dict(state_dict, strict=False, assign=True)
+    model.tie_weights()
+    # 임베딩과 묶인(tied) lm_head 가중치는 파일에 따로 저장되지 않음
+    missing = [name for name in missing if "lm_head" not in name]
+    if missing or unexpected:
+        raise RuntimeError(f"병합 모델 가중치가 모델 구조와 맞지 않습니다 (missing: {missing[:5]}, unexpected: {unexpected[:5]})")
+    # from_config는 generation_config.json을 읽지 않으므로 따로 불러옴
+    # (없으면 top_k와 종료 토큰(<end_of_turn>)이 기본 모델+어댑터로 불러올 때와 달라짐)
+    if os.path.exists(os.path.join(merged_path, "generation_config.json")):
+        model.generation_config = GenerationConfig.from_pretrained(merged_path)
+
+    if cpu_quantize:
+        print("Applying int8 dynamic quantization to Linear layers...")
+        model = torch.ao.quantization.quantize_dynamic(model.float(), {torch.nn.Linear}, dtype=torch.qint8)
+    return model, tokenizer
+
+
+def load_autocomplete_model(model_name: str, device: torch.device):
+    """자동완성 전용 작은 모델 (어댑터 없이 그대로 사용)"""
+    print(f"Loading autocomplete model '{model_name}'...")
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name, torch_dtype=torch.bfloat16 if device.type == "cuda" else torch.float32,
+    ).to(device)
+    model.eval()
+    return model, load_tokenizer(model_name, model)
+
+
+def default_eos_token_ids(model) -> tuple:
+    """eos_token_id를 따로 주지 않았을 때 generate()가 쓰는 기본 종료 토큰"""
+    eos_token_id = model.generation_config.eos_token_id
+    if eos_token_id is None:
+        eos_token_id = []
+    return tuple(eos_token_id) if isinstance(eos_token_id, (list, tuple)) else (eos_token_id,)
+
+
+def model_memory_bytes(model) -> int:
+    """모델 가중치가 차지하는 메모리 (int8 동적 양자화된 Linear의 packed 가중치 포함)"""
+    tensors = list(model.parameters()) + list(model.buffers())
+    for module in model.modules():
+        if isinstance(module, torch.ao.nn.quantized.dynamic.Linear):
+            weight, bias = module._weight_bias()
+            tensors += [weight] + ([bias] if bias is not None else [])
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+def load_model(base_model_name: str, adapter_path: str, backend: str = "auto",
+               cpu_threads: int = 0, cpu_quantize: Optional[bool] = None,
+               merged_path: Optional[str] = None,
+               merge_adapter: bool = True) -> Tuple[object, object, torch.device]:
+    """
+    backend에 맞게 (model, tokenizer, device)를 반환
+
+    merged_path가 있으면 기본 모델 + 어댑터 대신 미리 병합해 둔 모델을 불러옵니다.
+    merge_adapter=False면 CPU에서도 어댑터를 병합하지 않습니다 (나중에 어댑터를 추가할 수 있도록).
+    cpu_quantize를 주지 않으면 CPU에서 int8 동적 양자화를 하되, 병합 모델은 mmap한 가중치를 그대로 쓰도록 하지 않습니다.
+    """
+    if cpu_quantize is None:
+        cpu_quantize = not merged_path
+    backend = resolve_backend(backend)
+    if backend == "fake":
+        print("Using fake model (backend: fake)")
+        model, tokenizer = load_fake_model()
+        return model, tokenizer, torch.device("cpu")
+    if merged_path:
+        print(f"Loading merged model '{merged_path}' (backend: {backend})...")
+        if backend == "cpu":
+            print(f"CPU threads: {configure_cpu_threads(cpu_threads)}")
+        model, tokenizer = load_merged_model(merged_path, backend, cpu_quantize=cpu_quantize)
+        model.eval()
+        return model, tokenizer, torch.device(backend)
+
+    print(f"Loading base model '{base_model_name}' (backend: {backend})...")
+    if backend == "cuda":
+        model, tokenizer = load_cuda_model(base_model_name, adapter_path)
+        device = torch.device("cuda")
+    else:
+        threads = configure_cpu_threads(cpu_threads)
+        print(f"CPU threads: {threads}")
+        model, tokenizer = load_cpu_model(base_model_name, adapter_path, quantize=cpu_quantize, merge=merge_adapter)
+        device = torch.device("cpu")
+    model.eval()
+    return model, tokenizer, device
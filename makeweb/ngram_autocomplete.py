@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+글자 단위 n-gram 자동완성 모델
+
+크롤링한 블로그 본문(makedata의 blog_search_results.csv)에서 "앞의 몇 글자 -> 다음 글자" 빈도를 세어
+가장 자주 나온 다음 글자를 이어 붙이는 방식으로 자동완성합니다. 모델 forward 없이 dict 조회만 하므로
+4B 모델을 쓰는 것보다 훨씬 빠르고, 확신이 낮아지면 거기서 추천을 멈춥니다.
+
+학습:
+    python ngram_autocomplete.py --corpus ../makedata/blog_search_results.csv --output autocomplete_ngram.json.gz
+"""
+
+import argparse
+import csv
+import gzip
+import json
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+
+from banned_tokens import is_forbidden_char
+
+
+class CharNgramModel:
+    """앞의 최대 order-1 글자를 보고 다음 글자를 고르는 n-gram 모델 (긴 문맥부터 backoff)"""
+
+    def __init__(self, order: int = 7, table: Optional[Dict[str, Tuple[str, float]]] = None,
+                 min_confidence: float = 0.35):
+        self.order = order
+        # 문맥 -> (가장 자주 나온 다음 글자, 그 비율)
+        self.table: Dict[str, Tuple[str, float]] = table or {}
+        self.min_confidence = min_confidence
+
+    @classmethod
+    def train(cls, texts: Iterable[str], order: int = 7, min_count: int = 3, **kwargs) -> "CharNgramModel":
+        counts: Dict[str, Counter] = defaultdict(Counter)
+        for text in texts:
+            text = text.replace("\r\n", "\n")
+            for i in range(1, len(text)):
+                char = text[i]
+                for k in range(1, min(order - 1, i) + 1):
+                    counts[text[i - k:i]][char] += 1
+
+        table = {}
+        for context, next_chars in counts.items():
+            total = sum(next_chars.values())
+            if total < min_count:
+                continue
+            char, count = next_chars.most_common(1)[0]
+            table[context] = (char, count / total)
+        return cls(order=order, table=table, **kwargs)
+
+    def save(self, path: str):
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump({"order": self.order, "table": self.table}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "CharNgramModel":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        table = {context: (char, prob) for context, (char, prob) in data["table"].items()}
+        return cls(order=data["order"], table=table, **kwargs)
+
+    def _next_char(self, text: str) -> Optional[str]:
+        for k in range(min(self.order - 1, len(text)), 0, -1):
+            entry = self.table.get(text[-k:])
+            if entry is not None:
+                char, prob = entry
+                return char if prob >= self.min_confidence else None
+        return None
+
+    def complete(self, prompt: str, max_chars: int = 40) -> str:
+        """prompt 뒤에 이어질 한 줄 (줄바꿈, 확신이 낮은 글자, 이모지/금지 기호가 나오면 멈춤)"""
+        text = prompt
+        generated = []
+        for _ in range(max_chars):
+            char = self._next_char(text)
+            if char is None or char == "\n" or is_forbidden_char(char):
+                break
+            generated.append(char)
+            text += char
+        return "".join(generated).strip()
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+
+def read_corpus(path: str, column: str = "본문내용") -> Iterable[str]:
+    """크롤링 결과 CSV에서 본문만 읽음 (본문을 가져오지 못한 행은 제외)"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            text = row.get(column) or ""
+            if text and text != "본문을 가져올 수 없습니다.":
+                yield text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="크롤링한 블로그 본문으로 글자 n-gram 자동완성 모델 학습")
+    parser.add_argument("--corpus", required=True, help="크롤링 결과 CSV (makedata/naver_search.py가 저장한 파일)")
+    parser.add_argument("--column", default="본문내용", help="본문 컬럼 이름")
+    parser.add_argument("--output", default="autocomplete_ngram.json.gz", help="저장할 모델 파일")
+    parser.add_argument("--order", type=int, default=7, help="n-gram 길이 (문맥 글자 수 + 1)")
+    parser.add_argument("--min-count", type=int, default=3, help="이보다 적게 나온 문맥은 버림")
+    args = parser.parse_args()
+
+    model = CharNgramModel.train(read_corpus(args.corpus, args.column), order=args.order, min_count=args.min_count)
+    model.save(args.output)
+    print(f"{len(model)}개 문맥을 '{args.output}'에 저장했습니다.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+멀티 레플리카 추론 (CPU 전용)
+
+부모 프로세스가 가중치를 한 번만 불러온 뒤 fork로 추론 워커를 N개 띄웁니다.
+fork된 워커는 부모의 가중치 메모리를 copy-on-write로 공유하므로 모델을 N번 불러오지 않고,
+각 워커는 자기 BatchScheduler로 배치 디코딩을 합니다.
+
+부모 쪽의 ReplicaPool은 BatchScheduler와 같은 인터페이스(submit / warm_prefix / start / stats)를
+제공하고, 요청을 처리 중인 요청이 가장 적은 워커에 보냅니다.
+"""
+
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+import torch
+
+from scheduler import (PRIORITY_BULK, BatchScheduler, QueueFullError, RequestCancelled, RequestTooLarge,
+                       SamplingParams, check_request_size, make_kv_budget)
+
+# 워커 프로세스가 살아 있는지 확인하는 간격 (초)
+_WORKER_CHECK_INTERVAL = 0.5
+
+
+class RemoteRequest:
+    """워커 프로세스에서 처리 중인 요청의 부모 쪽 핸들 (GenerationRequest와 같은 방식으로 사용)"""
+
+    def __init__(self, pool: "ReplicaPool", worker: int, job_id: int,
+                 on_token: Optional[Callable[[int], None]] = None):
+        self._pool = pool
+        self.worker = worker
+        self.job_id = job_id
+        self.on_token = on_token
+        self.cancelled = False
+        # 워커의 GenerationRequest.stop_reason / timings() (결과와 함께 전달됨)
+        self.stop_reason: Optional[str] = None
+        self._timings: Optional[dict] = None
+        self.future: Future = Future()
+        # 결과는 워커가 알려줄 때만 설정 (취소도 워커가 RequestCancelled로 응답)
+        self.future.set_running_or_notify_cancel()
+
+    def timings(self) -> Optional[dict]:
+        return self._timings
+
+    def cancel(self):
+        """요청 취소 (워커의 스케줄러가 다음 디코딩 스텝 전에 배치에서 뺌)"""
+        if self.cancelled:
+            return
+        self.cancelled = True
+        self._pool._send(self.worker, ("cancel", self.job_id, None))
+
+
+def _worker_main(index: int, model, tokenizer, device, scheduler_kwargs: dict, prefixes: List[tuple],
+                 num_threads: int, inbox, outbox):
+    """워커 프로세스: 부모가 보낸 요청을 자기 스케줄러에 넣고 토큰/결과를 돌려보냄"""
+    # 부모가 병합/양자화 때 쓴 OpenMP 스레드 풀 상태가 fork로 넘어오므로, 연산 전에 워커 몫의 스레드 수로 다시 정함
+    torch.set_num_threads(num_threads)
+    scheduler = BatchScheduler(model, tokenizer, device, **scheduler_kwargs)
+    for prefix_ids, adapter in prefixes:
+        scheduler.warm_prefix(prefix_ids, adapter=adapter)
+    scheduler.start()
+    requests = {}
+
+    def report(job_id: int, future: Future):
+        request = requests.pop(job_id, None)
+        if future.cancelled():
+            outbox.put(("error", index, job_id, RequestCancelled("요청이 취소되었습니다"), scheduler.stats()))
+        elif future.exception() is not None:
+            outbox.put(("error", index, job_id, future.exception(), scheduler.stats()))
+        else:
+            stop_reason = request.stop_reason if request is not None else None
+            timings = request.timings() if request is not None else None
+            outbox.put(("done", index, job_id, (future.result(), stop_reason, timings), scheduler.stats()))
+
+    outbox.put(("ready", index, None, None, scheduler.stats()))
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        kind, job_id, payload = message
+        if kind == "submit":
+            input_ids, params, prefix_ids, session_id, adapter, priority, stream = payload
+            on_token = None
+            if stream:
+                on_token = lambda token_id, job_id=job_id: outbox.put(("token", index, job_id, token_id, None))
+            try:
+                request = scheduler.submit(input_ids, params, on_token=on_token, prefix_ids=prefix_ids,
+                                           session_id=session_id, adapter=adapter, priority=priority)
+            except (QueueFullError, RequestTooLarge) as e:
+                outbox.put(("error", index, job_id, e, scheduler.stats()))
+                continue
+            requests[job_id] = request
+            request.future.add_done_callback(lambda future, job_id=job_id: report(job_id, future))
+        elif kind == "cancel":
+            request = requests.get(job_id)
+            if request is not None:
+                request.cancel()
+        elif kind == "load_adapter":
+            name, path = payload
+            scheduler.load_adapter(name, path).add_done_callback(
+                lambda future, job_id=job_id: report(job_id, future))
+    scheduler.stop()
+
+
+class ReplicaPool:
+    """
+    fork한 추론 워커들에 요청을 나눠주는 디스패처
+
+    새 요청은 처리 중인 요청이 가장 적은 워커로 보내고, 세션 id가 있으면(자동완성)
+    세션 KV 캐시를 재사용할 수 있도록 같은 워커로 보냅니다.
+    모든 워커가 max_batch_size + max_queue_size 만큼 요청을 들고 있으면 QueueFullError를, KV 메모리 예산
+    (kv_cache_bytes)을 혼자서도 넘는 요청이면 RequestTooLarge를 submit()에서 바로 발생시킵니다.
+    워커의 우선순위별 대기열이 따로 가득 찬 경우의 QueueFullError는 워커가 응답한 뒤 future로 전달됩니다.
+    """
+
+    def __init__(self, model, tokenizer, device, num_replicas: int = 2, max_batch_size: int = 8,
+                 max_queue_size: int = 64, num_threads: int = 0, **scheduler_kwargs):
+        if device.type == "cuda":
+            raise ValueError("멀티 레플리카는 CPU backend에서만 사용할 수 있습니다 (CUDA는 fork 후 사용 불가)")
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.num_replicas = num_replicas
+        self.max_batch_size = max_batch_size
+        self.max_queue_size = max_queue_size
+        self.num_threads = num_threads or max(1, torch.get_num_threads() // num_replicas)
+        self._scheduler_kwargs = dict(max_batch_size=max_batch_size, max_queue_size=max_queue_size,
+                                      **scheduler_kwargs)
+        self._prefixes: List[tuple] = []
+        # 워커와 같은 예산으로 너무 큰 요청은 보내기 전에 거절 (future로 늦게 알리지 않도록)
+        self.kv_budget = make_kv_budget(model, scheduler_kwargs.get("kv_cache_bytes", 0),
+                                        scheduler_kwargs.get("kv_block_tokens", 16))
+
+        self._context = multiprocessing.get_context("fork")
+        self._processes = []
+        self._inboxes = []
+        self._outbox = None
+        self._reader: Optional[threading.Thread] = None
+        self._stopped = False
+
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._pending = {}
+        self._outstanding = [0] * num_replicas
+        self._alive = [True] * num_replicas
+        self._worker_stats = [{} for _ in range(num_replicas)]
+        self._sessions: "OrderedDict[str, int]" = OrderedDict()
+        self._max_sessions = 4096
+
+    def warm_prefix(self, prefix_ids: List[int], adapter: Optional[str] = None):
+        """워커가 시작할 때 미리 계산할 공통 앞부분 (부모 프로세스에서는 forward를 실행하지 않음)"""
+        self._prefixes.append((list(prefix_ids), adapter))
+
+    def start(self):
+        """
+        추론 워커 fork
+
+        fork는 호출한 스레드만 복사하므로 다른 스레드가 잡고 있던 lock은 워커에서 풀리지 않습니다.
+        다른 스레드(요청 로그, 자동완성 스케줄러 등)를 시작하기 전에 호출해야 합니다.
+        """
+        if self._processes:
+            return
+        others = [thread.name for thread in threading.enumerate() if thread is not threading.current_thread()]
+        if others:
+            print(f"Warning: forking inference workers while other threads are running: {others}")
+        # 워커는 stop 문자열 확인용 디코딩에만 토크나이저를 쓰므로 fork 후 tokenizers 병렬화 경고가 나지 않도록 끔
+        os.environ["TOKENIZERS_PARALLELISM"] = "false"
+        self._outbox = self._context.Queue()
+        for index in range(self.num_replicas):
+            inbox = self._context.Queue()
+            process = self._context.Process(
+                target=_worker_main, name=f"inference-worker-{index}", daemon=True,
+                args=(index, self.model, self.tokenizer, self.device, self._scheduler_kwargs,
+                      self._prefixes, self.num_threads, inbox, self._outbox),
+            )
+            process.start()
+            self._inboxes.append(inbox)
+            self._processes.append(process)
+        print(f"Started {self.num_replicas} inference workers "
+              f"({self.num_threads} threads each, pids: {[p.pid for p in self._processes]})")
+        self._reader = threading.Thread(target=self._read_results, name="replica-reader", daemon=True)
+        self._reader.start()
+
+    def stop(self):
+        self._stopped = True
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+        if self._reader is not None:
+            self._reader.join(timeout=5)
+
+    def submit(self, input_ids: List[int], params: SamplingParams,
+               on_token: Optional[Callable[[int], None]] = None,
+               prefix_ids: Optional[List[int]] = None,
+               session_id: Optional[str] = None,
+               adapter: Optional[str] = None,
+               priority: int = PRIORITY_BULK) -> RemoteRequest:
+        """가장 한가한 워커에 요청을 보내고 바로 반환 (결과는 request.future로 받음)"""
+        check_request_size(self.kv_budget, input_ids, params)
+        with self._lock:
+            worker = self._pick_worker(session_id)
+            request = RemoteRequest(self, worker, next(self._job_ids), on_token=on_token)
+            self._pending[request.job_id] = request
+            self._outstanding[worker] += 1
+        payload = (list(input_ids), params, prefix_ids, session_id, adapter, priority, on_token is not None)
+        self._send(worker, ("submit", request.job_id, payload))
+        return request
+
+    def load_adapter(self, name: str, path: str) -> Future:
+        """모든 워커에서 LoRA 어댑터를 추가/교체 (모든 워커가 끝내면 future가 끝남)"""
+        with self._lock:
+            requests = []
+            for worker in range(self.num_replicas):
+                if not self._alive[worker]:
+                    continue
+                request = RemoteRequest(self, worker, next(self._job_ids))
+                self._pending[request.job_id] = request
+                self._outstanding[worker] += 1
+                requests.append(request)
+        for request in requests:
+            self._send(request.worker, ("load_adapter", request.job_id, (name, path)))
+
+        combined = Future()
+        combined.set_running_or_notify_cancel()
+        remaining = [len(requests)]
+
+        def on_done(future: Future):
+            with self._lock:
+                if combined.done():
+                    return
+                if future.exception() is not None:
+                    combined.set_exception(future.exception())
+                    return
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    combined.set_result(None)
+
+        for request in requests:
+            request.future.add_done_callback(on_done)
+        return combined
+
+    def _pick_worker(self, session_id: Optional[str]) -> int:
+        limit = self.max_batch_size + self.max_queue_size
+        candidates = [i for i in range(self.num_replicas) if self._alive[i] and self._outstanding[i] < limit]
+        if not candidates:
+            raise QueueFullError(f"대기 중인 요청이 너무 많습니다 (워커당 최대 {limit}개)")
+
+        worker = self._sessions.get(session_id) if session_id is not None else None
+        if worker not in candidates:
+            worker = min(candidates, key=lambda i: self._outstanding[i])
+        if session_id is not None:
+            self._sessions[session_id] = worker
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self._max_sessions:
+                self._sessions.popitem(last=False)
+        return worker
+
+    def _send(self, worker: int, message):
+        self._inboxes[worker].put(message)
+
+    def _read_results(self):
+        """워커가 보낸 토큰/결과를 부모 쪽 요청에 전달 (백그라운드 스레드)"""
+        checked_at = time.monotonic()
+        while not self._stopped:
+            # 다른 워커가 결과를 계속 보내 대기열이 비지 않아도 죽은 워커를 알아채도록 시간 간격으로 확인
+            if time.monotonic() - checked_at >= _WORKER_CHECK_INTERVAL:
+                self._check_workers()
+                checked_at = time.monotonic()
+            try:
+                kind, worker, job_id, payload, stats = self._outbox.get(timeout=_WORKER_CHECK_INTERVAL)
+            except queue.Empty:
+                continue
+            if stats is not None:
+                self._worker_stats[worker] = stats
+            if kind == "ready":
+                continue
+
+            if kind == "token":
+                request = self._pending.get(job_id)
+                if request is not None and request.on_token is not None:
+                    try:
+                        request.on_token(payload)
+                    except Exception:
+                        traceback.print_exc()
+                continue
+
+            with self._lock:
+                request = self._pending.pop(job_id, None)
+                # 죽은 워커로 처리된 요청의 늦은 결과는 이미 outstanding에서 빠져 있음
+                if request is not None:
+                    self._outstanding[worker] -= 1
+            if request is None or request.future.done():
+                continue
+            if kind == "done":
+                result, request.stop_reason, request._timings = payload
+                request.future.set_result(result)
+            else:
+                request.future.set_exception(payload)
+
+    def _check_workers(self):
+        """
+        죽은 워커가 들고 있던 요청은 실패 처리하고 이후 요청을 보내지 않음
+
+        그 워커에 붙어 있던 세션은 다음 요청부터 살아 있는 워커로 다시 배정됩니다.
+        """
+        for index, process in enumerate(self._processes):
+            if not self._alive[index] or process.is_alive():
+                continue
+            print(f"Inference worker {index} (pid {process.pid}) exited with code {process.exitcode}")
+            with self._lock:
+                self._alive[index] = False
+                failed = [request for request in self._pending.values() if request.worker == index]
+                for request in failed:
+                    del self._pending[request.job_id]
+                self._outstanding[index] = 0
+                for session_id in [session_id for session_id, worker in self._sessions.items() if worker == index]:
+                    del self._sessions[session_id]
+            for request in failed:
+                if not request.future.done():
+                    request.future.set_exception(RuntimeError(f"추론 워커 {index}가 종료되었습니다"))
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(stats.get("queue_depth", 0) for stats in self._worker_stats)
+
+    @property
+    def active_count(self) -> int:
+        return sum(stats.get("active", 0) for stats in self._worker_stats)
+
+    def stats(self) -> dict:
+        """워커별 상태 (각 워커의 스케줄러 상태는 마지막으로 응답을 보낸 시점 기준)"""
+        return {
+            "replicas": self.num_replicas,
+            "outstanding": sum(self._outstanding),
+            "max_batch_size": self.max_batch_size,
+            "max_queue_size": self.max_queue_size,
+            "workers": [
+                {
+                    "pid": process.pid,
+                    "alive": self._alive[index],
+                    "outstanding": self._outstanding[index],
+                    **self._worker_stats[index],
+                }
+                for index, process in enumerate(self._processes)
+            ],
+        }
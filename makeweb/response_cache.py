@@ -0,0 +1,125 @@
+"""
+생성 결과 캐시
+
+같은 프롬프트와 같은 샘플링 설정(시드 포함)으로 들어온 요청은 저장된 결과를 바로 돌려주고,
+동시에 들어온 동일한 요청들은 하나의 생성 결과를 함께 기다립니다 (single-flight).
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Awaitable, Callable, Optional
+
+from scheduler import RequestCancelled
+
+
+def normalize_prompt(prompt: str) -> str:
+    """공백 차이만 있는 프롬프트는 같은 요청으로 취급"""
+    return " ".join(prompt.split())
+
+
+class ResponseCache:
+    """생성 결과 LRU + TTL 캐시 (진행 중인 동일 요청은 한 번만 생성)"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: dict = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(prompt: str, params) -> str:
+        """정규화한 프롬프트 + 샘플링 설정(시드 포함)으로 캐시 키 생성"""
+        payload = json.dumps(
+            {"prompt": normalize_prompt(prompt), "params": asdict(params)},
+            ensure_ascii=False, sort_keys=True, default=list,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str):
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def lookup(self, key: str) -> Optional[str]:
+        """캐시 조회 (히트/미스 집계 포함)"""
+        value = self.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def get_or_generate(self, key: str, generate: Callable[[], Awaitable[str]]) -> str:
+        """
+        캐시에 있으면 바로 반환하고, 같은 요청이 생성 중이면 그 결과를 기다리고,
+        둘 다 아니면 generate()로 새로 생성해 저장
+
+        먼저 시작한 요청이 (클라이언트 연결 끊김 등으로) 취소되면
+        기다리던 요청이 새로 생성을 시작합니다.
+        """
+        value = self.lookup(key)
+        if value is not None:
+            return value
+
+        while True:
+            shared = self._inflight.get(key)
+            if shared is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(shared)
+            except RequestCancelled:
+                continue
+
+        shared = asyncio.get_running_loop().create_future()
+        self._inflight[key] = shared
+        try:
+            value = await generate()
+        except BaseException as e:
+            if not shared.done():
+                shared.set_exception(e if isinstance(e, Exception) else RequestCancelled("요청이 취소되었습니다"))
+                # 기다리는 쪽이 없으면 "exception was never retrieved" 경고가 나지 않도록 소비
+                shared.exception()
+            raise
+        else:
+            self.put(key, value)
+            shared.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is shared:
+                del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,1027 @@
+"""
+연속 배칭(continuous batching) 스케줄러
+
+동시에 들어온 생성 요청들을 하나의 디코딩 루프에서 함께 처리합니다.
+매 디코딩 스텝마다 새 요청을 배치에 합류시키고, 끝난 요청은 즉시 배치에서 빼서
+각자의 결과를 따로 돌려줍니다.
+"""
+
+import queue
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Protocol
+
+import torch
+import torch.nn.functional as F
+from transformers import DynamicCache
+from transformers.generation.logits_process import (
+    LogitsProcessorList,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+
+from banned_tokens import BannedTokensLogitsProcessor
+from kv_cache import KVBudget, PrefixCache, SessionCache, copy_cache
+from static_decode import DEFAULT_BUCKETS, StaticDecoder
+from stopping import build_stopping_criteria, check_stopping_criteria
+
+
+# 요청 우선순위 클래스 (숫자가 작을수록 먼저 처리)
+PRIORITY_INTERACTIVE = 0  # 자동완성처럼 짧고 사용자가 기다리는 요청
+PRIORITY_BULK = 1  # 블로그 포스트처럼 긴 생성
+
+
+class QueueFullError(RuntimeError):
+    """대기열이 가득 차서 새 요청을 받을 수 없을 때 발생"""
+
+
+class RequestCancelled(Exception):
+    """요청이 취소되어 결과가 없을 때 future에 설정되는 예외"""
+
+
+class RequestTooLarge(ValueError):
+    """프롬프트 + 최대 생성 길이의 KV가 혼자서도 KV 메모리 예산을 넘는 요청"""
+
+
+@dataclass
+class SamplingParams:
+    """요청별 샘플링 설정 (model.generate 인자와 동일한 의미)"""
+    max_new_tokens: int = 1000
+    do_sample: bool = True
+    temperature: float = 0.7
+    top_p: float = 0.9
+    top_k: Optional[int] = None
+    repetition_penalty: float = 1.0
+    eos_token_ids: tuple = ()
+    seed: Optional[int] = None  # 지정하면 요청별 난수 생성기로 샘플링 (재현 가능)
+    stop_strings: tuple = ()  # 생성된 텍스트에 이 문자열이 나오면 종료 (예: ("\n",))
+    deadline_seconds: Optional[float] = None  # 제출 후 이 시간(초)이 지나면 그때까지 생성한 토큰으로 종료
+
+
+class GenerationRequest:
+    """스케줄러에 제출된 단일 생성 요청"""
+
+    def __init__(self, input_ids: List[int], params: SamplingParams,
+                 on_token: Optional[Callable[[int], None]] = None,
+                 prefix_ids: Optional[List[int]] = None,
+                 session_id: Optional[str] = None,
+                 adapter: Optional[str] = None,
+                 priority: int = PRIORITY_BULK,
+                 tokenizer=None,
+                 banned_token_mask: Optional[torch.Tensor] = None):
+        self.input_ids = list(input_ids)
+        self.params = params
+        self.priority = priority
+        # 사용할 LoRA 어댑터 이름 (None이면 모델의 기본 어댑터)
+        self.adapter = adapter
+        # input_ids 중 여러 요청이 공유하는 앞부분 (PrefixCache로 KV를 재사용)
+        self.prefix_ids = list(prefix_ids) if prefix_ids else None
+        # 같은 세션의 직전 입력과 겹치는 부분은 SessionCache로 KV를 재사용
+        self.session_id = session_id
+        self.cancelled = False
+        self.generator: Optional[torch.Generator] = None
+        self.output_ids: List[int] = []
+        self.future: Future = Future()
+        self.processors = _build_logits_processors(params, banned_token_mask)
+        # 종료 조건 (stop 문자열을 확인하려면 tokenizer 필요, 제한 시간은 지금부터 계산)
+        self.stopping_criteria = build_stopping_criteria(params, tokenizer)
+        # 멈춘 이유 ("eos", "stop", "length", "deadline"), 끝나기 전에는 None
+        self.stop_reason: Optional[str] = None
+        self.on_token = on_token
+        # 요청별 시간 기록 (time.monotonic 기준, timings()로 정리)
+        self.submitted_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.prefill_seconds = 0.0
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def all_ids(self) -> List[int]:
+        return self.input_ids + self.output_ids
+
+    def cancel(self):
+        """
+        요청 취소
+
+        대기열에 있으면 배치에 들어가지 않고 버려지고,
+        이미 생성 중이면 다음 디코딩 스텝 전에 배치에서 빠집니다.
+        """
+        self.cancelled = True
+        self.future.cancel()
+
+    def append_token(self, token_id: int):
+        """생성된 토큰을 기록하고 스트리밍 콜백에 전달"""
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.output_ids.append(token_id)
+        if self.on_token is not None:
+            try:
+                self.on_token(token_id)
+            except Exception:
+                traceback.print_exc()
+
+    def timings(self) -> dict:
+        """
+        요청별 시간 (초): 대기(queue_wait), prefill(선점 후 다시 한 prefill 포함), 첫 토큰까지(TTFT),
+        전체, 첫 토큰 이후의 디코딩 속도(토큰/초). 배치에 들어가지 못하고 끝났으면 해당 항목은 None.
+        """
+        finished_at = self.finished_at or time.monotonic()
+        decode_tokens_per_second = None
+        if self.first_token_at is not None and len(self.output_ids) > 1 and finished_at > self.first_token_at:
+            decode_tokens_per_second = (len(self.output_ids) - 1) / (finished_at - self.first_token_at)
+        return {
+            "queue_wait_seconds": self.admitted_at - self.submitted_at if self.admitted_at is not None else None,
+            "prefill_seconds": self.prefill_seconds if self.admitted_at is not None else None,
+            "time_to_first_token_seconds": (self.first_token_at - self.submitted_at
+                                            if self.first_token_at is not None else None),
+            "decode_tokens_per_second": decode_tokens_per_second,
+            "total_seconds": finished_at - self.submitted_at,
+            "input_tokens": len(self.input_ids),
+            "output_tokens": len(self.output_ids),
+        }
+
+    def is_finished(self) -> bool:
+        """종료 조건 확인 (한 번 맞은 조건은 stop_reason에 남아 이후에도 끝난 상태)"""
+        if self.stop_reason is None:
+            self.stop_reason = check_stopping_criteria(self.stopping_criteria, self.output_ids)
+        return self.stop_reason is not None
+
+
+class _PendingQueue:
+    """
+    우선순위 클래스별 대기열
+
+    클래스마다 최대 maxsize개까지 쌓이고, 꺼낼 때는 우선순위가 높은 클래스부터
+    (그 클래스가 지금 배치에 들어갈 수 있을 때만) 먼저 들어온 순서로 꺼냅니다.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._queues = {PRIORITY_INTERACTIVE: deque(), PRIORITY_BULK: deque()}
+        self._condition = threading.Condition()
+
+    def put_nowait(self, request: "GenerationRequest"):
+        with self._condition:
+            waiting = self._queues.setdefault(request.priority, deque())
+            if len(waiting) >= self.maxsize:
+                raise queue.Full
+            waiting.append(request)
+            self._condition.notify()
+
+    def requeue(self, request: "GenerationRequest"):
+        """선점된 요청을 같은 클래스의 맨 앞에 다시 넣음 (크기 제한 없이)"""
+        with self._condition:
+            self._queues.setdefault(request.priority, deque()).appendleft(request)
+            self._condition.notify()
+
+    def get(self, admissible: Callable[["GenerationRequest"], bool],
+            timeout: float = 0.0) -> Optional["GenerationRequest"]:
+        """
+        각 클래스의 맨 앞 요청 중 admissible(request)가 True인 가장 급한 요청 (timeout 동안 없으면 None)
+
+        맨 앞 요청이 들어갈 수 없으면 같은 클래스의 뒤 요청도 기다리므로 긴 요청이 밀려나지 않습니다.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                for priority in sorted(self._queues):
+                    waiting = self._queues[priority]
+                    if waiting and admissible(waiting[0]):
+                        return waiting.popleft()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def waiting(self, priority: int) -> int:
+        return len(self._queues.get(priority, ()))
+
+    def peek(self, priority: int) -> Optional["GenerationRequest"]:
+        with self._condition:
+            waiting = self._queues.get(priority)
+            return waiting[0] if waiting else None
+
+    def qsize(self) -> int:
+        return sum(len(waiting) for waiting in self._queues.values())
+
+
+class InferenceBackend(Protocol):
+    """
+    BlogGenerator가 쓰는 추론 backend 인터페이스
+
+    BatchScheduler(한 프로세스), ReplicaPool(fork한 워커들), FakeScheduler(부하 테스트용 가짜 모델)가
+    이 인터페이스를 구현합니다. submit이 돌려주는 요청은 future, cancel(), stop_reason, timings()를 가집니다.
+    """
+
+    max_batch_size: int
+
+    def warm_prefix(self, prefix_ids: List[int], adapter: Optional[str] = None): ...
+
+    def start(self): ...
+
+    def stop(self): ...
+
+    def submit(self, input_ids: List[int], params: SamplingParams,
+               on_token: Optional[Callable[[int], None]] = None,
+               prefix_ids: Optional[List[int]] = None,
+               session_id: Optional[str] = None,
+               adapter: Optional[str] = None,
+               priority: int = PRIORITY_BULK): ...
+
+    def load_adapter(self, name: str, path: str) -> Future: ...
+
+    @property
+    def queue_depth(self) -> int: ...
+
+    @property
+    def active_count(self) -> int: ...
+
+    def stats(self) -> dict: ...
+
+
+def _build_logits_processors(params: SamplingParams,
+                             banned_token_mask: Optional[torch.Tensor] = None) -> LogitsProcessorList:
+    """generate()와 같은 순서로 logits 후처리기를 구성 (금지 토큰은 bad_words_ids처럼 warper 앞에서 제거)"""
+    processors = LogitsProcessorList()
+    if params.repetition_penalty and params.repetition_penalty != 1.0:
+        processors.append(RepetitionPenaltyLogitsProcessor(params.repetition_penalty))
+    if banned_token_mask is not None:
+        processors.append(BannedTokensLogitsProcessor(banned_token_mask))
+    if params.do_sample:
+        if params.temperature and params.temperature != 1.0:
+            processors.append(TemperatureLogitsWarper(params.temperature))
+        if params.top_k:
+            processors.append(TopKLogitsWarper(params.top_k))
+        if params.top_p is not None and params.top_p < 1.0:
+            processors.append(TopPLogitsWarper(params.top_p))
+    return processors
+
+
+def _prompt_lookup(ids: List[int], max_ngram: int, num_tokens: int) -> List[int]:
+    """
+    프롬프트 룩업 드래프트: 마지막 n-gram이 앞에서 나온 적 있으면 그 뒤에 이어진 토큰들을 추측으로 사용
+
+    블로그 글은 입력 필드(가게 이름, 메뉴 등)를 그대로 다시 쓰는 경우가 많아서
+    별도의 드래프트 모델 없이도 맞는 추측이 꽤 나옵니다. 긴 n-gram부터 가장 최근 위치를 찾습니다.
+    """
+    for n in range(min(max_ngram, len(ids) - 1), 0, -1):
+        tail = ids[-n:]
+        for start in range(len(ids) - n - 1, -1, -1):
+            if ids[start:start + n] == tail:
+                return ids[start + n:start + n + num_tokens]
+    return []
+
+
+def _kv_token_bytes(model) -> Optional[tuple]:
+    """(레이어 하나가 토큰 하나에 쓰는 KV 바이트, 레이어 수), 설정에서 알 수 없으면 None"""
+    config = getattr(model, "config", None)
+    config = getattr(config, "text_config", config)
+    layers = getattr(config, "num_hidden_layers", None)
+    heads = getattr(config, "num_attention_heads", None)
+    if not layers or not heads:
+        return None
+    kv_heads = getattr(config, "num_key_value_heads", None) or heads
+    head_dim = getattr(config, "head_dim", None) or config.hidden_size // heads
+    # 4-bit/int8 양자화 모델도 KV는 임베딩과 같은 계산 dtype으로 저장됨
+    dtype = model.get_input_embeddings().weight.dtype
+    element_size = torch.empty((), dtype=dtype).element_size()
+    return 2 * kv_heads * head_dim * element_size, layers
+
+
+def _sliding_layers(model) -> Optional[tuple]:
+    """Gemma3처럼 sliding window 레이어가 섞인 모델이면 (window, 레이어 인덱스 집합) 반환"""
+    config = model.config
+    config = getattr(config, "text_config", config)
+    window = getattr(config, "sliding_window", None)
+    pattern = getattr(config, "sliding_window_pattern", None)
+    if not window or not pattern:
+        return None
+    layers = {i for i in range(config.num_hidden_layers) if (i + 1) % pattern}
+    return window, layers
+
+
+def make_kv_budget(model, kv_cache_bytes: int, block_tokens: int = 16) -> Optional[KVBudget]:
+    """배치 KV 캐시 메모리 예산 (kv_cache_bytes가 0이거나 모델의 KV 모양을 알 수 없으면 None = 제한 없음)"""
+    if kv_cache_bytes <= 0:
+        return None
+    token_bytes = _kv_token_bytes(model)
+    if token_bytes is None:
+        print("KV cache budget disabled: unknown model KV layout")
+        return None
+    return KVBudget(kv_cache_bytes, *token_bytes, sliding=_sliding_layers(model), block_tokens=block_tokens)
+
+
+def check_request_size(kv_budget: Optional[KVBudget], input_ids: List[int], params: SamplingParams):
+    """혼자서도 KV 메모리 예산을 넘는 요청이면 RequestTooLarge"""
+    if kv_budget is None:
+        return
+    needed = kv_budget.batch_bytes(1, len(input_ids) + params.max_new_tokens)
+    if needed > kv_budget.max_bytes:
+        raise RequestTooLarge(f"요청의 KV 캐시({needed / 2 ** 20:.1f}MB)가 메모리 예산"
+                              f"({kv_budget.max_bytes / 2 ** 20:.1f}MB)보다 큽니다")
+
+
+class BatchScheduler:
+    """
+    반복(iteration) 단위 연속 배칭 스케줄러
+
+    배치는 왼쪽 패딩으로 정렬된 하나의 DynamicCache를 공유하고,
+    요청마다 위치(position)와 샘플링 상태를 따로 관리합니다.
+    """
+
+    def __init__(self, model, tokenizer, device, max_batch_size: int = 8, max_queue_size: int = 64,
+                 session_cache_bytes: int = 512 * 1024 * 1024, speculative_tokens: int = 0,
+                 prompt_lookup_ngram: int = 3, interactive_reserved_slots: int = 1,
+                 banned_token_mask: Optional[torch.Tensor] = None, kv_cache_bytes: int = 0,
+                 kv_block_tokens: int = 16, session_cache_int8: bool = False, compile_decode: bool = False,
+                 static_cache_buckets: Optional[List[int]] = None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        # 모든 요청에서 고를 수 없게 할 토큰 (banned_tokens.build_banned_token_mask, None이면 제한 없음)
+        self.banned_token_mask = banned_token_mask.to(device) if banned_token_mask is not None else None
+        self.max_batch_size = max_batch_size
+        self.max_queue_size = max_queue_size
+        self.sliding = _sliding_layers(model)
+        self.prefix_cache = PrefixCache()
+        self.session_cache = SessionCache(max_bytes=session_cache_bytes, int8=session_cache_int8)
+
+        # 배치 KV 캐시 + 세션 캐시의 메모리 예산 (0이면 제한 없음)
+        # 예산이 모자라면 새 요청은 대기열에서 기다리고, 디코딩 중 모자라면 세션 캐시를 비운 뒤
+        # 나중에 들어온 요청부터 배치에서 뺐다가(선점) 자리가 나면 이어서 생성
+        self.kv_budget = make_kv_budget(model, kv_cache_bytes, kv_block_tokens)
+        self.kv_batch_bytes = 0
+        self.memory_preemptions = 0
+
+        # 추측 디코딩 (0이면 끔): 스텝마다 최대 speculative_tokens개를 추측하고 한 번의 forward로 검증
+        self.speculative_tokens = speculative_tokens
+        self.prompt_lookup_ngram = prompt_lookup_ngram
+        self.speculative_steps = 0
+        self.drafted_tokens = 0
+        self.accepted_tokens = 0
+
+        # 요청이 하나뿐일 때 정적 KV 캐시 + 컴파일된 forward로 디코딩 (start()에서 warmup, 실패하면 끔)
+        self.static_decoder: Optional[StaticDecoder] = None
+        if compile_decode:
+            try:
+                self.static_decoder = StaticDecoder(model, device, self.sliding,
+                                                    buckets=static_cache_buckets or DEFAULT_BUCKETS)
+            except ValueError as e:
+                print(f"Compiled decode disabled: {e}")
+
+        # 긴 생성(bulk)은 배치 자리를 interactive_reserved_slots개 남겨 두고만 차지하고,
+        # 자리가 없을 때 자동완성이 오면 긴 생성 하나를 잠시 배치에서 빼서(선점) 자리를 만듦
+        self.max_bulk_active = max(1, max_batch_size - interactive_reserved_slots)
+        self.preemptions = 0
+
+        # 끝난 요청 수 (멈춘 이유별)
+        self.stop_reasons: Counter = Counter()
+
+        # 대기열 크기를 (우선순위 클래스별로) 제한해 과부하 시 요청을 바로 거절 (backpressure)
+        self._pending = _PendingQueue(maxsize=max_queue_size)
+        # 디코딩 스텝 사이에 스케줄러 스레드에서 실행할 작업 (어댑터 교체 등)
+        self._calls: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # 배치 상태 (스케줄러 스레드에서만 접근)
+        self._active: List[GenerationRequest] = []
+        self._cache: Optional[DynamicCache] = None
+        self._attention_mask: Optional[torch.Tensor] = None
+        self._positions: Optional[torch.Tensor] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.static_decoder is not None:
+            try:
+                self.static_decoder.warmup()
+            except Exception as e:
+                traceback.print_exc()
+                print(f"Compiled decode disabled: warmup failed ({e})")
+                self.static_decoder = None
+        self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, input_ids: List[int], params: SamplingParams,
+               on_token: Optional[Callable[[int], None]] = None,
+               prefix_ids: Optional[List[int]] = None,
+               session_id: Optional[str] = None,
+               adapter: Optional[str] = None,
+               priority: int = PRIORITY_BULK) -> GenerationRequest:
+        """
+        생성 요청을 대기열에 넣고 바로 반환 (결과는 request.future로 받음)
+
+        on_token을 넘기면 토큰이 생성될 때마다 스케줄러 스레드에서 호출됩니다.
+        prefix_ids(input_ids의 공통 앞부분)를 주면 그 부분의 KV는 캐시에서 가져오고,
+        session_id를 주면 같은 세션의 직전 입력과 겹치는 부분의 KV를 재사용합니다.
+        adapter를 주면 그 LoRA 어댑터로 생성합니다 (다른 어댑터의 요청과도 한 배치로 처리).
+        priority가 PRIORITY_INTERACTIVE인 요청은 긴 생성보다 먼저 배치에 들어갑니다.
+        대기열이 가득 차 있으면 QueueFullError, 혼자서도 KV 메모리 예산을 넘는 요청이면 RequestTooLarge를
+        발생시킵니다.
+        """
+        check_request_size(self.kv_budget, input_ids, params)
+        request = GenerationRequest(input_ids, params, on_token=on_token, prefix_ids=prefix_ids,
+                                    session_id=session_id, adapter=adapter, priority=priority,
+                                    tokenizer=self.tokenizer, banned_token_mask=self.banned_token_mask)
+        try:
+            self._pending.put_nowait(request)
+        except queue.Full:
+            raise QueueFullError(f"대기 중인 요청이 너무 많습니다 (최대 {self.max_queue_size}개)")
+        return request
+
+    @property
+    def queue_depth(self) -> int:
+        """아직 배치에 합류하지 못한 요청 수"""
+        return self._pending.qsize()
+
+    @property
+    def active_count(self) -> int:
+        """현재 디코딩 중인 요청 수"""
+        return len(self._active)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_size": self.max_queue_size,
+            "active": self.active_count,
+            "max_batch_size": self.max_batch_size,
+            "priority": {
+                "interactive": {
+                    "queued": self._pending.waiting(PRIORITY_INTERACTIVE),
+                    "active": self._active_in(PRIORITY_INTERACTIVE),
+                },
+                "bulk": {
+                    "queued": self._pending.waiting(PRIORITY_BULK),
+                    "active": self._active_in(PRIORITY_BULK),
+                    "max_active": self.max_bulk_active,
+                },
+                "preemptions": self.preemptions,
+            },
+            "prefix_cache": {
+                "entries": len(self.prefix_cache),
+                "hits": self.prefix_cache.hits,
+                "misses": self.prefix_cache.misses,
+            },
+            "session_cache": {
+                "entries": len(self.session_cache),
+                "bytes": self.session_cache.total_bytes,
+                "max_bytes": self.session_cache.max_bytes,
+                "hits": self.session_cache.hits,
+                "misses": self.session_cache.misses,
+                "reused_tokens": self.session_cache.reused_tokens,
+            },
+            "speculative": {
+                "enabled": self.speculative_tokens > 0,
+                "max_draft_tokens": self.speculative_tokens,
+                "steps": self.speculative_steps,
+                "drafted_tokens": self.drafted_tokens,
+                "accepted_tokens": self.accepted_tokens,
+                "acceptance_rate": self.accepted_tokens / self.drafted_tokens if self.drafted_tokens else None,
+            },
+            "kv_cache": {
+                "max_bytes": self.kv_budget.max_bytes if self.kv_budget is not None else None,
+                "block_tokens": self.kv_budget.block_tokens if self.kv_budget is not None else None,
+                "batch_bytes": self.kv_batch_bytes if self.kv_budget is not None else None,
+                "session_bytes": self.session_cache.total_bytes,
+                "session_int8": self.session_cache.int8,
+                "memory_preemptions": self.memory_preemptions,
+            },
+            "compiled_decode": {
+                "enabled": self.static_decoder is not None,
+                "buckets": list(self.static_decoder.buckets) if self.static_decoder is not None else None,
+                "steps": self.static_decoder.steps if self.static_decoder is not None else 0,
+            },
+            "stop_reasons": dict(self.stop_reasons),
+        }
+
+    # ------------------------------------------------------------------
+    # 스케줄러 루프
+    # ------------------------------------------------------------------
+    def load_adapter(self, name: str, path: str) -> Future:
+        """
+        LoRA 어댑터를 추가하거나 같은 이름의 어댑터를 교체 (완료되면 future가 끝남)
+
+        실제 로드는 디코딩 스텝 사이에 스케줄러 스레드에서 하므로 진행 중인 forward와 겹치지 않습니다.
+        교체된 어댑터로 계산해 둔 KV 캐시는 버립니다.
+        """
+        def load():
+            if name in self.model.peft_config:
+                if any(request.adapter == name for request in self._active):
+                    raise RuntimeError(f"'{name}' 어댑터로 생성 중인 요청이 있어 교체할 수 없습니다")
+                self.model.delete_adapter(name)
+            self.model.load_adapter(path, adapter_name=name)
+            self.model.eval()
+            self.prefix_cache.invalidate(name)
+            self.session_cache.clear()
+
+        future = Future()
+        self._calls.put((load, future))
+        return future
+
+    def _run_calls(self):
+        while True:
+            try:
+                fn, future = self._calls.get_nowait()
+            except queue.Empty:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn())
+            except Exception as e:
+                traceback.print_exc()
+                future.set_exception(e)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._run_calls()
+                self._admit_pending()
+                if self._active:
+                    self._decode_step()
+                if self.kv_budget is not None:
+                    self.kv_batch_bytes = (self.kv_budget.batch_bytes(len(self._active), self._attention_mask.shape[1])
+                                           if self._active else 0)
+            except Exception as e:
+                traceback.print_exc()
+                self._fail_active(e)
+
+    def _active_in(self, priority: int) -> int:
+        return sum(1 for request in self._active if request.priority == priority)
+
+    def _admissible(self, request: GenerationRequest) -> bool:
+        """요청이 지금 배치에 들어갈 수 있는지 (배치 자리, 클래스별 동시 처리 제한, KV 메모리 예산)"""
+        if len(self._active) >= self.max_batch_size:
+            return False
+        if request.priority == PRIORITY_BULK and self._active_in(PRIORITY_BULK) >= self.max_bulk_active:
+            return False
+        # 들어온 뒤 바로 선점되지 않도록 한 block 만큼 더 디코딩할 여유가 있어야 함
+        return self._kv_fits(request, new_tokens=self.kv_budget.block_tokens if self.kv_budget else 0)
+
+    def _kv_fits(self, request: Optional[GenerationRequest] = None, new_tokens: int = 1) -> bool:
+        """
+        배치에 request를 더하고 new_tokens만큼 디코딩해도 KV 메모리 예산 안인지
+
+        들어갈 수 있으면 그만큼 자리가 나도록 세션 캐시를 오래된 것부터 비웁니다.
+        배치가 비어 있으면 (submit에서 혼자 들어갈 수 있는 요청만 받으므로) 항상 들어갈 수 있습니다.
+        """
+        if self.kv_budget is None:
+            return True
+        rows = len(self._active)
+        width = self._attention_mask.shape[1] if self._active else 0
+        if request is not None:
+            rows += 1
+            width = max(width, len(request.all_ids))
+        needed = self.kv_budget.batch_bytes(rows, width + new_tokens)
+        if needed > self.kv_budget.max_bytes and (rows > 1 or request is None):
+            return False
+        self.session_cache.shrink(self.kv_budget.max_bytes - needed)
+        return True
+
+    def _admit_pending(self):
+        """빈 자리만큼 대기 중인 요청을 prefill 후 배치에 합류 (급한 요청부터)"""
+        while True:
+            # 처리 중인 요청이 없으면 새 요청이 올 때까지 잠시 대기
+            request = self._pending.get(self._admissible, timeout=0.0 if self._active else 0.1)
+            if request is None:
+                # 자동완성이 배치 자리나 KV 메모리가 없어 못 들어가면 긴 생성 하나를 빼고 다시 시도
+                if self._preempt_for_interactive():
+                    continue
+                return
+            if request.output_ids:
+                # 선점됐다가 다시 들어온 요청 (future는 이미 실행 중 상태)
+                if request.cancelled:
+                    request.future.set_exception(RequestCancelled("요청이 취소되었습니다"))
+                    continue
+            elif not request.future.set_running_or_notify_cancel():
+                continue
+            if request.is_finished():
+                # 대기열에서 기다리는 동안 제한 시간이 지난 요청은 prefill하지 않고 바로 종료
+                self._finish(request)
+                continue
+            try:
+                self._prefill(request)
+            except Exception as e:
+                traceback.print_exc()
+                request.future.set_exception(e)
+
+    def _preempt_for_interactive(self) -> bool:
+        """
+        자동완성이 배치에 못 들어가고 기다리고 있으면 긴 생성 하나를 배치에서 빼서 대기열 맨 앞에 다시 넣음
+
+        빠진 요청은 지금까지 생성한 토큰을 유지하고, 다시 들어올 때 프롬프트 + 생성된 토큰을
+        한 번에 prefill해서 이어서 생성합니다. 다시 계산할 양이 가장 적은 요청을 고릅니다.
+        """
+        waiting = self._pending.peek(PRIORITY_INTERACTIVE)
+        if waiting is None or self._admissible(waiting):
+            return False
+        candidates = [row for row, request in enumerate(self._active) if request.priority == PRIORITY_BULK]
+        if not candidates:
+            return False
+        self._preempt(min(candidates, key=lambda row: len(self._active[row].all_ids)))
+        self.preemptions += 1
+        return True
+
+    def _preempt_for_memory(self, new_tokens: int):
+        """
+        이번 스텝에서 KV 메모리 예산을 넘게 되면 (세션 캐시를 비워도 모자라면) 요청을 배치에서 뺌
+
+        긴 생성부터, 같은 클래스 안에서는 나중에 배치에 들어온 요청부터 빼서 오래 기다린 요청이 먼저 끝나게 합니다.
+        빠진 요청은 자동완성 선점과 같이 대기열 맨 앞에서 다시 기다립니다.
+        """
+        while len(self._active) > 1 and not self._kv_fits(new_tokens=new_tokens):
+            self._preempt(max(range(len(self._active)),
+                              key=lambda row: (self._active[row].priority, self._active[row].admitted_at)))
+            self.memory_preemptions += 1
+
+    def _preempt(self, row: int):
+        request = self._active[row]
+        self._select_rows([other for other in range(len(self._active)) if other != row])
+        self._pending.requeue(request)
+
+    @torch.no_grad()
+    def warm_prefix(self, prefix_ids: List[int], adapter: Optional[str] = None) -> DynamicCache:
+        """공통 앞부분의 KV를 계산해 PrefixCache에 저장 (스케줄러 시작 전이나 스케줄러 스레드에서 호출)"""
+        cache = DynamicCache()
+        input_ids = torch.tensor([prefix_ids], dtype=torch.long, device=self.device)
+        positions = torch.arange(input_ids.shape[1], device=self.device).unsqueeze(0)
+        self._forward(input_ids, torch.ones_like(input_ids), positions, cache, past_length=0, adapters=[adapter])
+        self.prefix_cache.put(prefix_ids, cache, adapter=adapter)
+        return cache
+
+    def _can_resume(self, length: int) -> bool:
+        """
+        캐시된 앞부분 뒤에 이어서 prefill해도 결과가 같은지
+
+        sliding window를 넘는 프롬프트는 나눠서 prefill하면 sliding 레이어의 마스크가
+        달라지므로 처음부터 전체 prefill합니다.
+        """
+        return self.sliding is None or length <= self.sliding[0]
+
+    def _reusable_cache(self, request: GenerationRequest, token_ids: List[int]):
+        """재사용할 수 있는 앞부분 KV와 그 길이를 반환 (없으면 빈 캐시, 0)"""
+        if not self._can_resume(len(token_ids)):
+            return DynamicCache(), 0
+
+        if request.session_id is not None:
+            cache, length = self.session_cache.match(_session_key(request), token_ids)
+            if cache is not None:
+                return cache, length
+
+        prefix_ids = request.prefix_ids
+        if not prefix_ids or len(prefix_ids) >= len(token_ids):
+            return DynamicCache(), 0
+        # 토크나이즈 경계가 달라 앞부분 토큰이 다르면 결과가 바뀌므로 재사용하지 않음
+        if token_ids[:len(prefix_ids)] != prefix_ids:
+            return DynamicCache(), 0
+
+        cache = self.prefix_cache.get(prefix_ids, adapter=request.adapter)
+        if cache is None:
+            cache = copy_cache(self.warm_prefix(prefix_ids, adapter=request.adapter))
+        return cache, len(prefix_ids)
+
+    @torch.no_grad()
+    def _prefill(self, request: GenerationRequest):
+        started = time.monotonic()
+        if request.admitted_at is None:
+            request.admitted_at = started
+        # 선점됐다가 다시 들어온 요청은 이미 생성한 토큰까지 함께 prefill
+        token_ids = request.all_ids
+        cache, past_length = self._reusable_cache(request, token_ids)
+        length = len(token_ids)
+        input_ids = torch.tensor([token_ids[past_length:]], dtype=torch.long, device=self.device)
+        attention_mask = torch.ones((1, length), dtype=torch.long, device=self.device)
+        positions = torch.arange(past_length, length, device=self.device).unsqueeze(0)
+
+        logits = self._forward(input_ids, attention_mask, positions, cache, past_length, adapters=[request.adapter])
+        if request.session_id is not None and self._can_resume(length):
+            # 프롬프트까지의 KV만 저장 (이후 디코딩은 새 텐서를 만들므로 저장본은 그대로 유지됨)
+            self.session_cache.put(_session_key(request), token_ids, cache)
+        request.prefill_seconds += time.monotonic() - started
+        request.append_token(self._sample(request, logits[0]))
+
+        if request.is_finished():
+            self._finish(request)
+            return
+        self._merge(request, cache, attention_mask, torch.tensor([length], device=self.device))
+
+    @torch.no_grad()
+    def _decode_step(self):
+        self._drop_cancelled()
+        if self.kv_budget is not None:
+            self._preempt_for_memory(new_tokens=1 + self.speculative_tokens)
+        if not self._active:
+            return
+        if self.static_decoder is not None and self._static_step():
+            return
+        if self.speculative_tokens and self._speculative_step():
+            return
+
+        input_ids = torch.tensor(
+            [[request.output_ids[-1]] for request in self._active], dtype=torch.long, device=self.device
+        )
+        past_length = self._attention_mask.shape[1]
+        self._attention_mask = F.pad(self._attention_mask, (0, 1), value=1)
+
+        logits = self._forward(
+            input_ids, self._attention_mask, self._positions.unsqueeze(1), self._cache, past_length,
+            adapters=[request.adapter for request in self._active],
+        )
+        self._positions = self._positions + 1
+
+        keep = []
+        for row, request in enumerate(self._active):
+            request.append_token(self._sample(request, logits[row]))
+            if request.is_finished():
+                self._finish(request)
+            else:
+                keep.append(row)
+
+        if len(keep) < len(self._active):
+            self._select_rows(keep)
+
+    def _static_step(self) -> bool:
+        """
+        정적 캐시 디코딩 스텝 (실행하지 않았으면 False를 반환하고 일반 디코딩 스텝으로 진행)
+
+        요청이 하나뿐이고 (프롬프트 + 남은 토큰)이 들어가는 bucket이 있을 때 배치 캐시를 정적 캐시로 옮겨
+        이어서 디코딩합니다. 어댑터가 여러 개 등록돼 행별 어댑터를 써야 하면 쓰지 않습니다.
+        이 경로에서는 컴파일된 그래프를 그대로 쓰기 위해 추측 디코딩을 하지 않습니다.
+        """
+        peft_config = getattr(self.model, "peft_config", None)
+        if len(self._active) != 1 or (peft_config and len(peft_config) > 1):
+            self._leave_static()
+            return False
+        request = self._active[0]
+        if not self.static_decoder.active:
+            past_length = self._attention_mask.shape[1]
+            remaining = request.params.max_new_tokens - len(request.output_ids)
+            bucket = self.static_decoder.bucket_for(past_length + remaining)
+            if bucket is None:
+                return False
+            self.static_decoder.begin(self._cache, past_length, bucket)
+            self._cache = None
+
+        logits = self.static_decoder.step(request.output_ids[-1])
+        self._attention_mask = F.pad(self._attention_mask, (0, 1), value=1)
+        self._positions = self._positions + 1
+        request.append_token(self._sample(request, logits[0]))
+        if request.is_finished():
+            self._finish(request)
+            self._select_rows([])
+        return True
+
+    def _leave_static(self):
+        """정적 캐시로 디코딩 중이면 KV를 배치 캐시(DynamicCache)로 되돌림"""
+        if self.static_decoder is not None and self.static_decoder.active:
+            self._cache = self.static_decoder.end()
+
+    def _speculative_step(self) -> bool:
+        """
+        추측 디코딩 스텝 (실행하지 않았으면 False를 반환하고 일반 디코딩 스텝으로 진행)
+
+        요청이 하나뿐일 때만 사용합니다. 여러 요청이 배치로 돌 때는 이미 한 번의 가중치
+        읽기를 여러 토큰이 나눠 쓰고 있고, 행마다 받아들인 토큰 수가 달라 캐시 정렬이 깨지기 때문입니다.
+        sliding window를 넘는 길이에서는 여러 토큰을 한 번에 forward하면 결과가 달라지므로 끕니다.
+        """
+        if len(self._active) != 1:
+            return False
+        request = self._active[0]
+        remaining = request.params.max_new_tokens - len(request.output_ids)
+        draft = _prompt_lookup(request.all_ids, self.prompt_lookup_ngram,
+                               min(self.speculative_tokens, remaining - 1))
+        past_length = self._attention_mask.shape[1]
+        if not draft or not self._can_resume(past_length + len(draft) + 1):
+            return False
+
+        input_ids = torch.tensor([[request.output_ids[-1]] + draft], dtype=torch.long, device=self.device)
+        new_length = input_ids.shape[1]
+        attention_mask = F.pad(self._attention_mask, (0, new_length), value=1)
+        positions = self._positions.unsqueeze(1) + torch.arange(new_length, device=self.device)
+        logits = self._forward(input_ids, attention_mask, positions, self._cache, past_length,
+                               logits_to_keep=new_length, adapters=[request.adapter])[0]
+
+        # 추측한 토큰을 앞에서부터 검증하고, 처음 틀린 위치에서는 모델이 고른 토큰으로 바꾼 뒤 멈춤
+        accepted = 0
+        for row, token in enumerate(draft):
+            chosen = self._verify(request, logits[row], token)
+            request.append_token(chosen)
+            if chosen != token or request.is_finished():
+                break
+            accepted += 1
+        else:
+            # 모두 맞으면 마지막 logits로 한 토큰을 더 얻음
+            request.append_token(self._sample(request, logits[len(draft)]))
+
+        self.speculative_steps += 1
+        self.drafted_tokens += len(draft)
+        self.accepted_tokens += accepted
+
+        if request.is_finished():
+            self._finish(request)
+            self._select_rows([])
+            return True
+
+        # 검증에서 버려진 추측 토큰의 KV를 잘라냄 (마지막으로 뽑은 토큰은 다음 스텝의 입력)
+        produced = accepted + 1
+        rejected = new_length - produced
+        if rejected:
+            for idx in range(len(self._cache.key_cache)):
+                self._cache.key_cache[idx] = self._cache.key_cache[idx][..., :-rejected, :]
+                self._cache.value_cache[idx] = self._cache.value_cache[idx][..., :-rejected, :]
+            self._cache._seen_tokens -= rejected
+        self._attention_mask = attention_mask[:, :past_length + produced]
+        self._positions = self._positions + produced
+        return True
+
+    def _forward(self, input_ids, attention_mask, position_ids, cache, past_length: int,
+                 logits_to_keep: int = 1, adapters: Optional[List[Optional[str]]] = None) -> torch.Tensor:
+        """
+        한 번의 forward를 실행하고 마지막 토큰의 logits(float32)를 반환
+
+        logits_to_keep > 1이면 마지막 logits_to_keep개 토큰의 logits를 (batch, 토큰, vocab)으로 반환
+        adapters는 행별 LoRA 어댑터 이름입니다 (어댑터가 여러 개 등록된 경우에만 사용).
+        """
+        new_length = input_ids.shape[1]
+        kwargs = {}
+        peft_config = getattr(self.model, "peft_config", None)
+        if adapters is not None and peft_config and len(peft_config) > 1:
+            # PEFT의 mixed adapter batch: 행마다 다른 어댑터를 적용
+            default = self.model.active_adapter
+            kwargs["adapter_names"] = [adapter or default for adapter in adapters]
+        if self.sliding is not None:
+            self._fit_sliding_layers(cache, past_length, new_length)
+            # Gemma3 sliding 레이어의 마스크 슬라이싱 기준 (generate()와 동일하게 2D 마스크 길이)
+            kwargs["last_cache_position"] = attention_mask.shape[1]
+
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=cache,
+            cache_position=torch.arange(past_length, past_length + new_length, device=self.device),
+            use_cache=True,
+            logits_to_keep=logits_to_keep,
+            **kwargs,
+        )
+        if logits_to_keep > 1:
+            return outputs.logits.to(dtype=torch.float32)
+        return outputs.logits[:, -1, :].to(dtype=torch.float32)
+
+    def _fit_sliding_layers(self, cache: DynamicCache, past_length: int, new_length: int):
+        """
+        sliding window 레이어의 KV를 window 크기에 맞게 잘라냄
+
+        Gemma3는 sliding 레이어에서 마스크를 window 크기로 잘라 쓰기 때문에
+        (HybridCache처럼) KV도 최근 window 만큼만 남겨야 형태가 맞습니다.
+        """
+        window, layers = self.sliding
+        effective = max(new_length, window)
+        if past_length + new_length <= effective:
+            return
+        keep = max(0, window - new_length)
+        for idx in layers:
+            if idx < len(cache.key_cache) and cache.key_cache[idx].shape[-2] > keep:
+                cache.key_cache[idx] = cache.key_cache[idx][..., cache.key_cache[idx].shape[-2] - keep:, :]
+                cache.value_cache[idx] = cache.value_cache[idx][..., cache.value_cache[idx].shape[-2] - keep:, :]
+
+    def _scores(self, request: GenerationRequest, logits: torch.Tensor) -> torch.Tensor:
+        ids = torch.tensor([request.all_ids], dtype=torch.long, device=logits.device)
+        return request.processors(ids, logits.unsqueeze(0))
+
+    def _generator(self, request: GenerationRequest, device) -> Optional[torch.Generator]:
+        if request.params.seed is not None and request.generator is None:
+            request.generator = torch.Generator(device=device).manual_seed(request.params.seed)
+        return request.generator
+
+    def _sample(self, request: GenerationRequest, logits: torch.Tensor) -> int:
+        scores = self._scores(request, logits)
+        if request.params.do_sample:
+            probs = F.softmax(scores, dim=-1)
+            return int(torch.multinomial(probs, num_samples=1, generator=self._generator(request, probs.device))[0, 0])
+        return int(torch.argmax(scores, dim=-1)[0])
+
+    def _verify(self, request: GenerationRequest, logits: torch.Tensor, token: int) -> int:
+        """
+        추측 토큰 검증 후 이 위치의 토큰을 반환 (추측이 받아들여지면 token 그대로)
+
+        샘플링이면 speculative sampling 규칙을 따릅니다. 프롬프트 룩업 추측은 확률 1로 token을
+        고르는 분포이므로 p(token) 확률로 받아들이고, 거절하면 token을 뺀 p에서 다시 뽑습니다.
+        이렇게 하면 출력 분포가 일반 샘플링과 같습니다.
+        """
+        if not request.params.do_sample:
+            return self._sample(request, logits)
+        probs = F.softmax(self._scores(request, logits), dim=-1)
+        generator = self._generator(request, probs.device)
+        if float(torch.rand(1, generator=generator, device=probs.device)) < float(probs[0, token]):
+            return token
+        probs[0, token] = 0
+        return int(torch.multinomial(probs, num_samples=1, generator=generator)[0, 0])
+
+    # ------------------------------------------------------------------
+    # 배치 KV 캐시 관리
+    # ------------------------------------------------------------------
+    def _merge(self, request: GenerationRequest, cache: DynamicCache, attention_mask, positions):
+        """prefill을 마친 요청의 캐시를 왼쪽 패딩으로 정렬해 배치 캐시에 합침"""
+        if not self._active:
+            self._active = [request]
+            self._cache, self._attention_mask, self._positions = cache, attention_mask, positions
+            return
+
+        self._leave_static()
+        length = max(self._attention_mask.shape[1], attention_mask.shape[1])
+        self._attention_mask = torch.cat(
+            [_left_pad(self._attention_mask, length, dim=1), _left_pad(attention_mask, length, dim=1)], dim=0
+        )
+        for idx in range(len(self._cache.key_cache)):
+            # sliding 레이어는 이미 잘려 있을 수 있으므로 오른쪽 끝을 기준으로 맞춤
+            width = max(self._cache.key_cache[idx].shape[-2], cache.key_cache[idx].shape[-2])
+            if self.sliding is None or idx not in self.sliding[1]:
+                width = length
+            self._cache.key_cache[idx] = torch.cat(
+                [_left_pad(self._cache.key_cache[idx], width), _left_pad(cache.key_cache[idx], width)], dim=0
+            )
+            self._cache.value_cache[idx] = torch.cat(
+                [_left_pad(self._cache.value_cache[idx], width), _left_pad(cache.value_cache[idx], width)], dim=0
+            )
+        self._positions = torch.cat([self._positions, positions])
+        self._active.append(request)
+
+    def _select_rows(self, rows: List[int]):
+        """끝난 요청을 배치에서 제거하고 모든 행에 공통인 왼쪽 패딩을 잘라냄"""
+        self._active = [self._active[row] for row in rows]
+        if not self._active:
+            if self.static_decoder is not None:
+                self.static_decoder.reset()
+            self._cache = self._attention_mask = self._positions = None
+            return
+
+        self._leave_static()
+
+        index = torch.tensor(rows, dtype=torch.long, device=self.device)
+        self._cache.batch_select_indices(index)
+        self._attention_mask = self._attention_mask[index]
+        self._positions = self._positions[index]
+
+        padding = int((self._attention_mask.sum(dim=0) == 0).long().cumprod(dim=0).sum())
+        if padding:
+            self._attention_mask = self._attention_mask[:, padding:]
+            length = self._attention_mask.shape[1]
+            for idx in range(len(self._cache.key_cache)):
+                if self._cache.key_cache[idx].shape[-2] > length:
+                    self._cache.key_cache[idx] = self._cache.key_cache[idx][..., -length:, :]
+                    self._cache.value_cache[idx] = self._cache.value_cache[idx][..., -length:, :]
+
+    def _drop_cancelled(self):
+        """취소된 요청을 배치에서 빼서 더 이상 계산하지 않음"""
+        keep = [row for row, request in enumerate(self._active) if not request.cancelled]
+        if len(keep) == len(self._active):
+            return
+        for request in self._active:
+            if request.cancelled and not request.future.done():
+                request.future.set_exception(RequestCancelled("요청이 취소되었습니다"))
+        self._select_rows(keep)
+
+    def _finish(self, request: GenerationRequest):
+        if not request.future.done():
+            self.stop_reasons[request.stop_reason] += 1
+            request.finished_at = time.monotonic()
+            request.future.set_result(list(request.output_ids))
+
+    def _fail_active(self, error: Exception):
+        for request in self._active:
+            if not request.future.done():
+                request.future.set_exception(error)
+        self._active = []
+        if self.static_decoder is not None:
+            self.static_decoder.reset()
+        self._cache = self._attention_mask = self._positions = None
+
+
+def _session_key(request: GenerationRequest) -> str:
+    """어댑터가 다르면 같은 세션이라도 KV가 다르므로 따로 저장"""
+    if request.adapter is None:
+        return request.session_id
+    return f"{request.adapter}/{request.session_id}"
+
+
+def _left_pad(tensor: torch.Tensor, length: int, dim: int = -2) -> torch.Tensor:
+    """tensor의 dim 축을 왼쪽에 0을 채워 length로 맞춤"""
+    size = tensor.shape[dim]
+    if size >= length:
+        return tensor
+    pad = [0, 0] * (tensor.dim() - (dim % tensor.dim()) - 1) + [length - size, 0]
+    return F.pad(tensor, pad)
@@ -66,16 +66,32 @@ blogForm.addEventListener('submit', async function(e) {
     resultSection.style.display = 'none';
     
     try {
-        const response = await fetch('/generate', {
+        const response = await fetch('/generate_stream', {
             method: 'POST',
             body: formData
         });
         
-        const result = await response.json();
+        // 서버가 바쁘면(503) 스트림 대신 JSON 오류가 옴
+        if (!response.ok) {
+            const result = await response.json();
+            showMessage('오류가 발생했습니다: ' + result.error, 'error');
+            return;
+        }
+        
+        // 생성되는 대로 결과 영역에 이어 붙임
+        generatedPost.textContent = '';
+        let started = false;
+        const result = await readEventStream(response, (text) => {
+            if (!started) {
+                started = true;
+                loadingSpinner.style.display = 'none';
+                resultSection.style.display = 'block';
+            }
+            generatedPost.textContent += text;
+        });
         
         if (result.success) {
             // 성공적으로 생성된 경우
-            generatedPost.textContent = result.generated_post;
             resultSection.style.display = 'block';
             
             // 성공 메시지 표시
@@ -95,6 +111,42 @@ blogForm.addEventListener('submit', async function(e) {
     }
 });
 
+// SSE 응답을 읽으면서 텍스트 조각마다 onText 호출, 마지막 결과(done/error)를 반환
+async function readEventStream(response, onText) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = { success: false, error: '응답이 중간에 끊겼습니다.' };
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // 이벤트는 빈 줄(\n\n)로 구분됨
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        
+        for (const raw of events) {
+            let eventType = 'message';
+            let data = '';
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) eventType = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            if (!data) continue;
+            
+            const payload = JSON.parse(data);
+            if (eventType === 'message') {
+                onText(payload.text);
+            } else {
+                result = payload;
+            }
+        }
+    }
+    return result;
+}
+
 // 복사 버튼 이벤트
 copyBtn.addEventListener('click', function() {
     const text = generatedPost.textContent;
@@ -203,6 +255,126 @@ const suggestionOverlay = document.getElementById('suggestion-overlay');
 let currentSuggestion = '';
 let debounceTimer;
 let isAutocompleteEnabled = false; // 자동완성 기능 활성화 상태, 초기값은 false
+// 서버가 이 입력창의 이전 입력 KV를 재사용할 수 있도록 페이지마다 고유한 세션 id
+const autocompleteSessionId = (window.crypto && crypto.randomUUID)
+    ? crypto.randomUUID()
+    : Date.now().toString(36) + Math.random().toString(36).slice(2);
+let autocompleteSeq = 0;           // 요청 순번 (서버가 오래된 요청을 버리는 기준)
+let autocompleteController = null; // 진행 중인 요청을 취소하기 위한 AbortController
+// WebSocket 자동완성: 전체 텍스트 대신 바뀐 부분(편집)만 보내고, 서버가 입력이 멈추면 추천을 보내 줌
+// 연결이 안 되어 있으면 기존처럼 HTTP(/text_autocomplete)로 요청
+let autocompleteSocket = null;
+let documentVersion = 0; // 서버에 보낸 편집 번호 (추천이 어느 텍스트 기준인지 확인)
+let syncedText = '';     // 서버가 가지고 있는 텍스트
+
+// 진행 중인 자동완성 요청 취소 (텍스트가 바뀌면 이전 추천은 쓸모없음)
+function abortAutocomplete() {
+    if (autocompleteController) {
+        autocompleteController.abort();
+        autocompleteController = null;
+    }
+}
+
+function socketReady() {
+    return autocompleteSocket !== null && autocompleteSocket.readyState === WebSocket.OPEN;
+}
+
+function connectAutocompleteSocket() {
+    if (!('WebSocket' in window) || autocompleteSocket !== null) return;
+    const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const socket = new WebSocket(`${protocol}//${location.host}/text_autocomplete/ws`);
+    autocompleteSocket = socket;
+
+    socket.addEventListener('open', () => sendReset(false));
+    socket.addEventListener('message', (event) => handleSocketMessage(JSON.parse(event.data)));
+    socket.addEventListener('close', () => {
+        if (autocompleteSocket !== socket) return; // 자동완성을 꺼서 닫은 연결
+        autocompleteSocket = null;
+        // 끊기면 잠시 뒤 다시 연결 (그동안은 HTTP로 요청)
+        if (isAutocompleteEnabled) setTimeout(connectAutocompleteSocket, 3000);
+    });
+}
+
+function closeAutocompleteSocket() {
+    if (autocompleteSocket !== null) {
+        const socket = autocompleteSocket;
+        autocompleteSocket = null;
+        socket.close();
+    }
+}
+
+// 서버 문서를 지금 텍스트 전체로 맞춤 (연결 직후, 서버가 편집을 적용하지 못했을 때)
+function sendReset(suggest) {
+    syncedText = detailsTextarea.value;
+    documentVersion += 1;
+    autocompleteSocket.send(JSON.stringify({
+        type: 'reset', text: syncedText, version: documentVersion, suggest: suggest
+    }));
+}
+
+// 마지막으로 보낸 텍스트와 달라진 부분만 보냄
+function sendEdit(suggest) {
+    const text = detailsTextarea.value;
+    const edit = diffText(syncedText, text);
+    if (edit === null) return;
+    syncedText = text;
+    documentVersion += 1;
+    autocompleteSocket.send(JSON.stringify({
+        type: 'edit', offset: edit.offset, delete: edit.delete, insert: edit.insert,
+        version: documentVersion, suggest: suggest
+    }));
+}
+
+// 두 텍스트의 차이를 편집 하나(offset 위치에서 delete 글자를 지우고 insert를 넣음)로 계산
+// 서버(Python 문자열)와 맞추기 위해 offset/delete는 UTF-16 단위가 아닌 글자(코드 포인트) 단위
+function diffText(before, after) {
+    if (before === after) return null;
+    const shorter = Math.min(before.length, after.length);
+    let start = 0;
+    while (start < shorter && before[start] === after[start]) start++;
+    let end = 0;
+    while (end < shorter - start && before[before.length - 1 - end] === after[after.length - 1 - end]) end++;
+    // 이모지처럼 두 단위로 된 글자(서로게이트 쌍)의 중간에서 자르지 않음
+    if (start > 0 && isHighSurrogate(before.charCodeAt(start - 1))) start--;
+    if (end > 0 && isLowSurrogate(before.charCodeAt(before.length - end))) end--;
+    return {
+        offset: Array.from(before.slice(0, start)).length,
+        delete: Array.from(before.slice(start, before.length - end)).length,
+        insert: after.slice(start, after.length - end)
+    };
+}
+
+function isHighSurrogate(code) {
+    return code >= 0xD800 && code <= 0xDBFF;
+}
+
+function isLowSurrogate(code) {
+    return code >= 0xDC00 && code <= 0xDFFF;
+}
+
+function handleSocketMessage(message) {
+    if (message.type === 'resync') {
+        sendReset(true);
+    } else if (message.type === 'suggestion') {
+        // 그 사이 더 입력했다면 이 추천은 버림
+        if (!isAutocompleteEnabled || message.version !== documentVersion) return;
+        showSuggestion(detailsTextarea.value, message.suggestion);
+    } else if (message.type === 'error') {
+        console.error('Autocomplete error:', message.error);
+    }
+}
+
+// 현재 텍스트와 추천 텍스트가 겹치지 않게 표시
+function showSuggestion(prompt, suggestion) {
+    if (suggestion) {
+        const pre = ' '.repeat(prompt.length);
+        suggestionOverlay.innerText = pre + suggestion;
+        currentSuggestion = suggestion;
+    } else {
+        suggestionOverlay.innerText = '';
+        currentSuggestion = '';
+    }
+}
 
 // 자동완성 ON/OFF 토글 버튼 이벤트 리스너
 autocompleteBtn.addEventListener('click', () => {
@@ -211,8 +383,10 @@ autocompleteBtn.addEventListener('click', () => {
 
     if (isAutocompleteEnabled) {
         autocompleteBtn.innerHTML = '✨ 자동완성 ON';
+        connectAutocompleteSocket();
     } else {
         autocompleteBtn.innerHTML = '✨ 자동완성 OFF';
+        closeAutocompleteSocket();
         suggestionOverlay.innerText = ''; // 기능을 끄면 보이는 추천 단어 지우기
         currentSuggestion = '';
     }
@@ -223,13 +397,17 @@ detailsTextarea.addEventListener('input', () => {
     if (!isAutocompleteEnabled) return; // 기능이 꺼져있으면 여기서 중단
 
     clearTimeout(debounceTimer);
+    abortAutocomplete();
     const prompt = detailsTextarea.value;
+    // WebSocket이면 편집만 보냄 (입력이 멈추면 서버가 추천을 보내 줌)
+    if (socketReady()) sendEdit(true);
 
     if (prompt.trim().length === 0) {
         suggestionOverlay.innerText = '';
         currentSuggestion = '';
         return;
     }
+    if (socketReady()) return;
 
     debounceTimer = setTimeout(() => {
         fetchAutocomplete(prompt);
@@ -244,6 +422,8 @@ detailsTextarea.addEventListener('keydown', (e) => {
         detailsTextarea.value += currentSuggestion;
         suggestionOverlay.innerText = '';
         currentSuggestion = '';
+        // 서버 문서도 맞춰 둠 (받아들인 직후에는 새 추천을 요청하지 않음)
+        if (socketReady()) sendEdit(false);
     }
 });
 
@@ -255,26 +435,32 @@ detailsTextarea.addEventListener('blur', () => {
 
 // 자동완성 API 호출 함수
 async function fetchAutocomplete(prompt) {
+    abortAutocomplete();
+    const controller = new AbortController();
+    autocompleteController = controller;
+    const seq = ++autocompleteSeq;
+
     try {
         const response = await fetch('/text_autocomplete', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ prompt: prompt })
+            body: JSON.stringify({ prompt: prompt, session_id: autocompleteSessionId, seq: seq }),
+            signal: controller.signal
         });
         const result = await response.json();
 
-        if (result.success && result.suggestion) {
-            // 현재 텍스트와 추천 텍스트가 겹치지 않게 표시
-            const pre = ' '.repeat(prompt.length);
-            suggestionOverlay.innerText = pre + result.suggestion;
-            currentSuggestion = result.suggestion;
-        } else {
-            suggestionOverlay.innerText = '';
-            currentSuggestion = '';
-        }
+        // 그 사이 더 새로운 요청을 보냈다면 이 결과는 버림
+        if (seq !== autocompleteSeq) return;
+
+        showSuggestion(prompt, result.success ? result.suggestion : '');
     } catch (error) {
+        if (error.name === 'AbortError') return; // 새 입력으로 취소된 요청
         console.error('Autocomplete error:', error);
         suggestionOverlay.innerText = '';
         currentSuggestion = '';
+    } finally {
+        if (autocompleteController === controller) {
+            autocompleteController = null;
+        }
     }
-} 
\ No newline at end of file
+}
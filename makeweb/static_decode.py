@@ -0,0 +1,234 @@
+"""
+정적 KV 캐시 + torch.compile 디코딩 스텝 (opt-in)
+
+배치에 요청이 하나뿐일 때(대부분의 블로그 포스트 생성) 디코딩 스텝은 토큰 하나짜리 forward를 1000번 반복하므로,
+DynamicCache가 스텝마다 torch.cat으로 KV를 새로 만들고 eager 모드로 커널을 하나씩 실행하는 비용이
+토큰당 지연의 큰 부분을 차지합니다. 이 모드에서는
+
+- 길이 구간(bucket)별로 미리 할당해 둔 정적 KV 캐시에 제자리(in-place)로 KV를 쓰고,
+- 모양이 고정된 디코딩 forward를 torch.compile로 컴파일해 (CUDA에서는 CUDA graph까지) 실행합니다.
+
+컴파일은 서버 시작 시 bucket마다 몇 스텝을 미리 돌려(warmup) 첫 요청이 컴파일을 기다리지 않게 합니다.
+요청이 둘 이상이 되면 KV를 DynamicCache로 되돌려 기존 연속 배칭 경로로 이어서 생성합니다.
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from transformers import DynamicCache
+from transformers.cache_utils import Cache
+
+
+# 기본 길이 구간 (자동완성 / 짧은 글 / 프롬프트 + 1000 토큰 포스트)
+DEFAULT_BUCKETS = (512, 1024, 2048)
+
+
+class StaticKVCache(Cache):
+    """
+    한 요청(batch 1)용 고정 크기 KV 캐시
+
+    전체 attention 레이어는 위치 = 인덱스로 max_len까지 저장하고, sliding window 레이어는 window 크기의
+    버퍼에 최근 window개 토큰을 순서대로 보관합니다 (HybridCache와 같은 배치라 Gemma3의 마스크 슬라이싱과 맞음).
+    모든 갱신은 제자리에서 하므로 텐서 주소가 바뀌지 않습니다.
+    """
+
+    def __init__(self, num_layers: int, kv_heads: int, head_dim: int, max_len: int, device, dtype,
+                 sliding: Optional[tuple] = None):
+        super().__init__()
+        self.max_len = max_len
+        self.window = min(sliding[0], max_len) if sliding else None
+        self.sliding_layers = set(sliding[1]) if sliding else set()
+        self.key_cache: List[torch.Tensor] = []
+        self.value_cache: List[torch.Tensor] = []
+        for idx in range(num_layers):
+            length = self.window if idx in self.sliding_layers else max_len
+            for caches in (self.key_cache, self.value_cache):
+                tensor = torch.zeros((1, kv_heads, length, head_dim), dtype=dtype, device=device)
+                if tensor.is_cuda:
+                    torch._dynamo.mark_static_address(tensor)
+                caches.append(tensor)
+        self.length = 0
+
+    def get_seq_length(self, layer_idx: Optional[int] = 0) -> int:
+        return self.length
+
+    def get_max_cache_shape(self) -> int:
+        return self.max_len
+
+    def update(self, key_states: torch.Tensor, value_states: torch.Tensor, layer_idx: int,
+               cache_kwargs: Optional[dict] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        position = cache_kwargs["cache_position"]
+        keys, values = self.key_cache[layer_idx], self.value_cache[layer_idx]
+        if layer_idx in self.sliding_layers and self.window < self.max_len:
+            # 버퍼가 차 있으면(position >= window) 한 칸 왼쪽으로 밀고 마지막 칸에 씀 (분기 없이 계산)
+            shift = (position >= self.window).long()
+            index = (torch.arange(self.window, device=position.device) + shift) % self.window
+            slot = position.clamp(max=self.window - 1)
+            shifted_keys, shifted_values = keys[:, :, index], values[:, :, index]
+            shifted_keys[:, :, slot] = key_states.to(keys.dtype)
+            shifted_values[:, :, slot] = value_states.to(values.dtype)
+            keys.copy_(shifted_keys)
+            values.copy_(shifted_values)
+        else:
+            keys.index_copy_(2, position, key_states.to(keys.dtype))
+            values.index_copy_(2, position, value_states.to(values.dtype))
+        return keys, values
+
+    def load(self, cache: DynamicCache, length: int):
+        """한 행짜리(패딩 없는) DynamicCache의 KV를 복사해 옴"""
+        for idx in range(len(self.key_cache)):
+            for target, source in ((self.key_cache[idx], cache.key_cache[idx]),
+                                   (self.value_cache[idx], cache.value_cache[idx])):
+                target.zero_()
+                if idx in self.sliding_layers and self.window < self.max_len:
+                    # DynamicCache의 sliding 레이어는 최근 window개 이하만 들고 있음
+                    keep = min(length, self.window)
+                    target[:, :, :keep] = source[:, :, -keep:]
+                else:
+                    target[:, :, :length] = source[:, :, -length:]
+        self.length = length
+
+    def to_dynamic(self) -> DynamicCache:
+        """지금까지의 KV를 DynamicCache로 (배치 경로로 돌아갈 때)"""
+        cache = DynamicCache()
+        for idx in range(len(self.key_cache)):
+            if idx in self.sliding_layers and self.window < self.max_len:
+                keep = min(self.length, self.window)
+            else:
+                keep = self.length
+            cache.key_cache.append(self.key_cache[idx][:, :, :keep].clone())
+            cache.value_cache.append(self.value_cache[idx][:, :, :keep].clone())
+        cache._seen_tokens = self.length
+        return cache
+
+
+def _kv_layout(model) -> Optional[tuple]:
+    """(레이어 수, KV 헤드 수, head_dim, dtype), 설정에서 알 수 없으면 None"""
+    config = getattr(model, "config", None)
+    config = getattr(config, "text_config", config)
+    layers = getattr(config, "num_hidden_layers", None)
+    heads = getattr(config, "num_attention_heads", None)
+    if not layers or not heads:
+        return None
+    kv_heads = getattr(config, "num_key_value_heads", None) or heads
+    head_dim = getattr(config, "head_dim", None) or config.hidden_size // heads
+    return layers, kv_heads, head_dim, model.get_input_embeddings().weight.dtype
+
+
+class StaticDecoder:
+    """
+    bucket별 정적 캐시와 컴파일된 디코딩 forward
+
+    스케줄러 스레드에서만 사용합니다. begin()으로 요청의 KV를 옮겨 오고, step()으로 한 토큰씩 디코딩하며,
+    배치 경로로 돌아갈 때는 end()로 DynamicCache를 돌려받습니다.
+    """
+
+    def __init__(self, model, device, sliding: Optional[tuple], buckets=DEFAULT_BUCKETS, compile: bool = True):
+        layout = _kv_layout(model)
+        if layout is None:
+            raise ValueError("모델 설정에서 KV 캐시 모양을 알 수 없습니다")
+        self.model = model
+        self.device = device
+        self.sliding = sliding
+        self.layout = layout
+        self.buckets = tuple(sorted(buckets))
+        self._caches: Dict[int, StaticKVCache] = {}
+        self._masks: Dict[int, torch.Tensor] = {}
+        self._forward = self._eager_forward
+        if compile:
+            # CUDA에서는 CUDA graph로 커널 실행 비용까지 줄임 (정적 캐시와 마스크는 주소가 고정돼 있음)
+            mode = "reduce-overhead" if device.type == "cuda" else None
+            self._forward = torch.compile(self._eager_forward, mode=mode, dynamic=False)
+        self.cache: Optional[StaticKVCache] = None
+        self.mask: Optional[torch.Tensor] = None
+        self.steps = 0
+
+    def bucket_for(self, length: int) -> Optional[int]:
+        """length 토큰이 들어가는 가장 작은 bucket (없으면 None)"""
+        for bucket in self.buckets:
+            if length <= bucket:
+                return bucket
+        return None
+
+    def _buffers(self, bucket: int) -> Tuple[StaticKVCache, torch.Tensor]:
+        if bucket not in self._caches:
+            layers, kv_heads, head_dim, dtype = self.layout
+            self._caches[bucket] = StaticKVCache(layers, kv_heads, head_dim, bucket, self.device, dtype,
+                                                 sliding=self.sliding)
+            # (1, 1, 1, bucket) 가산 마스크: 0이면 볼 수 있는 위치, 최솟값이면 가려진 위치
+            self._masks[bucket] = torch.full((1, 1, 1, bucket), torch.finfo(dtype).min, dtype=dtype,
+                                             device=self.device)
+        return self._caches[bucket], self._masks[bucket]
+
+    def begin(self, cache: DynamicCache, length: int, bucket: int):
+        self.cache, self.mask = self._buffers(bucket)
+        self.cache.load(cache, length)
+        self.mask.fill_(torch.finfo(self.mask.dtype).min)
+        self.mask[..., :length] = 0
+
+    def end(self) -> DynamicCache:
+        cache = self.cache.to_dynamic()
+        self.cache = self.mask = None
+        return cache
+
+    def reset(self):
+        self.cache = self.mask = None
+
+    @property
+    def active(self) -> bool:
+        return self.cache is not None
+
+    @property
+    def length(self) -> int:
+        return self.cache.length
+
+    def _eager_forward(self, input_ids, position_ids, cache_position, mask, cache):
+        kwargs = {}
+        if self.sliding is not None:
+            # Gemma3 sliding 레이어는 마스크를 [last_cache_position - window, last_cache_position)로 잘라 씀.
+            # 0으로 고정하면 항상 앞의 window 칸을 쓰는데, 링 버퍼에서 j번째 칸이 보이는 조건(j <= 위치)이
+            # 전체 레이어의 j번째 위치와 같으므로 마스크 하나로 두 레이어가 맞고, 값이 바뀌며 재컴파일되지도 않음
+            kwargs["last_cache_position"] = 0
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=mask,
+            position_ids=position_ids,
+            past_key_values=cache,
+            cache_position=cache_position,
+            use_cache=True,
+            logits_to_keep=1,
+            **kwargs,
+        )
+        return outputs.logits[:, -1, :]
+
+    @torch.no_grad()
+    def step(self, token_id: int) -> torch.Tensor:
+        """토큰 하나를 넣고 다음 토큰 logits(float32, [1, vocab])를 반환"""
+        position = self.cache.length
+        self.mask[..., position] = 0
+        input_ids = torch.tensor([[token_id]], dtype=torch.long, device=self.device)
+        cache_position = torch.tensor([position], dtype=torch.long, device=self.device)
+        logits = self._forward(input_ids, cache_position.unsqueeze(0), cache_position, self.mask, self.cache)
+        self.cache.length = position + 1
+        self.steps += 1
+        # CUDA graph 출력 버퍼는 다음 실행 때 덮어쓰이므로 복사해서 돌려줌
+        return logits.to(dtype=torch.float32, copy=True)
+
+    @torch.no_grad()
+    def warmup(self, steps: int = 3):
+        """bucket마다 몇 스텝을 실행해 컴파일을 끝내 둠 (위치가 바뀌는 경우까지 컴파일되도록 여러 스텝)"""
+        layers = self.layout[0]
+        for bucket in self.buckets:
+            started = time.time()
+            empty = DynamicCache()
+            for _ in range(layers):
+                shape = (1, self.layout[1], 1, self.layout[2])
+                empty.key_cache.append(torch.zeros(shape, dtype=self.layout[3], device=self.device))
+                empty.value_cache.append(torch.zeros(shape, dtype=self.layout[3], device=self.device))
+            self.begin(empty, 1, bucket)
+            for _ in range(steps):
+                self.step(0)
+            self.reset()
+            print(f"Static decode bucket {bucket} ready ({time.time() - started:.1f}s)")
+        self.steps = 0
@@ -0,0 +1,108 @@
+"""
+생성 종료 조건
+
+요청마다 종료 조건 목록을 만들어 두고, 스케줄러가 토큰을 추가할 때마다(디코딩 루프 안에서)
+확인합니다. 조건이 하나라도 맞으면 그 자리에서 생성을 멈추고 어떤 조건으로 멈췄는지 남깁니다.
+
+- eos: 종료 토큰이 나옴
+- stop: 지정한 문자열(예: 자동완성의 줄바꿈)이 생성된 텍스트에 나옴
+- length: 토큰 예산(max_new_tokens)을 다 씀
+- deadline: 요청을 제출한 뒤 제한 시간이 지남 (대기열에서 기다린 시간 포함)
+"""
+
+import time
+from typing import List, Optional, Sequence
+
+from streaming import IncrementalDetokenizer
+
+
+class StoppingCriteria:
+    """요청 하나의 종료 조건 (reason은 이 조건으로 멈췄을 때 남기는 이름)"""
+
+    reason = ""
+
+    def __call__(self, output_ids: List[int]) -> bool:
+        raise NotImplementedError
+
+
+class EosTokenCriteria(StoppingCriteria):
+    reason = "eos"
+
+    def __init__(self, eos_token_ids: Sequence[int]):
+        self.eos_token_ids = set(eos_token_ids)
+
+    def __call__(self, output_ids: List[int]) -> bool:
+        return bool(output_ids) and output_ids[-1] in self.eos_token_ids
+
+
+class MaxNewTokensCriteria(StoppingCriteria):
+    reason = "length"
+
+    def __init__(self, max_new_tokens: int):
+        self.max_new_tokens = max_new_tokens
+
+    def __call__(self, output_ids: List[int]) -> bool:
+        return len(output_ids) >= self.max_new_tokens
+
+
+class StopStringCriteria(StoppingCriteria):
+    """
+    생성된 텍스트에 stop 문자열이 나오면 종료
+
+    확인할 때마다 전체를 다시 디코딩하지 않도록 새 토큰만 증분 디코딩하고,
+    토큰 경계에 걸친 문자열도 찾을 수 있게 새 텍스트 앞쪽으로 (가장 긴 stop 문자열 - 1)글자만 같이 봅니다.
+    """
+
+    reason = "stop"
+
+    def __init__(self, tokenizer, stop_strings: Sequence[str]):
+        self.stop_strings = list(stop_strings)
+        self._detokenizer = IncrementalDetokenizer(tokenizer)
+        self._overlap = max(len(stop) for stop in self.stop_strings) - 1
+        self._tail = ""
+        self._seen = 0
+
+    def __call__(self, output_ids: List[int]) -> bool:
+        new_text = "".join(self._detokenizer.push(token_id) for token_id in output_ids[self._seen:])
+        self._seen = len(output_ids)
+        if not new_text:
+            return False
+        text = self._tail + new_text
+        self._tail = text[-self._overlap:] if self._overlap else ""
+        return any(stop in text for stop in self.stop_strings)
+
+
+class DeadlineCriteria(StoppingCriteria):
+    """만들어진 시점(요청 제출 시점)부터 seconds초가 지나면 종료"""
+
+    reason = "deadline"
+
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+
+    def __call__(self, output_ids: List[int]) -> bool:
+        return time.monotonic() >= self.deadline
+
+
+def build_stopping_criteria(params, tokenizer=None) -> List[StoppingCriteria]:
+    """SamplingParams로 종료 조건 목록 구성 (stop 문자열은 tokenizer가 있어야 확인 가능)"""
+    criteria: List[StoppingCriteria] = []
+    if params.eos_token_ids:
+        criteria.append(EosTokenCriteria(params.eos_token_ids))
+    stop_strings = [stop for stop in params.stop_strings if stop]
+    if stop_strings:
+        if tokenizer is None:
+            raise ValueError("stop_strings를 쓰려면 tokenizer가 필요합니다")
+        criteria.append(StopStringCriteria(tokenizer, stop_strings))
+    criteria.append(MaxNewTokensCriteria(params.max_new_tokens))
+    if params.deadline_seconds:
+        criteria.append(DeadlineCriteria(params.deadline_seconds))
+    return criteria
+
+
+def check_stopping_criteria(criteria: List[StoppingCriteria], output_ids: List[int]) -> Optional[str]:
+    """맞은 조건의 reason (아무 조건도 맞지 않으면 None)"""
+    for condition in criteria:
+        if condition(output_ids):
+            return condition.reason
+    return None
@@ -0,0 +1,107 @@
+"""
+토큰 스트리밍 유틸리티
+
+스케줄러 스레드에서 생성된 토큰을 asyncio 쪽으로 넘겨주고,
+새로 생성된 토큰만 증분 디코딩해서 텍스트 조각으로 돌려줍니다.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, List, Optional
+
+# 연결이 끊길 때마다 stdout에 쓰지 않도록 debug 로그로만 남김 (요청별 기록은 metrics.RequestLogger)
+logger = logging.getLogger(__name__)
+
+
+class IncrementalDetokenizer:
+    """새 토큰이 들어올 때마다 추가된 텍스트만 돌려주는 증분 디코더"""
+
+    def __init__(self, tokenizer, skip_special_tokens: bool = True):
+        self.tokenizer = tokenizer
+        self.skip_special_tokens = skip_special_tokens
+        self.token_ids: List[int] = []
+        # 직전에 내보낸 텍스트의 시작/끝 토큰 위치 (앞뒤 문맥을 같이 디코딩해 공백/바이트 조각을 맞춤)
+        self.prefix_offset = 0
+        self.read_offset = 0
+
+    def _decode(self, token_ids: List[int]) -> str:
+        return self.tokenizer.decode(token_ids, skip_special_tokens=self.skip_special_tokens)
+
+    def push(self, token_id: int) -> str:
+        self.token_ids.append(token_id)
+        prefix_text = self._decode(self.token_ids[self.prefix_offset:self.read_offset])
+        new_text = self._decode(self.token_ids[self.prefix_offset:])
+
+        # 멀티바이트 문자가 아직 완성되지 않았으면(�) 다음 토큰까지 기다림
+        if len(new_text) <= len(prefix_text) or new_text.endswith("\ufffd"):
+            return ""
+        self.prefix_offset = self.read_offset
+        self.read_offset = len(self.token_ids)
+        return new_text[len(prefix_text):]
+
+
+class TokenStream:
+    """스케줄러 스레드의 토큰 콜백을 async iterator로 바꿔주는 통로"""
+
+    _DONE = object()
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._future: Future = None
+
+    def put(self, token_id: int):
+        """스케줄러 스레드에서 호출 (thread-safe)"""
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, token_id)
+
+    def attach(self, future: Future):
+        """요청이 끝나면 스트림도 닫히도록 future에 연결"""
+        self._future = future
+        future.add_done_callback(lambda _: self._loop.call_soon_threadsafe(self._queue.put_nowait, self._DONE))
+
+    async def __aiter__(self):
+        while True:
+            item = await self._queue.get()
+            if item is self._DONE:
+                break
+            yield item
+        if self._future.cancelled():
+            # 대기열에서 취소된 요청은 future 자체가 취소됨 (생성 중 취소와 같이 RequestCancelled로 알림)
+            # scheduler -> stopping -> streaming 순서로 import하므로 여기서 불러옴
+            from scheduler import RequestCancelled
+
+            raise RequestCancelled("요청이 취소되었습니다")
+        # 생성 중 오류가 있었다면 여기서 다시 발생시킴
+        self._future.result()
+
+
+@asynccontextmanager
+async def cancel_on_disconnect(generation, is_disconnected: Optional[Callable[[], Awaitable[bool]]],
+                               interval: float = 0.25):
+    """
+    블록이 실행되는 동안 클라이언트 연결을 주기적으로 확인하고,
+    끊기면 생성 요청을 취소 (스케줄러가 다음 디코딩 스텝에서 배치에서 뺌)
+    블록을 기다리던 태스크가 취소되어도 생성 요청을 취소합니다.
+
+    is_disconnected는 starlette의 request.is_disconnected 같은 async 함수입니다.
+    """
+    async def watch():
+        while not generation.future.done():
+            if await is_disconnected():
+                logger.debug("클라이언트 연결이 끊겨 생성을 중단합니다.")
+                generation.cancel()
+                return
+            await asyncio.sleep(interval)
+
+    watcher = asyncio.create_task(watch()) if is_disconnected is not None else None
+    try:
+        yield
+    except asyncio.CancelledError:
+        # 기다리던 쪽(태스크)이 취소되면 생성도 취소
+        generation.cancel()
+        raise
+    finally:
+        if watcher is not None:
+            watcher.cancel()
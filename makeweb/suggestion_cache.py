@@ -0,0 +1,80 @@
+"""
+자동완성 추천 캐시
+
+자동완성은 greedy 디코딩이라 같은 입력에는 항상 같은 추천이 나옵니다.
+입력의 끝부분(tail)을 키로 추천을 저장해 두고, 지우고 다시 치거나
+추천된 글자를 그대로 따라 치는 경우에는 모델을 돌리지 않고 바로 응답합니다.
+"""
+
+from collections import OrderedDict
+from typing import Optional
+
+
+class SuggestionCache:
+    """입력 끝부분 기준 자동완성 추천 LRU 캐시"""
+
+    def __init__(self, max_entries: int = 10000, tail_chars: int = 256):
+        self.max_entries = max_entries
+        self.tail_chars = tail_chars
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        # 저장된 추천 중 가장 긴 길이 (따라 친 글자를 몇 개까지 거슬러 볼지의 상한)
+        self._longest = 0
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+
+    def _key(self, prompt: str) -> str:
+        return prompt.replace("\r\n", "\n")[-self.tail_chars:]
+
+    def _get(self, key: str) -> Optional[str]:
+        suggestion = self._entries.get(key)
+        if suggestion is not None:
+            self._entries.move_to_end(key)
+        return suggestion
+
+    def lookup(self, prompt: str) -> Optional[str]:
+        """
+        캐시된 추천 반환 (없으면 None)
+
+        1) 같은 입력에 대한 추천이 있으면 그대로 반환
+        2) 이전 입력 + (그 추천의 앞부분)을 사용자가 직접 친 경우라면 추천의 남은 부분을 반환
+        """
+        prompt = prompt.replace("\r\n", "\n")
+        suggestion = self._get(self._key(prompt))
+        if suggestion is not None:
+            self.hits += 1
+            return suggestion
+
+        # 사용자가 추천을 따라 친 글자 수(typed)만큼 뒤에서 잘라 이전 입력을 찾음
+        for typed in range(1, min(self._longest, len(prompt)) + 1):
+            suggestion = self._get(self._key(prompt[:-typed]))
+            if suggestion is None:
+                continue
+            # 추천은 앞 공백을 뺀(strip) 형태로 저장되어 있으므로 친 글자도 앞 공백을 무시하고 비교
+            typed_text = prompt[-typed:].lstrip()
+            if suggestion.startswith(typed_text) and len(typed_text) < len(suggestion):
+                self.partial_hits += 1
+                # 모델 경로와 같은 형태(앞뒤 공백 제거)로 반환
+                return suggestion[len(typed_text):].strip()
+
+        self.misses += 1
+        return None
+
+    def put(self, prompt: str, suggestion: str):
+        if not suggestion:
+            return
+        key = self._key(prompt)
+        self._entries[key] = suggestion
+        self._entries.move_to_end(key)
+        self._longest = max(self._longest, len(suggestion))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "partial_hits": self.partial_hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,53 @@
+"""
+테스트 공통 설정
+
+makeweb의 모듈은 `from scheduler import ...`처럼 평평하게 import하고, main.py는 static/templates를
+현재 디렉터리 기준으로 찾으므로 makeweb 디렉터리를 import 경로와 작업 디렉터리로 씁니다.
+서버 테스트는 모델 없이 도는 가짜 backend(fake_backend.py)로 실행합니다.
+"""
+
+import os
+import sys
+
+import pytest
+
+MAKEWEB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAKEWEB_DIR)
+os.chdir(MAKEWEB_DIR)
+
+import config  # noqa: E402
+
+
+@pytest.fixture
+def fake_config(tmp_path, monkeypatch):
+    """가짜 backend + 임시 작업 DB 설정 (테스트에서 값을 더 바꾼 뒤 TestClient를 시작)"""
+    monkeypatch.setattr(config, "BACKEND", "fake")
+    monkeypatch.setattr(config, "FAKE_TOKEN_LATENCY", 0.001)
+    monkeypatch.setattr(config, "FAKE_PREFILL_LATENCY", 0.0)
+    monkeypatch.setattr(config, "MAX_NEW_TOKENS", 40)
+    monkeypatch.setattr(config, "MERGED_MODEL_PATH", None)
+    monkeypatch.setattr(config, "CATEGORY_ADAPTERS", {})
+    monkeypatch.setattr(config, "NUM_REPLICAS", 1)
+    monkeypatch.setattr(config, "AUTOCOMPLETE_MODEL", None)
+    monkeypatch.setattr(config, "RESPONSE_CACHE_SIZE", 0)
+    monkeypatch.setattr(config, "KV_CACHE_BYTES", 0)
+    monkeypatch.setattr(config, "COMPILE_DECODE", False)
+    monkeypatch.setattr(config, "LOG_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(config, "JOB_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(config, "JOB_CONCURRENCY", 1)
+    return config
+
+
+@pytest.fixture(scope="session")
+def tiny_model():
+    """무작위 가중치의 아주 작은 Gemma3 텍스트 모델 (sliding window 레이어 포함, 가짜 토크나이저의 어휘 크기)"""
+    import torch
+    from transformers import Gemma3ForCausalLM, Gemma3TextConfig
+
+    torch.manual_seed(0)
+    model_config = Gemma3TextConfig(
+        vocab_size=0x10000, hidden_size=32, intermediate_size=64, num_hidden_layers=3, num_attention_heads=2,
+        num_key_value_heads=1, head_dim=16, sliding_window=8, sliding_window_pattern=3,
+        max_position_embeddings=1024, eos_token_id=1, pad_token_id=0,
+    )
+    return Gemma3ForCausalLM(model_config).eval()
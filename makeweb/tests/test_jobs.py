@@ -0,0 +1,140 @@
+"""비동기 작업 API (/jobs): 완료, 취소, 대기열이 찼을 때 재시도, 실패, 재시작 후 이어서 처리"""
+
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from jobs import JOB_DONE, JobStore
+from scheduler import QueueFullError, RequestTooLarge
+
+
+def submit_job(client, details: str = "테스트", seed: int = 0) -> str:
+    response = client.post("/jobs", data={"category": "카페", "details": details, "seed": seed})
+    assert response.status_code == 200
+    return response.json()["job_id"]
+
+
+def wait_for_job(client, job_id: str, timeout: float = 10.0) -> dict:
+    """작업이 끝날 때까지 폴링"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("done", "failed", "cancelled"):
+            return job
+        time.sleep(0.02)
+    pytest.fail(f"작업 {job_id}이 {timeout}초 안에 끝나지 않았습니다 ({job['status']})")
+
+
+def test_job_finishes_with_same_text_as_direct_generation(fake_config):
+    with TestClient(main.app) as client:
+        job_id = submit_job(client, seed=7)
+        job = wait_for_job(client, job_id)
+        assert job["status"] == "done"
+        assert job["result"] == main.blog_generator.generate_blog_post("카페", job["fields"], "테스트", seed=7)
+
+        # 끝난 작업의 WebSocket은 마지막 이벤트만 보냄
+        with client.websocket_connect(f"/jobs/{job_id}/ws") as websocket:
+            assert websocket.receive_json() == {"type": "done", "result": job["result"]}
+
+
+def test_running_job_can_be_cancelled(fake_config):
+    fake_config.MAX_NEW_TOKENS = 100000
+    with TestClient(main.app) as client:
+        job_id = submit_job(client)
+        with client.websocket_connect(f"/jobs/{job_id}/ws") as websocket:
+            assert websocket.receive_json()["type"] == "status"
+            # 생성이 시작된 뒤 취소
+            assert websocket.receive_json()["type"] == "delta"
+            response = client.delete(f"/jobs/{job_id}").json()
+            assert response["success"] and response["status"] == "cancelled"
+            event = websocket.receive_json()
+            while event["type"] == "delta":
+                event = websocket.receive_json()
+            assert event == {"type": "cancelled"}
+        assert not client.delete(f"/jobs/{job_id}").json()["success"]
+        assert wait_for_job(client, job_id)["status"] == "cancelled"
+        # 취소된 요청은 스케줄러 배치에서도 빠짐
+        deadline = time.monotonic() + 5.0
+        while main.blog_generator.scheduler.stats()["active"] and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert main.blog_generator.scheduler.stats()["active"] == 0
+
+
+def test_job_is_requeued_when_scheduler_queue_is_full(fake_config, monkeypatch):
+    with TestClient(main.app) as client:
+        generator = main.blog_generator
+        stream_blog_post = generator.stream_blog_post
+        calls = []
+
+        def full_once(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise QueueFullError("대기 중인 요청이 너무 많습니다")
+            return stream_blog_post(*args, **kwargs)
+
+        monkeypatch.setattr(generator, "stream_blog_post", full_once)
+        job_id = submit_job(client)
+        job = wait_for_job(client, job_id)
+        assert job["status"] == "done" and job["result"]
+        assert len(calls) == 2
+
+
+def test_job_is_requeued_when_worker_queue_is_full(fake_config, monkeypatch):
+    # 멀티 레플리카에서는 워커 대기열이 찬 것을 스트림을 읽을 때 알게 됨
+    with TestClient(main.app) as client:
+        generator = main.blog_generator
+        stream_blog_post = generator.stream_blog_post
+        calls = []
+
+        async def full_stream():
+            raise QueueFullError("대기 중인 요청이 너무 많습니다")
+            yield
+
+        def full_once(*args, **kwargs):
+            calls.append(args)
+            return full_stream() if len(calls) == 1 else stream_blog_post(*args, **kwargs)
+
+        monkeypatch.setattr(generator, "stream_blog_post", full_once)
+        job = wait_for_job(client, submit_job(client))
+        assert job["status"] == "done" and job["result"]
+        assert len(calls) == 2
+
+
+@pytest.mark.parametrize("error", [RequestTooLarge("요청의 KV 캐시가 메모리 예산보다 큽니다"),
+                                   RuntimeError("토크나이저 오류")])
+def test_failing_job_does_not_stop_the_runner(fake_config, monkeypatch, error):
+    with TestClient(main.app) as client:
+        scheduler = main.blog_generator.scheduler
+        submit = scheduler.submit
+
+        def fail_first(input_ids, params, **kwargs):
+            if "실패" in main.blog_generator.tokenizer.decode(input_ids):
+                raise error
+            return submit(input_ids, params, **kwargs)
+
+        monkeypatch.setattr(scheduler, "submit", fail_first)
+        failed_id = submit_job(client, details="실패")
+        next_id = submit_job(client, details="다음 작업")
+
+        failed = wait_for_job(client, failed_id)
+        assert failed["status"] == "failed" and failed["error"] == str(error)
+        with client.websocket_connect(f"/jobs/{failed_id}/ws") as websocket:
+            assert websocket.receive_json() == {"type": "error", "error": str(error)}
+        # 동시 실행 1개인 실행기가 실패한 작업 뒤의 작업도 처리
+        assert wait_for_job(client, next_id)["status"] == "done"
+        assert all(not worker.done() for worker in main.job_runner._workers)
+
+
+def test_interrupted_job_is_resumed_after_restart(fake_config):
+    # 서버가 작업을 실행하던 중에 꺼진 상태를 DB에 만들어 둠
+    store = JobStore(fake_config.JOB_DB_PATH)
+    job_id = store.create("카페", {}, "재시작", seed=3)["job_id"]
+    assert store.claim_next()["job_id"] == job_id
+    store.close()
+
+    with TestClient(main.app) as client:
+        job = wait_for_job(client, job_id)
+        assert job["status"] == JOB_DONE
+        assert job["result"] == main.blog_generator.generate_blog_post("카페", {}, "재시작", seed=3)
@@ -0,0 +1,35 @@
+"""멀티 레플리카: fork한 워커 2개로 요청을 처리"""
+
+import torch
+
+from fake_backend import FakeTokenizer
+from replicas import ReplicaPool
+from scheduler import BatchScheduler, SamplingParams
+
+
+def test_pool_with_two_replicas_completes_a_request(tiny_model):
+    tokenizer = FakeTokenizer()
+    input_ids = tokenizer.encode("오늘은 카페에 다녀왔어요")
+    params = SamplingParams(max_new_tokens=8, do_sample=False)
+
+    # 서버처럼 부모 프로세스가 fork 전에 여러 스레드로 연산을 한 상태 (병합/양자화와 같은 OpenMP 사용)
+    scheduler = BatchScheduler(tiny_model, tokenizer, torch.device("cpu"))
+    scheduler.start()
+    try:
+        expected = scheduler.submit(input_ids, params).future.result(timeout=60)
+    finally:
+        scheduler.stop()
+
+    pool = ReplicaPool(tiny_model, tokenizer, torch.device("cpu"), num_replicas=2, max_batch_size=2)
+    pool.start()
+    try:
+        tokens = []
+        request = pool.submit(input_ids, params, on_token=tokens.append)
+        assert request.future.result(timeout=60) == expected
+        assert tokens == expected
+        stats = pool.stats()
+        assert [worker["alive"] for worker in stats["workers"]] == [True, True]
+        assert stats["outstanding"] == 0
+    finally:
+        pool.stop()
+    assert not any(process.is_alive() for process in pool._processes)
@@ -0,0 +1,76 @@
+"""KV 메모리 예산을 혼자서도 넘는 요청(RequestTooLarge)이 들어오는 모든 경로"""
+
+import json
+import time
+
+import pytest
+import torch
+from fastapi.testclient import TestClient
+
+import main
+from fake_backend import FakeTokenizer
+from kv_cache import KVBudget
+from replicas import ReplicaPool
+from scheduler import RequestTooLarge, SamplingParams
+
+FORM = {"category": "카페", "details": "테스트"}
+
+
+@pytest.fixture
+def client(fake_config):
+    """토큰 하나에 1KB, 예산 4KB인 스케줄러 (block 4토큰이라 4토큰 넘는 요청은 모두 거절)"""
+    with TestClient(main.app) as client:
+        main.blog_generator.scheduler.kv_budget = KVBudget(4096, 1024, 1, block_tokens=4)
+        yield client
+
+
+def assert_too_large(response):
+    assert response.status_code == 413
+    body = response.json()
+    assert body["success"] is False and "메모리 예산" in body["error"]
+
+
+def test_generate(client):
+    assert_too_large(client.post("/generate", data=FORM))
+
+
+def test_generate_stream(client):
+    assert_too_large(client.post("/generate_stream", data=FORM))
+
+
+def test_text_autocomplete(client):
+    assert_too_large(client.post("/text_autocomplete", json={"prompt": "오늘은"}))
+
+
+def test_text_autocomplete_ws(client):
+    with client.websocket_connect("/text_autocomplete/ws") as websocket:
+        websocket.send_text(json.dumps({"type": "reset", "text": "오늘은", "version": 1}))
+        event = websocket.receive_json()
+        assert event["type"] == "error" and event["version"] == 1 and "메모리 예산" in event["error"]
+
+
+def test_generate_batch(client):
+    body = "\n".join(json.dumps({"category": "카페", "details": f"{i}번"}, ensure_ascii=False) for i in range(2))
+    response = client.post("/generate_batch", content=body.encode("utf-8"))
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(result["index"] for result in results) == [0, 1]
+    assert all(not result["success"] and "메모리 예산" in result["error"] for result in results)
+
+
+def test_job(client):
+    job_id = client.post("/jobs", data=FORM).json()["job_id"]
+    deadline = time.monotonic() + 5.0
+    while client.get(f"/jobs/{job_id}").json()["status"] in ("queued", "running") and time.monotonic() < deadline:
+        time.sleep(0.02)
+    job = client.get(f"/jobs/{job_id}").json()
+    assert job["status"] == "failed" and "메모리 예산" in job["error"]
+
+
+def test_replica_pool_rejects_before_dispatch(tiny_model):
+    # 워커를 띄우지 않아도 디스패처가 예산을 확인해 submit()에서 바로 거절
+    pool = ReplicaPool(tiny_model, FakeTokenizer(), torch.device("cpu"), num_replicas=2,
+                       kv_cache_bytes=64 * 1024, kv_block_tokens=16)
+    assert pool.kv_budget is not None
+    with pytest.raises(RequestTooLarge):
+        pool.submit(list(range(2, 12)), SamplingParams(max_new_tokens=100000))
+    assert pool._pending == {} and pool._outstanding == [0, 0]